@@ -0,0 +1,60 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+from flask import render_template
+import ggapp
+import tree_diff
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+# Number of the largest commits timed
+COMMITS = 3
+
+def largest_commits(repo):
+    """Returns the commits which change the most files, with the number of files changed."""
+    td = tree_diff.TreeDiffer(repo)
+    sizes = []
+    head = repo.lookup_reference('HEAD').resolve()
+    for commit in repo.walk(head.oid, pygit2.GIT_SORT_TIME):
+        if len(commit.parents) == 1:
+            changed = sum(1 for entry in td.tree_diff(commit.parents[0].tree, commit.tree) if entry.kind != tree_diff.DiffEntry.UNMODIFIED
+                for _ in td.changed_blobs(entry))
+            sizes.append((changed, commit.hex))
+    sizes.sort(reverse=True)
+    return sizes[:COMMITS]
+
+def rendered(repo, sha):
+    """Times rendering the whole commit page before sending it, as the commit view used to."""
+    start = time.time()
+    with ggapp.app.test_request_context('/sha/' + sha):
+        ggapp.g.repo = repo
+        ggapp.g.hosted = ggapp.default_repo
+        page = render_template('commit.html', **ggapp.get_commit_templatedata(repo, repo[sha]))
+    return (time.time() - start, time.time() - start, len(page))
+
+def streamed(client, sha):
+    """Times the first chunk and the whole of the streamed commit view."""
+    start = time.time()
+    response = client.get('/sha/' + sha, headers={'Accept': 'text/html'}, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first = time.time() - start
+    size += sum(len(chunk) for chunk in chunks)
+    response.close()
+    return (first, time.time() - start, size)
+
+def main():
+    ggapp.app.config['REPO_PATH'] = REPO_PATH
+    repo = pygit2.Repository(REPO_PATH)
+    client = ggapp.app.test_client()
+    for (changed, sha) in largest_commits(repo):
+        print('{0} ({1} files changed)'.format(sha[:7], changed))
+        # Each is run twice, so that both are timed with the tree diffs and highlighting cached
+        for (label, view) in (('rendered', lambda: rendered(repo, sha)), ('streamed', lambda: streamed(client, sha))):
+            view()
+            (first, total, size) = view()
+            print('{0:>10} first byte {1:>8.1f} ms, all {2:>8.1f} ms, {3:>8} bytes'.format(label, first * 1e3, total * 1e3, size))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+from BeautifulSoup import UnicodeDammit
+import ggutils
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+
+def dammit(commit):
+    return [UnicodeDammit(text, smartQuotesTo=None).unicode for text in (commit.message, commit.author.name, commit.author.email)]
+
+def fast_path(commit):
+    key = ('author', commit.author.email)
+    return [ggutils.force_unicode(text, key) for text in (commit.message, commit.author.name, commit.author.email)]
+
+def main():
+    repo = pygit2.Repository(REPO_PATH)
+    head = repo.lookup_reference('HEAD').resolve()
+    commits = list(repo.walk(head.oid, pygit2.GIT_SORT_TIME))
+    print('Decoding the message, author name and email of the {0} commits in testdata/libgit2.git'.format(len(commits)))
+    print('{0:>12} {1:>14}'.format('decoder', 'us/commit'))
+    for decode in (dammit, fast_path):
+        start = time.time()
+        for commit in commits:
+            decode(commit)
+        print('{0:>12} {1:>14.1f}'.format(decode.__name__, (time.time() - start) / len(commits) * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import random
+import time
+import diff_engines
+import tree_diff
+
+def reordered(rand):
+    """Blocks of a 20,000 line file moved around."""
+    old = ['static int value_{0} = {0};'.format(i) for i in range(20000)]
+    blocks = [old[i:i + 50] for i in range(0, len(old), 50)]
+    rand.shuffle(blocks)
+    return (old, [line for block in blocks for line in block], True)
+
+def reindented(rand):
+    """Every line of a 20,000 line file indented differently, compared without ignoring whitespace."""
+    old = ['    ' * (i % 4) + 'call(argument_{0});'.format(i % 500) for i in range(20000)]
+    return (old, ['\t' + line.strip() for line in old], False)
+
+def large_file(rand):
+    """A 50,000 line file with 500 lines changed here and there."""
+    old = ['line {0} of a generated file'.format(i) for i in range(50000)]
+    new = list(old)
+    for i in rand.sample(range(len(new)), 500):
+        new[i] = 'changed ' + new[i]
+    return (old, new, True)
+
+def lockfile(rand):
+    """A lockfile with 4,000 packages, mostly the same lines over and over, with 400 upgraded."""
+    def package(i, version):
+        return ['"package-{0}@^{1}.0.0":'.format(i, version), '  version "{0}.0.0"'.format(version),
+                '  resolved "https://registry.example.com/package-{0}-{1}.0.0.tgz"'.format(i, version),
+                '  dependencies:', '    common "^1.0.0"', '']
+    upgraded = set(rand.sample(range(4000), 400))
+    old = [line for i in range(4000) for line in package(i, 1)]
+    new = [line for i in range(4000) for line in package(i, 2 if i in upgraded else 1)]
+    return (old, new, True)
+
+def changed_lines(opcodes):
+    return sum(max(i2 - i1, j2 - j1) for (tag, i1, i2, j1, j2) in opcodes if tag != 'equal')
+
+def main():
+    rand = random.Random(17)
+    for case in (reordered, reindented, large_file, lockfile):
+        (old, new, ignore_whitespace) = case(rand)
+        print(case.__doc__)
+        for engine in sorted(diff_engines.ENGINES):
+            differ = tree_diff.TreeDiffer(None, diff_engine=engine)
+            differ.ignore_whitespace = ignore_whitespace
+            start = time.time()
+            differ._set_sm_seqs(old, new)
+            opcodes = differ.sm.get_opcodes()
+            print('{0:>10} {1:>10.1f} ms {2:>6} lines changed'.format(engine, (time.time() - start) * 1e3, changed_lines(opcodes)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import sys
+import graph
+from benchmarks.synthetic import wide_history
+
+COMMITS = 1000
+
+def deep_size(obj, seen=None):
+    """Returns the memory used by obj and everything it refers to, counting shared objects once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for (k, v) in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+def as_dicts(display_list):
+    """Copies a display list into the dict per item form the Grapher used to return."""
+    edges = []
+    for edge in display_list['edges']:
+        edges.append({'order': edge.order, 'class': edge['class'], 'd': edge.d, 'parent': edge.parent})
+    nodes = [{'x': n.x, 'y': n.y, 'id': n.id, 'parents': n.parents} for n in display_list['nodes']]
+    labels = {}
+    for key in ('labels', 'authors', 'dates'):
+        labels[key] = [{'x': l.x, 'y': l.y, 'content': l.content, 'sha': l.sha} for l in display_list[key]]
+    return dict(edges=edges, nodes=nodes, **labels)
+
+def main():
+    print('Memory held by the display list for {0} drawn commits'.format(COMMITS))
+    print('{0:>6} {1:>16} {2:>16} {3:>8}'.format('lanes', 'dicts (KiB)', 'arrays (KiB)', 'ratio'))
+    for lanes in (1, 10, 50, 200):
+        rows = wide_history(lanes, COMMITS // lanes)[:COMMITS]
+        (display_list, branches) = graph.Grapher().draw_commits(rows)
+        # Leave out the strings both forms share, such as the SHA hashes and label text
+        shared = set(id(s) for s in display_list.node_id + display_list.edge_parent)
+        for column in (display_list.labels, display_list.authors, display_list.dates):
+            shared.update(id(s) for s in column.content)
+        dicts = deep_size(as_dicts(display_list), set(shared))
+        arrays = deep_size(display_list, set(shared))
+        print('{0:>6} {1:>16.1f} {2:>16.1f} {3:>8.2f}'.format(lanes, dicts / 1024.0, arrays / 1024.0, float(dicts) / arrays))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+import ggutils
+import highlight_cache
+import tree_diff
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+# A commit which changes src/refs.c in 264 places
+COMMIT = 'd4a0b124d00c70933d7c6ac9065c401cc2d70b2e'
+FILE_NAME = 'src/refs.c'
+
+def highlight_per_group(differ, old, new, name):
+    """Marks up the diff as it was before, highlighting both files for every group of changes."""
+    differ._set_sm_seqs(old, new)
+    for (index, group) in enumerate(differ.sm.get_grouped_opcodes(differ.context)):
+        if index:
+            yield (tree_diff.DiffEntry.UNMODIFIED, None, None, '<hr />')
+        (old_split, new_split) = differ._highlight(old, new, name)
+        for change in differ._markup_opcodes(old_split, new_split, group):
+            yield change
+
+def file_blob(repo, tree, path):
+    for name in path.split('/'):
+        tree = repo[tree[name].hex]
+    return tree
+
+def file_lines(repo, tree, path):
+    return ggutils.force_unicode(file_blob(repo, tree, path).data).splitlines()
+
+def main():
+    repo = pygit2.Repository(REPO_PATH)
+    commit = repo[COMMIT]
+    old = file_lines(repo, commit.parents[0].tree, FILE_NAME)
+    new = file_lines(repo, commit.tree, FILE_NAME)
+    differ = tree_diff.TreeDiffer(repo)
+    differ._set_sm_seqs(old, new)
+    groups = len(list(differ.sm.get_grouped_opcodes(differ.context)))
+    print('Marking up the diff of {0} ({1} lines, {2} groups of changes) in {3}'.format(FILE_NAME, len(new), groups, COMMIT[:7]))
+    results = []
+    for (label, diff) in (('highlight per group', highlight_per_group), ('highlight once', tree_diff.TreeDiffer._context_diff)):
+        start = time.time()
+        results.append(list(diff(differ, old, new, FILE_NAME)))
+        print('{0:>20} {1:>10.1f} ms {2:>6} lines'.format(label, (time.time() - start) * 1e3, len(results[-1])))
+    # With a highlight cache, the files are only highlighted the first time they're diffed
+    cache = highlight_cache.HighlightCache(32 * 1024 * 1024)
+    cached = tree_diff.TreeDiffer(repo, highlight_cache=cache)
+    shas = (file_blob(repo, commit.parents[0].tree, FILE_NAME).hex, file_blob(repo, commit.tree, FILE_NAME).hex)
+    list(cached._context_diff(old, new, FILE_NAME, *shas))
+    start = time.time()
+    results.append(list(cached._context_diff(old, new, FILE_NAME, *shas)))
+    print('{0:>20} {1:>10.1f} ms {2:>6} lines'.format('highlight cached', (time.time() - start) * 1e3, len(results[-1])))
+    print('Same markup: {0}'.format(results[0] == results[1] == results[2]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+import ggapp
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+# Number of commits back from HEAD timed
+COMMITS = 20
+
+def timed(client, url, headers):
+    start = time.time()
+    response = client.get(url, headers=headers)
+    return (time.time() - start, response)
+
+def main():
+    ggapp.app.config['REPO_PATH'] = REPO_PATH
+    repo = pygit2.Repository(REPO_PATH)
+    client = ggapp.app.test_client()
+    head = repo.lookup_reference('HEAD').resolve()
+    urls = ['/sha/' + commit.hex for (_, commit) in zip(range(COMMITS), repo.walk(head.oid, pygit2.GIT_SORT_TIME))]
+    print('The commit views of the last {0} commits'.format(COMMITS))
+    for encoding in ('identity', 'gzip'):
+        headers = {'Accept': 'text/html', 'Accept-Encoding': encoding}
+        (sent, revalidated, size) = (0, 0, 0)
+        for url in urls:
+            (seconds, response) = timed(client, url, headers)
+            sent += seconds
+            size += len(response.data)
+            (seconds, response) = timed(client, url, dict(headers, **{'If-None-Match': response.headers['ETag']}))
+            assert response.status_code == 304
+            revalidated += seconds
+        print('{0:>10} sent {1:>8.1f} ms {2:>9} bytes, revalidated {3:>6.1f} ms'.format(encoding, sent * 1e3, size, revalidated * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import time
+import graph
+from benchmarks.synthetic import wide_history
+
+TOTAL_COMMITS = 20000
+PAGE_SIZE = 100
+
+def main():
+    print('Lane allocation in Grapher, synthetic histories of {0} commits'.format(TOTAL_COMMITS))
+    print('{0:>6} {1:>22} {2:>22}'.format('lanes', 'follow (us/commit)', 'draw page (us/commit)'))
+    for lanes in (10, 50, 100, 250, 500):
+        rows = wide_history(lanes, TOTAL_COMMITS // lanes)
+        start = time.time()
+        graph.Grapher().follow_commits(rows)
+        follow = (time.time() - start) / len(rows)
+        # Draw a page from the middle of the history, where all the lanes are open
+        middle = len(rows) // 2
+        branches = graph.Grapher().follow_commits(rows[:middle])
+        start = time.time()
+        graph.Grapher().draw_commits(rows[middle:middle+PAGE_SIZE], branches, middle)
+        draw = (time.time() - start) / PAGE_SIZE
+        print('{0:>6} {1:>22.1f} {2:>22.1f}'.format(lanes, follow * 1e6, draw * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+from pygments.lexers import guess_lexer_for_filename
+from pygments.util import ClassNotFound
+import ggutils
+import lexer_resolver
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+COMMIT = 'd4a0b124d00c70933d7c6ac9065c401cc2d70b2e'
+
+def files(repo, tree, parent_name=None):
+    for entry in tree:
+        name = '/'.join((parent_name, entry.name)) if parent_name else entry.name
+        obj = repo[entry.hex]
+        if obj.type == pygit2.GIT_OBJ_TREE:
+            for found in files(repo, obj, name):
+                yield found
+        elif obj.type == pygit2.GIT_OBJ_BLOB and b'\0' not in obj.data:
+            yield (name, ggutils.force_unicode(obj.data))
+
+def lexer_names(find, texts):
+    names = []
+    for (name, text) in texts:
+        try:
+            names.append(find(name, text).name)
+        except ClassNotFound:
+            names.append(None)
+    return names
+
+def main():
+    repo = pygit2.Repository(REPO_PATH)
+    texts = list(files(repo, repo[COMMIT].tree))
+    print('Finding the lexers of the {0} text files in {1}'.format(len(texts), COMMIT[:7]))
+    resolver = lexer_resolver.LexerResolver()
+    results = []
+    for (label, find) in (('guess_lexer_for_filename', guess_lexer_for_filename),
+                          ('resolver, first time', resolver.lexer_class),
+                          ('resolver, name cached', resolver.lexer_class)):
+        start = time.time()
+        results.append(lexer_names(find, texts))
+        print('{0:>25} {1:>10.1f} ms'.format(label, (time.time() - start) * 1e3))
+    print('Same lexers: {0}'.format(results[0] == results[1] == results[2]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import json
+import os
+import re
+import time
+import ggapp
+import prefetch
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+PAGES = 10
+# Seconds spent looking at each page before scrolling to the next
+THINK_TIME = 0.2
+
+def scroll(client, url):
+    """Loads PAGES pages of the graph one after another as the page does, returning the times taken
+    to load each page after the first."""
+    xhr = {'X-Requested-With': 'XMLHttpRequest'}
+    params = {}
+    times = []
+    for page in range(PAGES):
+        start = time.time()
+        data = client.get(url, query_string=params, headers=xhr).data
+        if page:
+            times.append(time.time() - start)
+        params = {'offset': (page + 1) * 100, 'cursor': json.loads(re.search(r'gitgraph.cursor = (.*);', data).group(1)) or '',
+                  'branches': json.loads(re.search(r'gitgraph.existing_branches = (.*);', data).group(1))}
+        time.sleep(THINK_TIME)
+    return times
+
+def main():
+    ggapp.app.config['REPO_PATH'] = REPO_PATH
+    client = ggapp.app.test_client()
+    repo = ggapp.repos.acquire(REPO_PATH)
+    head = repo[repo.lookup_reference('HEAD').resolve().oid].hex
+    ggapp.repos.release(REPO_PATH, repo)
+    print('{0} pages of the graph from {1}, {2}s apart'.format(PAGES, head[:10], THINK_TIME))
+    old_prefetcher = ggapp.prefetcher
+    try:
+        for (label, workers) in (('drawn on request', 0), ('prefetched', 2)):
+            ggapp.prefetcher = prefetch.Prefetcher(workers)
+            times = scroll(client, '/graph/' + head)
+            print('{0:>18} {1:>8.3f} ms per page {2:>8.3f} ms slowest'.format(label, sum(times) * 1e3 / len(times), max(times) * 1e3))
+    finally:
+        ggapp.prefetcher = old_prefetcher
+
+if __name__ == '__main__':
+    main()
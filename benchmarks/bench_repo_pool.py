@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+import ggapp
+import repo_pool
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+REQUESTS = 500
+
+def lookups(repo, shas):
+    for sha in shas:
+        commit = repo[sha]
+        commit.tree
+        len(commit.tree)
+
+def main():
+    repo = pygit2.Repository(REPO_PATH)
+    head = repo.lookup_reference('HEAD').resolve()
+    shas = [commit.hex for (_, commit) in zip(range(10), repo.walk(head.oid, pygit2.GIT_SORT_TIME))]
+    print('{0} requests each looking up 10 commits and their trees'.format(REQUESTS))
+    pool = repo_pool.RepositoryPool()
+    for (label, open_repo, close_repo) in (
+            ('opened each time', lambda: pygit2.Repository(REPO_PATH), lambda repo: None),
+            ('pooled', lambda: pool.acquire(REPO_PATH), lambda repo: pool.release(REPO_PATH, repo))):
+        start = time.time()
+        for _ in range(REQUESTS):
+            repo = open_repo()
+            lookups(repo, shas)
+            close_repo(repo)
+        print('{0:>22} {1:>8.3f} ms per request'.format(label, (time.time() - start) * 1e3 / REQUESTS))
+    # Through the app, with a request which isn't cached
+    ggapp.app.config['REPO_PATH'] = REPO_PATH
+    client = ggapp.app.test_client()
+    old_repos = ggapp.repos
+    try:
+        for (label, max_idle) in (('/autocomplete, opened', 0), ('/autocomplete, pooled', 8)):
+            ggapp.repos = repo_pool.RepositoryPool(max_idle)
+            start = time.time()
+            for _ in range(REQUESTS):
+                client.get('/autocomplete', query_string={'q': shas[0][:10]})
+            print('{0:>22} {1:>8.3f} ms per request'.format(label, (time.time() - start) * 1e3 / REQUESTS))
+    finally:
+        ggapp.repos = old_repos
+
+if __name__ == '__main__':
+    main()
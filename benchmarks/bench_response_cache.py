@@ -0,0 +1,43 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+import time
+import pygit2
+import ggapp
+import response_cache
+from benchmarks import bench_commit_ttfb
+
+REPO_PATH = bench_commit_ttfb.REPO_PATH
+
+def timed(client, url):
+    start = time.time()
+    response = client.get(url, headers={'Accept': 'text/html', 'Accept-Encoding': 'gzip'})
+    return (time.time() - start, len(response.data))
+
+def main():
+    ggapp.app.config['REPO_PATH'] = REPO_PATH
+    repo = pygit2.Repository(REPO_PATH)
+    client = ggapp.app.test_client()
+    path = tempfile.mkdtemp()
+    old_responses = ggapp.default_repo.responses
+    try:
+        memory = response_cache.MemoryTier(256 * 1024 * 1024)
+        files = response_cache.FileTier(path, 1024 * 1024 * 1024)
+        ggapp.default_repo.responses = response_cache.ResponseCache([memory, files], 64 * 1024 * 1024)
+        for (changed, sha) in bench_commit_ttfb.largest_commits(repo):
+            print('{0} ({1} files changed)'.format(sha[:7], changed))
+            url = '/sha/' + sha
+            # Each worker process has its own memory tier, but they share the files
+            for (label, prepare) in (('made', ggapp.default_repo.highlights.clear), ('from memory', lambda: None),
+                                     ('from files', lambda: memory._items.clear())):
+                prepare()
+                (seconds, size) = timed(client, url)
+                print('{0:>12} {1:>10.1f} ms {2:>8} bytes'.format(label, seconds * 1e3, size))
+    finally:
+        ggapp.default_repo.responses = old_responses
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import time
+import pygit2
+import tree_diff
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata', 'libgit2.git')
+
+def count_entries(differ, entries):
+    """Expands every modified subtree, as rendering a commit does, and returns the number of entries."""
+    total = 0
+    for entry in entries:
+        total += 1 + count_entries(differ, differ.children(entry))
+    return total
+
+def main():
+    repo = pygit2.Repository(REPO_PATH)
+    head = repo.lookup_reference('HEAD').resolve()
+    merges = [commit for commit in repo.walk(head.oid, pygit2.GIT_SORT_TIME) if len(commit.parents) > 1]
+    backends = [('python', lambda: tree_diff.TreeDiffer(repo))]
+    if tree_diff.NATIVE_DIFF:
+        backends.append(('native', lambda: tree_diff.NativeTreeDiffer(repo)))
+        backends.append(('native+renames', lambda: tree_diff.NativeTreeDiffer(repo, rename_threshold=50)))
+    else:
+        print('This version of pygit2 can\'t diff trees in libgit2, so only the Python diff is run')
+    print('Diffing the {0} merge commits in testdata/libgit2.git against their first parents'.format(len(merges)))
+    print('{0:>16} {1:>14} {2:>10}'.format('backend', 'ms/commit', 'entries'))
+    for (name, make_differ) in backends:
+        tree_diff._tree_cache.clear()
+        tree_diff._delta_cache.clear()
+        entries = 0
+        start = time.time()
+        for commit in merges:
+            differ = make_differ()
+            entries += count_entries(differ, differ.tree_diff(commit.parents[0].tree, commit.tree))
+        print('{0:>16} {1:>14.2f} {2:>10}'.format(name, (time.time() - start) / len(merges) * 1e3, entries))
+
+if __name__ == '__main__':
+    main()
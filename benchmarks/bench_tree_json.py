@@ -0,0 +1,57 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import shutil
+import subprocess
+import tempfile
+import time
+from flask import json
+import pygit2
+import ggapp
+import tree_diff
+
+FILES = 5000
+
+def changed_tree_repo(path):
+    """Creates a bare repository at path with a commit of FILES files in ten directories, then a
+    commit changing every file, and returns the SHA of the second commit."""
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    stream = []
+    for (commit, message) in enumerate(('add files', 'change every file')):
+        stream.append('commit refs/heads/master\ncommitter Test <test@example.com> {0} +0000\ndata {1}\n{2}\n'.format(
+            1300000000 + commit, len(message), message).encode('ascii'))
+        for i in range(FILES):
+            content = 'file {0}, version {1}\n'.format(i, commit).encode('ascii')
+            stream.append('M 100644 inline dir{0}/file{1:05}.txt\ndata {2}\n'.format(i % 10, i, len(content)).encode('ascii') + content + b'\n')
+        # Files directly in the root, so that the first level of the diff is large too
+        for i in range(FILES):
+            content = 'root file {0}, version {1}\n'.format(i, commit).encode('ascii')
+            stream.append('M 100644 inline file{0:05}.txt\ndata {1}\n'.format(i, len(content)).encode('ascii') + content + b'\n')
+    fast_import = subprocess.Popen(['git', '--git-dir', path, 'fast-import', '--quiet'], stdin=subprocess.PIPE)
+    fast_import.communicate(b''.join(stream))
+    rev_parse = subprocess.Popen(['git', '--git-dir', path, 'rev-parse', 'master'], stdout=subprocess.PIPE)
+    return rev_parse.communicate()[0].strip().decode('ascii')
+
+def main():
+    path = tempfile.mkdtemp()
+    try:
+        sha = changed_tree_repo(path)
+        repo = pygit2.Repository(path)
+        commit = repo[sha]
+        entries = tree_diff.TreeDiffer(repo, level_cache=ggapp.default_repo.level_cache).tree_diff(commit.parents[0].tree, commit.tree)
+        print('Writing the JSON for the diff of a commit changing {0} files ({1} entries in its root)'.format(FILES * 2, len(entries)))
+        for (label, write) in (('DiffEntryEncoder', lambda: json.dumps(entries, cls=tree_diff.DiffEntryEncoder)),
+                               ('tree_json', lambda: tree_diff.tree_json(entries))):
+            start = time.time()
+            size = len(write())
+            print('{0:>34} {1:>10.1f} ms {2:>8} bytes'.format(label, (time.time() - start) * 1e3, size))
+        ggapp.app.config['REPO_PATH'] = path
+        client = ggapp.app.test_client()
+        # The tree diff is already cached, so this is the rest of the view
+        start = time.time()
+        response = client.get('/sha/' + sha, headers={'Accept': 'application/json'})
+        print('{0:>34} {1:>10.1f} ms {2:>8} bytes'.format('/sha/<commit> as JSON', (time.time() - start) * 1e3, len(response.data)))
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main()
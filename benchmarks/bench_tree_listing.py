@@ -0,0 +1,49 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import shutil
+import subprocess
+import tempfile
+import time
+import pygit2
+import tree_diff
+
+FILES = 5000
+FILE_SIZE = 4096
+
+def large_tree_repo(path):
+    """Creates a bare repository at path with one commit of FILES files, and returns the SHA of its tree."""
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    stream = []
+    for i in range(FILES):
+        content = ('line {0}\n'.format(i) * (FILE_SIZE // 8))[:FILE_SIZE].encode('ascii')
+        stream.append('blob\nmark :{0}\ndata {1}\n'.format(i + 1, len(content)).encode('ascii') + content + b'\n')
+    stream.append(b'commit refs/heads/master\ncommitter Test <test@example.com> 1300000000 +0000\ndata 10\nlarge tree\n')
+    for i in range(FILES):
+        stream.append('M 100644 :{0} file{0:05}.txt\n'.format(i + 1).encode('ascii'))
+    fast_import = subprocess.Popen(['git', '--git-dir', path, 'fast-import', '--quiet'], stdin=subprocess.PIPE)
+    fast_import.communicate(b''.join(stream))
+    rev_parse = subprocess.Popen(['git', '--git-dir', path, 'rev-parse', 'master^{tree}'], stdout=subprocess.PIPE)
+    return rev_parse.communicate()[0].strip().decode('ascii')
+
+def main():
+    path = tempfile.mkdtemp()
+    try:
+        sha = large_tree_repo(path)
+        repo = pygit2.Repository(path)
+        tree = repo[sha]
+        print('Listing a tree of {0} files of {1} bytes, as /sha/<tree> does'.format(FILES, FILE_SIZE))
+        start = time.time()
+        for entry in tree:
+            entry.to_object().type
+        loading = time.time() - start
+        print('{0:>34} {1:>10.1f} ms'.format('loading each object for its type', loading * 1e3))
+        start = time.time()
+        entries = tree_diff.TreeDiffer(repo).tree_diff(tree, tree)
+        listing = time.time() - start
+        print('{0:>34} {1:>10.1f} ms'.format('tree_diff with types from modes', listing * 1e3))
+        print('{0:>34} {1:>10}'.format('entries', len(entries)))
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import hashlib
+
+class Signature(object):
+    def __init__(self, name):
+        self.name = name
+        self.email = '{0}@example.com'.format(name)
+
+class Commit(object):
+    """A stand-in for a pygit2 commit, with just the attributes the Grapher uses."""
+    def __init__(self, name, commit_time):
+        self.hex = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        self.parents = []
+        self.message = 'Commit {0}\n\nDescription of {0}'.format(name)
+        self.author = Signature('Author {0}'.format(commit_time % 7))
+        self.commit_time = commit_time
+
+def wide_history(lanes, depth):
+    """Returns the commits of a history in walk order, where an octopus merge at the top joins
+    lanes parallel branches of depth commits each, which all fork from a single base commit."""
+    commit_time = 1300000000 + lanes * depth + 2
+    merge = Commit('merge', commit_time)
+    base = Commit('base', 1300000000)
+    rows = [merge]
+    previous = [merge] * lanes
+    for level in range(depth):
+        for lane in range(lanes):
+            commit_time -= 1
+            commit = Commit('{0}-{1}'.format(lane, level), commit_time)
+            if level == 0:
+                merge.parents.append(commit)
+            else:
+                previous[lane].parents.append(commit)
+            previous[lane] = commit
+            rows.append(commit)
+    for commit in previous:
+        commit.parents.append(base)
+    rows.append(base)
+    return rows
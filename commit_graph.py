@@ -0,0 +1,318 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import binascii
+import fcntl
+import heapq
+import json
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+import pygit2
+import ggutils
+
+# Size of a raw SHA-1 object id
+OID_SIZE = 20
+# Parent row stored when a commit has fewer than two parents
+NO_PARENT = -1
+# Generation number, commit time, first and second parent rows, then the start and count
+# of any further parents in the extra file
+RECORD = struct.Struct(str('<IqiiII'))
+EXTRA = struct.Struct(str('<i'))
+# An object id followed by the row it's on
+LOOKUP = struct.Struct(str('>20sI'))
+# The files holding each build of the graph, in the order they're mapped
+DATA_FILES = ('oids', 'records', 'extra', 'lookup')
+
+class CommitGraph(object):
+    """A compact on-disk copy of the repository's commit graph, so that ancestry questions can be
+    answered without loading commits from the object database.
+
+    Each commit is given a row, and a commit's parents are always on earlier rows than it. The
+    generation number of a commit is one more than the greatest generation of its parents, so a
+    commit can only be an ancestor of commits with a greater generation. The files are:
+
+    oids: the raw object id of the commit on each row
+    records: a fixed-size RECORD for each row
+    extra: the rows of the third and later parents of octopus merges
+    lookup: (object id, row) pairs sorted by object id
+    graph.json: the number of rows, the tips the graph was built from, and an id which changes
+    whenever the graph is built again from scratch
+
+    Rows are only ever appended, so the files are memory-mapped and read in place rather than
+    holding a Python object per commit. Each build's files are named after it, e.g. oids-<build>,
+    so that a graph built again doesn't change the files other processes have mapped."""
+    def __init__(self, repo, path):
+        self.repo = repo
+        self.path = path
+        self._header = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name, build):
+        return self._file('{0}-{1}'.format(name, build))
+
+    def _map(self, name, build):
+        if build is None:
+            return b''
+        try:
+            f = open(self._data_file(name, build), 'rb')
+        except IOError:
+            return b''
+        with f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self):
+        if self._header is not None:
+            return
+        for _ in range(2):
+            try:
+                with open(self._file('graph.json')) as f:
+                    header = json.load(f)
+            except IOError:
+                header = {'rows': 0, 'extra': 0, 'tips': []}
+            maps = [self._map(name, header.get('build')) for name in DATA_FILES]
+            (oids, records, _, lookup) = maps
+            if not header['rows'] or (oids and records and lookup):
+                break
+            # The graph was built again after graph.json was read, and that build's files are gone
+            for data in maps:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+        else:
+            # Its files are still missing, so the graph is built again when it's next updated
+            header = {'rows': 0, 'extra': 0, 'tips': []}
+            maps = [b''] * len(DATA_FILES)
+        self._header = header
+        (self._oids, self._records, self._extra, self._lookup) = maps
+
+    def close(self):
+        """Unmaps the files. They're mapped again when the graph is next used."""
+        if self._header is None:
+            return
+        for data in (self._oids, self._records, self._extra, self._lookup):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self._header = None
+
+    def _write_atomic(self, final_path, write):
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.rename(tmp_path, final_path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def row(self, sha):
+        """Returns the row of a commit, or None if it isn't in the graph."""
+        self._load()
+        try:
+            oid = binascii.unhexlify(sha)
+        except (TypeError, ValueError):
+            return None
+        found = ggutils.find_record(self._lookup, oid, LOOKUP)
+        # Rows past the header's count were left by an interrupted update
+        if found is None or found[1] >= self._header['rows']:
+            return None
+        return found[1]
+
+    def _row(self, sha):
+        row = self.row(sha)
+        if row is None:
+            raise KeyError(sha)
+        return row
+
+    def _record(self, row):
+        return RECORD.unpack_from(self._records, row * RECORD.size)
+
+    def _generation(self, row):
+        return self._record(row)[0]
+
+    def _parents(self, row):
+        (_, _, first, second, start, count) = self._record(row)
+        parents = [parent for parent in (first, second) if parent != NO_PARENT]
+        for index in range(start, start + count):
+            parents.append(EXTRA.unpack_from(self._extra, index * EXTRA.size)[0])
+        return parents
+
+    def sha(self, row):
+        """Returns the SHA of the commit on a row."""
+        return binascii.hexlify(self._oids[row * OID_SIZE:(row + 1) * OID_SIZE]).decode('ascii')
+
+    def __contains__(self, sha):
+        return self.row(sha) is not None
+
+    def __len__(self):
+        self._load()
+        return self._header['rows']
+
+    @property
+    def build(self):
+        """The id of this build of the graph. Rows are renumbered when it changes."""
+        self._load()
+        return self._header.get('build')
+
+    def generation(self, sha):
+        """Returns the generation number of a commit: 1 for a root commit, otherwise one more
+        than the greatest generation of its parents."""
+        return self._generation(self._row(sha))
+
+    def topo_position(self, sha):
+        """Returns the position of a commit in a topological order of the whole graph, where every
+        commit comes after all its ancestors."""
+        return self._row(sha)
+
+    def is_ancestor(self, ancestor, descendant):
+        """Returns whether the commit ancestor is reachable from the commit descendant. A commit is
+        considered to be an ancestor of itself."""
+        target = self._row(ancestor)
+        start = self._row(descendant)
+        generation = self._generation(target)
+        seen = set([start])
+        stack = [start]
+        while stack:
+            row = stack.pop()
+            if row == target:
+                return True
+            for parent in self._parents(row):
+                # Ancestors of the target are on earlier rows and have lower generations, so those
+                # parents can't lead to it.
+                if parent not in seen and parent >= target and self._generation(parent) >= generation:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def merge_base(self, one, two):
+        """Returns the SHA of a best common ancestor of the two commits, one which isn't an
+        ancestor of any other common ancestor, or None if they have no common history."""
+        start = (self._row(one), self._row(two))
+        flags = {start[0]: 1}
+        flags[start[1]] = flags.get(start[1], 0) | 2
+        # Visit commits from the highest generation down, so that every child of a commit has
+        # passed on its flags before the commit is visited.
+        queue = [(-self._generation(row), row) for row in flags]
+        heapq.heapify(queue)
+        while queue:
+            (_, row) = heapq.heappop(queue)
+            if flags[row] == 3:
+                return self.sha(row)
+            for parent in self._parents(row):
+                if parent in flags:
+                    flags[parent] |= flags[row]
+                else:
+                    flags[parent] = flags[row]
+                    heapq.heappush(queue, (-self._generation(parent), parent))
+        return None
+
+    def update(self, tips):
+        """Adds the commits reachable from the given commit SHAs which aren't in the graph yet."""
+        if all(tip in self for tip in tips):
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self._file('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have updated the graph while we waited
+            self.close()
+            new_tips = []
+            for tip in tips:
+                if tip not in self and tip not in new_tips:
+                    new_tips.append(tip)
+            if new_tips:
+                self._append(new_tips)
+
+    def _exists(self, sha):
+        try:
+            self.repo[sha]
+        except KeyError:
+            return False
+        return True
+
+    def _append(self, new_tips):
+        header = self._header
+        old_build = header.get('build')
+        if not all(self._exists(tip) for tip in header['tips']):
+            # History was rewritten and the old tips have since been pruned, so the graph is built
+            # again from the tips which are still there
+            new_tips = [tip for tip in header['tips'] if self._exists(tip) and tip not in new_tips] + new_tips
+            header = {'rows': 0, 'extra': 0, 'tips': []}
+        if not header['rows']:
+            # A new build is written to files of its own, which nobody has mapped yet
+            header = dict(header, build=uuid.uuid4().hex)
+        build = header['build']
+        first_row = header['rows']
+        walker = self.repo.walk(self.repo[new_tips[0]].oid, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE)
+        for tip in new_tips[1:]:
+            walker.push(self.repo[tip].oid)
+        # Everything reachable from the old tips is already in the graph
+        for tip in header['tips']:
+            walker.hide(self.repo[tip].oid)
+        new_rows = {}
+        generations = []
+        oids = []
+        records = []
+        extra = []
+        for commit in walker:
+            parents = []
+            generation = 1
+            for parent in commit.parents:
+                row = new_rows.get(parent.hex)
+                if row is None:
+                    row = self._row(parent.hex)
+                    parent_generation = self._generation(row)
+                else:
+                    parent_generation = generations[row - first_row]
+                parents.append(row)
+                generation = max(generation, parent_generation + 1)
+            first = parents[0] if parents else NO_PARENT
+            second = parents[1] if len(parents) > 1 else NO_PARENT
+            records.append(RECORD.pack(generation, commit.commit_time, first, second,
+                header['extra'] + len(extra), max(len(parents) - 2, 0)))
+            extra.extend(EXTRA.pack(parent) for parent in parents[2:])
+            oids.append(binascii.unhexlify(commit.hex))
+            new_rows[commit.hex] = first_row + len(generations)
+            generations.append(generation)
+        self.close()
+        # Anything after the rows counted in the header is left over from an interrupted update
+        for (name, length, data) in (('oids', first_row * OID_SIZE, oids),
+                                     ('records', first_row * RECORD.size, records),
+                                     ('extra', header['extra'] * EXTRA.size, extra)):
+            with os.fdopen(os.open(self._data_file(name, build), os.O_RDWR | os.O_CREAT), 'r+b') as f:
+                f.truncate(length)
+                f.seek(length)
+                f.write(b''.join(data))
+        def write_lookup(f):
+            old = (LOOKUP.unpack_from(old_lookup, i * LOOKUP.size) for i in range(len(old_lookup) // LOOKUP.size))
+            old = (entry for entry in old if entry[1] < first_row)
+            new = sorted((binascii.unhexlify(sha), row) for (sha, row) in new_rows.items())
+            for entry in heapq.merge(old, new):
+                f.write(LOOKUP.pack(*entry))
+        old_lookup = self._map('lookup', build)
+        try:
+            self._write_atomic(self._data_file('lookup', build), write_lookup)
+        finally:
+            if isinstance(old_lookup, mmap.mmap):
+                old_lookup.close()
+        # The header is written last, as it's what makes the new rows visible
+        header = {'rows': first_row + len(generations), 'extra': header['extra'] + len(extra), 'tips': header['tips'] + new_tips,
+                  'build': build}
+        self._write_atomic(self._file('graph.json'), lambda f: f.write(json.dumps(header).encode('utf-8')))
+        if build != old_build:
+            # Processes which mapped the old build's files keep them until they unmap them
+            for name in os.listdir(self.path):
+                (base, _, file_build) = name.partition('-')
+                if base in DATA_FILES and file_build != build:
+                    os.remove(self._file(name))
+        # Old tips which are now behind a new one don't need hiding any more
+        self.close()
+        tips = [tip for tip in header['tips'] if not any(tip != new and self.is_ancestor(tip, new) for new in new_tips)]
+        if tips != header['tips']:
+            header['tips'] = tips
+            self._write_atomic(self._file('graph.json'), lambda f: f.write(json.dumps(header).encode('utf-8')))
+        self.close()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import bisect
+import difflib
+
+# Largest gap without unique lines (lines in one file times lines in the other) which is still
+# diffed with difflib. Larger ones are shown as replaced.
+FALLBACK_SIZE = 100000
+
+class PatienceSequenceMatcher(difflib.SequenceMatcher):
+    """A SequenceMatcher which finds its matching blocks with the patience diff algorithm. Its
+    opcodes and groups of opcodes are made from those blocks just as difflib's are, but finding
+    them doesn't take quadratic time on large or repetitive files.
+
+    Lines which occur exactly once in both files are matched up in the longest run of them which
+    is in the same order in each, and the gaps between those lines are diffed the same way. Lines
+    equal at the start and end of each gap are matched too. A gap with no unique lines left is
+    diffed with difflib if it's small, and otherwise left as replaced. Junk lines are never used
+    to line the files up, but are matched at the start and end of gaps."""
+    def set_seq2(self, b):
+        # difflib's index of the lines of b isn't used, so it isn't built
+        if b is self.b:
+            return
+        self.b = b
+        self.matching_blocks = self.opcodes = None
+        self.fullbcount = None
+
+    def get_matching_blocks(self):
+        if self.matching_blocks is not None:
+            return self.matching_blocks
+        matches = []
+        stack = [(False, 0, len(self.a), 0, len(self.b))]
+        # Ranges are pushed after the matches and ranges which follow them, so that the matches
+        # come off the stack in order
+        while stack:
+            item = stack.pop()
+            if item[0]:
+                matches.append(item[1:])
+            else:
+                stack.extend(reversed(self._match_range(*item[1:])))
+        # Join matches which follow on from each other, as difflib does
+        blocks = []
+        (i1, j1, k1) = (0, 0, 0)
+        for (i2, j2, k2) in matches:
+            if i1 + k1 == i2 and j1 + k1 == j2:
+                k1 += k2
+            else:
+                if k1:
+                    blocks.append((i1, j1, k1))
+                (i1, j1, k1) = (i2, j2, k2)
+        if k1:
+            blocks.append((i1, j1, k1))
+        blocks.append((len(self.a), len(self.b), 0))
+        self.matching_blocks = [difflib.Match._make(block) for block in blocks]
+        return self.matching_blocks
+
+    def _match_range(self, alo, ahi, blo, bhi):
+        """Returns the matches and the ranges left to diff between a[alo:ahi] and b[blo:bhi], in order."""
+        a = self.a
+        b = self.b
+        prefix = 0
+        while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+            prefix += 1
+        suffix = 0
+        while alo + prefix < ahi - suffix and blo + prefix < bhi - suffix and a[ahi - suffix - 1] == b[bhi - suffix - 1]:
+            suffix += 1
+        items = []
+        if prefix:
+            items.append((True, alo, blo, prefix))
+        (alo, ahi, blo, bhi) = (alo + prefix, ahi - suffix, blo + prefix, bhi - suffix)
+        if alo < ahi and blo < bhi:
+            anchors = self._anchors(alo, ahi, blo, bhi)
+            if anchors:
+                (i, j) = (alo, blo)
+                for (anchor_i, anchor_j) in anchors:
+                    if i < anchor_i or j < anchor_j:
+                        items.append((False, i, anchor_i, j, anchor_j))
+                    items.append((True, anchor_i, anchor_j, 1))
+                    (i, j) = (anchor_i + 1, anchor_j + 1)
+                if i < ahi or j < bhi:
+                    items.append((False, i, ahi, j, bhi))
+            elif (ahi - alo) * (bhi - blo) <= FALLBACK_SIZE:
+                matcher = difflib.SequenceMatcher(self.isjunk, a[alo:ahi], b[blo:bhi], False)
+                items.extend((True, alo + i, blo + j, k) for (i, j, k) in matcher.get_matching_blocks() if k)
+        if suffix:
+            items.append((True, ahi, bhi, suffix))
+        return items
+
+    def _anchors(self, alo, ahi, blo, bhi):
+        """Returns the (i, j) positions of the longest run of lines which are unique in both
+        a[alo:ahi] and b[blo:bhi] and in the same order in each."""
+        isjunk = self.isjunk
+        counts = {}
+        for i in range(alo, ahi):
+            line = self.a[i]
+            if line in counts:
+                counts[line] = None
+            elif not (isjunk and isjunk(line)):
+                counts[line] = i
+        unique = {}
+        for j in range(blo, bhi):
+            line = self.b[j]
+            if counts.get(line) is not None:
+                if line in unique:
+                    unique[line] = None
+                else:
+                    unique[line] = j
+        pairs = sorted((counts[line], j) for (line, j) in unique.items() if j is not None)
+        if not pairs:
+            return []
+        # Patience sort on the positions in b to find the longest increasing run
+        tails = []
+        tail_indexes = []
+        previous = [None] * len(pairs)
+        for (index, (_, j)) in enumerate(pairs):
+            pile = bisect.bisect_left(tails, j)
+            if pile:
+                previous[index] = tail_indexes[pile - 1]
+            if pile == len(tails):
+                tails.append(j)
+                tail_indexes.append(index)
+            else:
+                tails[pile] = j
+                tail_indexes[pile] = index
+        anchors = []
+        index = tail_indexes[-1]
+        while index is not None:
+            anchors.append(pairs[index])
+            index = previous[index]
+        anchors.reverse()
+        return anchors
+
+# The diff engines TreeDiffer can use, by the name given in DIFF_ENGINE
+ENGINES = {
+    'difflib': difflib.SequenceMatcher,
+    'patience': PatienceSequenceMatcher,
+}
+
+def matcher(name, isjunk=None):
+    """Returns a new sequence matcher for the named diff engine."""
+    try:
+        engine = ENGINES[name]
+    except KeyError:
+        raise ValueError('Unknown diff engine {0!r}'.format(name))
+    return engine(isjunk)
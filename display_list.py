@@ -0,0 +1,167 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from array import array
+from collections import namedtuple
+
+# Marks a missing column or row in the integer arrays
+NONE = -1
+
+Node = namedtuple('Node', 'x y id parents')
+Label = namedtuple('Label', 'x y content sha')
+
+class Edge(object):
+    """A view of one edge in a DisplayList, with the attributes the templates use."""
+    __slots__ = ('display_list', 'index')
+
+    def __init__(self, display_list, index):
+        self.display_list = display_list
+        self.index = index
+
+    @property
+    def parent(self):
+        return self.display_list.edge_parent[self.index]
+
+    @property
+    def order(self):
+        return self.display_list.edge_y[self.index]
+
+    @property
+    def d(self):
+        """The SVG path segments of the edge."""
+        dl = self.display_list
+        i = self.index
+        d = [{'type': 'M', 'x': dl.edge_x[i], 'y': dl.edge_y[i]}]
+        if dl.edge_bend[i] is not None:
+            d.append({'type': 'l', 'x': dl.edge_bend[i], 'y': 0.5})
+        if dl.edge_end_x[i] != NONE:
+            if dl.edge_end_y[i] > dl.edge_wait[i]:
+                d.append({'type': 'v', 'y': dl.edge_end_y[i] - dl.edge_wait[i]})
+            d.append({'type': 'L', 'x': dl.edge_end_x[i], 'y': dl.edge_end_y[i]})
+        elif dl.edge_end_y[i] != NONE:
+            d.append({'type': 'V', 'y': dl.edge_end_y[i]})
+        return d
+
+    def __getitem__(self, key):
+        # 'class' can't be an attribute name, so templates find it here
+        if key == 'class':
+            return self.display_list.edge_class[self.index]
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+class Rows(object):
+    """A read-only sequence of views over the parallel arrays of a DisplayList."""
+    def __init__(self, length, row):
+        self.length = length
+        self.row = row
+
+    def __len__(self):
+        return self.length()
+
+    def __getitem__(self, index):
+        length = self.length()
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(index)
+        return self.row(index)
+
+    def __iter__(self):
+        for index in range(self.length()):
+            yield self.row(index)
+
+class LabelColumn(object):
+    """Parallel arrays holding one column of text labels."""
+    def __init__(self):
+        self.x = array(b'i')
+        self.y = array(b'i')
+        self.content = []
+        self.sha = []
+
+    def add(self, x, y, content, sha):
+        self.x.append(x)
+        self.y.append(y)
+        self.content.append(content)
+        self.sha.append(sha)
+
+    def rows(self):
+        return Rows(lambda: len(self.sha), lambda i: Label(self.x[i], self.y[i], self.content[i], self.sha[i]))
+
+class DisplayList(object):
+    """What should be drawn for a page of the graph. Rather than a dict per edge, node and label,
+    each attribute is stored in an array with an entry per item, and the edge classes are shared
+    strings. It can be used like the dict of lists the templates expect, with keys 'edges', 'nodes',
+    'labels', 'authors' and 'dates', where each list yields lightweight views of the items."""
+    KEYS = ('edges', 'nodes', 'labels', 'authors', 'dates')
+
+    def __init__(self):
+        self.classes = {}
+        self.edge_x = array(b'i')
+        self.edge_y = array(b'i')
+        self.edge_bend = []
+        self.edge_class = []
+        self.edge_parent = []
+        self.edge_wait = array(b'i')
+        self.edge_end_x = array(b'i')
+        self.edge_end_y = array(b'i')
+        # The edges in the order they're drawn
+        self.edge_order = array(b'i')
+        self.node_x = array(b'i')
+        self.node_y = array(b'i')
+        self.node_id = []
+        self.node_parents = []
+        self.labels = LabelColumn()
+        self.authors = LabelColumn()
+        self.dates = LabelColumn()
+
+    def add_edge(self, x, y, css_class, parent, bend=None):
+        """Adds an edge starting at column x on row y, which isn't drawn until it's ended. Returns
+        the index of the edge."""
+        self.edge_x.append(x)
+        self.edge_y.append(y)
+        self.edge_bend.append(bend)
+        self.edge_class.append(self.classes.setdefault(css_class, css_class))
+        self.edge_parent.append(parent)
+        self.edge_wait.append(y)
+        self.edge_end_x.append(NONE)
+        self.edge_end_y.append(NONE)
+        return len(self.edge_x) - 1
+
+    def wait_edge(self, edge, y):
+        """Marks an edge as going straight down from row y until it's ended."""
+        self.edge_wait[edge] = y
+
+    def end_edge(self, edge, x=None, y=None):
+        """Draws an edge. If y is given, the edge goes straight down to that row and, if x is given too,
+        ends with a line into that column."""
+        if x is not None:
+            self.edge_end_x[edge] = x
+        if y is not None:
+            self.edge_end_y[edge] = y
+        self.edge_order.append(edge)
+
+    def add_node(self, x, y, sha, parents):
+        self.node_x.append(x)
+        self.node_y.append(y)
+        self.node_id.append(sha)
+        self.node_parents.append(parents)
+
+    def sort_edges(self):
+        """Sorts the edges by the row they start from, keeping the order they were drawn in otherwise."""
+        self.edge_order = array(b'i', sorted(self.edge_order, key=self.edge_y.__getitem__))
+
+    def __getitem__(self, key):
+        if key == 'edges':
+            return Rows(lambda: len(self.edge_order), lambda i: Edge(self, self.edge_order[i]))
+        elif key == 'nodes':
+            return Rows(lambda: len(self.node_id), lambda i: Node(self.node_x[i], self.node_y[i], self.node_id[i], self.node_parents[i]))
+        elif key in ('labels', 'authors', 'dates'):
+            return getattr(self, key).rows()
+        raise KeyError(key)
+
+    def keys(self):
+        return list(self.KEYS)
+
+    def items(self):
+        return [(key, self[key]) for key in self.KEYS]
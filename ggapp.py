@@ -1,29 +1,161 @@
 # -*- coding: utf-8
 from __future__ import unicode_literals
-from flask import Flask, render_template, request, escape, Markup, json, abort, g
+from flask import Flask, render_template, request, escape, Markup, abort, g, stream_with_context
 from werkzeug.routing import BaseConverter
 from werkzeug import run_simple
 from werkzeug.contrib.profiler import ProfilerMiddleware
 import pygit2
 from pygments import highlight
-from pygments.lexers import guess_lexer, guess_lexer_for_filename
 from pygments.util import ClassNotFound
 from pygments.formatters import HtmlFormatter
 from itertools import islice
 import imghdr
+import os
 import re
+import threading
 import tree_diff
 import graph
+import commit_graph
+import hosted_repo
+import http_cache
+import layout_index
+import lexer_resolver
+import metadata_store
+import prefetch
+import repo_pool
+import svg_writer
 import settings
 import ggutils
 
 app = Flask(__name__)
 app.config.from_object('settings')
 
+# The repository at REPO_PATH, or those in REPOS, each served below /<name>
+default_repo = hosted_repo.HostedRepo(None, app.config)
+hosted_repos = {}
+hosted_lock = threading.Lock()
+
+# Open repositories, kept between requests so that libgit2's object cache and pack indexes are reused
+repos = repo_pool.RepositoryPool(app.config.get('REPO_POOL_SIZE', 8), app.config.get('MAX_OPEN_REPOS', 16))
+if app.config.get('REPO_CACHE_SIZE') and not repo_pool.set_cache_size(app.config['REPO_CACHE_SIZE']):
+    app.logger.warning('REPO_CACHE_SIZE is set, but this version of pygit2 can\'t change the object cache size')
+
+# Draws the next page of the graph in the background while the current one is being looked at
+prefetcher = prefetch.Prefetcher(app.config.get('PREFETCH_WORKERS', 2), app.config.get('PREFETCH_QUEUE', 8), app.config.get('PREFETCH_TTL', 60))
+
+if app.config.get('TREE_DIFF_BACKEND') == 'native' and not tree_diff.NATIVE_DIFF:
+    app.logger.warning('TREE_DIFF_BACKEND is native, but this version of pygit2 can\'t diff trees; using the Python tree diff')
+
+# Settings which change how objects are shown, so responses tagged under other settings aren't reused
+ETAG_SETTINGS = ('TREE_DIFF_BACKEND', 'RENAME_THRESHOLD', 'COPY_THRESHOLD', 'DIFF_ENGINE', 'DIFF_MAX_FILES', 'DIFF_MAX_LINES',
+    'DIFF_MAX_BYTES', 'DIFF_FILE_MAX_LINES', 'DIFF_FILE_MAX_BYTES', 'MAX_REVWALK', 'BLOB_MAX_BYTES')
+source_version = http_cache.source_version(app.root_path)
+
+def request_etag(*parts):
+    """Returns the entity tag of the response to this request, given the parts of the repository it shows
+    which aren't named in the URL."""
+    return http_cache.etag(source_version, [g.hosted.get(key) for key in ETAG_SETTINGS], request.script_root + request.path,
+        sorted(request.args.items(multi=True)), request.headers.get('Accept', ''), request.is_xhr, *parts)
+
+class RepositoryPrefix(object):
+    """WSGI middleware which serves each repository in REPOS below /<name>, by moving the name from
+    the path to the script name. URLs made with url_for then start with it too."""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if app.config.get('REPOS'):
+            parts = environ.get('PATH_INFO', '').split('/', 2)
+            if len(parts) > 1 and parts[1] in app.config['REPOS'] and parts[1] not in hosted_repo.RESERVED_NAMES:
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/' + parts[1]
+                environ['PATH_INFO'] = '/' + (parts[2] if len(parts) > 2 else '')
+                environ['gitgraph.repo'] = parts[1]
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = RepositoryPrefix(app.wsgi_app)
+
+def get_hosted_repo(name):
+    """Returns the HostedRepo for a repository in REPOS, setting up its caches the first time."""
+    with hosted_lock:
+        hosted = hosted_repos.get(name)
+        if hosted is None:
+            overrides = hosted_repo.parse_repos({name: app.config['REPOS'][name]})[name]
+            hosted = hosted_repos[name] = hosted_repo.HostedRepo(name, app.config, overrides)
+        return hosted
+
+def all_hosted_repos():
+    """Returns the HostedRepo for every repository served."""
+    if app.config.get('REPOS'):
+        return [get_hosted_repo(name) for name in sorted(app.config['REPOS'])]
+    return [default_repo]
+
+@app.before_request
+def find_repo():
+    """Finds the repository this request is for. With REPOS set, the root lists the repositories."""
+    if not app.config.get('REPOS'):
+        g.hosted = default_repo
+    elif 'gitgraph.repo' in request.environ:
+        g.hosted = get_hosted_repo(request.environ['gitgraph.repo'])
+    elif request.path == '/':
+        return render_template('repos.html', names=sorted(app.config['REPOS']))
+    elif request.endpoint != 'static':
+        abort(404)
+
+def tag_response(cache_control, *parts):
+    """Tags the response to this request. Returns a 304 response if the client already has it, or
+    the response from the response cache if it's there, to be sent instead of running the view."""
+    g.etag = request_etag(*parts)
+    g.cache_control = cache_control
+    matched = http_cache.matching_tag(request.if_none_match, g.etag)
+    if matched is not None:
+        g.etag = matched
+        return app.response_class(status=304)
+    # Look for the body compressed as this client would have it, then as it is
+    encoding = request.accept_encodings.best_match(http_cache.encodings()) if app.config.get('HTTP_COMPRESSION', True) else None
+    for key in (['{0}-{1}'.format(g.etag, encoding)] if encoding else []) + [g.etag]:
+        cached = g.hosted.responses.get(key)
+        if cached is not None:
+            (content_type, content_encoding, body) = cached
+            g.etag = g.cached_etag = key
+            resp = app.response_class(body, content_type=content_type)
+            if content_encoding:
+                resp.headers['Content-Encoding'] = content_encoding
+            return resp
+
+@app.before_request
+def check_immutable():
+    """Everything shown at a SHA's URL (and each page of the graph below a commit) is found from that
+    SHA, so those responses never change. A client which has one already, or which asks for one in
+    the response cache, is answered before the repository is opened."""
+    if request.endpoint == 'get_sha' or (request.endpoint == 'display_graph_from_commit' and request.is_xhr and
+            request.view_args.get('head')):
+        return tag_response(http_cache.IMMUTABLE)
+
+@app.after_request
+def cache_headers(resp):
+    etag = getattr(g, 'etag', None)
+    if etag is not None and resp.status_code in (200, 304):
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = g.cache_control
+        resp.vary.update(['Accept', 'X-Requested-With'])
+    if app.config.get('HTTP_COMPRESSION', True):
+        http_cache.compress(resp, request.accept_encodings)
+    if etag is not None and resp.get_etag()[0] != getattr(g, 'cached_etag', None):
+        g.hosted.responses.store(resp)
+    return resp
+
 @app.before_request
 def open_repo():
-    if not hasattr(g, 'repo'):
-        g.repo = pygit2.Repository(app.config['REPO_PATH'])
+    if not hasattr(g, 'repo') and hasattr(g, 'hosted'):
+        path = g.hosted.path
+        g.repo = repos.acquire(path)
+        g.repo_path = path
+
+@app.teardown_request
+def release_repo(exc):
+    # A streamed response is torn down once it's been sent, so the repository is free by then
+    if hasattr(g, 'repo_path'):
+        repos.release(g.repo_path, g.repo)
 
 class SHAConverter(BaseConverter):
     def __init__(self, url_map, *items):
@@ -56,6 +188,10 @@ def display_graph_from_ref(ref=None):
     while head_obj.type == pygit2.GIT_OBJ_TAG:
         head_obj = head_obj.target
     
+    # The ref may have moved, so the page is checked against its tip and the names of the refs listed on it
+    cached = tag_response(http_cache.REVALIDATE, head_obj.hex, None if request.is_xhr else g.repo.listall_references())
+    if cached is not None:
+        return cached
     return display_graph(head_obj, ref)
 
 @app.route('/graph/')
@@ -66,26 +202,130 @@ def display_graph_from_commit(head=None):
         if not head:
             head = request.args['head']
         head_obj = g.repo[head]
+        if not request.is_xhr:
+            # The whole page lists the refs, which may change
+            cached = tag_response(http_cache.REVALIDATE, head_obj.hex, g.repo.listall_references())
+            if cached is not None:
+                return cached
         return display_graph(head_obj)
     except KeyError:
         abort(404)
 
+def get_layout_index(repo, hosted=None):
+    """Returns the on-disk graph layout index for the repository, or None if no cache directory is configured."""
+    cache_dir = (hosted or g.hosted).cache_dir
+    if not cache_dir:
+        return None
+    return layout_index.LayoutIndex(repo, os.path.join(cache_dir, 'layout'), (hosted or g.hosted).get('LAYOUT_CACHE_SIZE', layout_index.MAX_BYTES))
+
+def get_commit_graph(repo, hosted=None):
+    """Returns the on-disk commit graph of the repository, or None if no cache directory is configured."""
+    cache_dir = (hosted or g.hosted).cache_dir
+    if not cache_dir:
+        return None
+    return commit_graph.CommitGraph(repo, os.path.join(cache_dir, 'commit-graph'))
+
+def draw_graph_page(repo, hosted, head_obj, offset, stop, branches, cursor=None, index=False):
+    """Draws rows offset to stop of the graph from head_obj, starting with the given existing branches.
+    Returns the display list, the branches at the bottom of the page and a cursor for the next page, if any.
+    If index is set, head_obj is the tip of a ref, and its graph is laid out in the background if it isn't yet."""
+    # The graph is only drawn for this many commits from the head
+    max_walk = hosted.get('MAX_REVWALK')
+    if max_walk is not None:
+        stop = max(min(stop, max_walk), offset)
+    layout = get_layout_index(repo, hosted)
+    if layout is not None and not layout.use(head_obj.hex):
+        if index:
+            layout.build_in_background(head_obj.hex, max_walk)
+        # Until it's indexed, the graph is drawn from a walk
+        layout = None
+    walker = None
+    next_cursor = None
+    labels = graph.commit_labels
+    if layout is not None and max_walk is None:
+        # Take the labels from the metadata store where it has them, and bring it and its commit graph
+        # up to date in the background; until then, the other commits' labels are decoded. The commit
+        # graph covers the whole history, so it isn't kept when the walk is limited.
+        commits = get_commit_graph(repo, hosted)
+        metadata = metadata_store.MetadataStore(repo, commits, os.path.join(hosted.cache_dir, 'metadata'))
+        if head_obj.hex not in commits or len(metadata) < len(commits):
+            metadata.update_in_background([head_obj.hex])
+        labels = metadata.labels
+    if layout is not None:
+        # Read the page's commits straight from the index, no walk needed
+        if offset and not branches:
+            branches = layout.branches_at(head_obj.hex, offset)
+        page = layout.commits(head_obj.hex, offset, stop)
+    else:
+        # Continue the walk from where the previous page left off, if we still can
+        resumed = hosted.cursors.resume(cursor, head_obj.hex, offset, branches) if cursor else None
+        if resumed is not None:
+            (walker, release) = (resumed.walker, resumed.release)
+            page = islice(walker, stop - offset)
+        else:
+            # The walk has a repository handle of its own, which stays checked out of the pool
+            # with the walker until the cursor for the next page is resumed or dropped
+            (pool, walk_repo) = (repos, repos.acquire(hosted.path))
+            release = lambda: pool.release(hosted.path, walk_repo)
+            walker = walk_repo.walk(head_obj.oid, pygit2.GIT_SORT_TIME)
+            page = islice(walker, offset, stop)
+    try:
+        (display_list, existing_branches) = graph.Grapher().draw_commits(page, branches, offset, labels)
+    except:
+        if walker is not None and release is not None:
+            release()
+        raise
+    if walker is not None:
+        if len(display_list['nodes']) == stop - offset and (max_walk is None or stop < max_walk):
+            # If we didn't reach the end of the history or the limit, the next page can continue this walk
+            next_cursor = hosted.cursors.save(head_obj.hex, stop, walker, existing_branches, release)
+        elif release is not None:
+            release()
+    return (display_list, existing_branches, next_cursor)
+
+def prefetch_graph_page(hosted, head, offset, branches, cursor=None, index=False):
+    """Starts drawing the page of the graph from head at offset in the background, so it's ready when it's asked for.
+    The walk continues from cursor, the one given for the page, if there is one."""
+    def draw():
+        # The request's repository may still be in use, so the page is drawn with a handle of its own
+        repo = repos.acquire(hosted.path)
+        try:
+            return draw_graph_page(repo, hosted, repo[head], offset, offset + 100, branches, cursor, index)
+        finally:
+            repos.release(hosted.path, repo)
+    prefetcher.submit((hosted.name, head, offset, tuple(branches)), draw)
+
 def display_graph(head_obj, ref=None):
     """Displays the main graph view, starting at a certain commit object. ref is an optional head or tag to label as 'current'.
     Optionally searches for a certain commit and displays graph from head up to that commit + 10 previous."""
     offset = request.args.get('offset',0,type=int)
     branches = request.args.getlist('branches')
     search_commit = request.args.get('search_commit',None)
+    cursor = request.args.get('cursor',None)
     switch_branch = False
-    grapher = graph.Grapher()
+    layout = get_layout_index(g.repo)
+    max_walk = g.hosted.get('MAX_REVWALK')
     
     if search_commit:
         # Try to find commit in current branch
         stop = -1
-        for (index, commit) in enumerate(islice(g.repo.walk(head_obj.oid, pygit2.GIT_SORT_TIME), offset, None)):
-            if commit.hex == search_commit:
-                stop = index + offset + 11
-                break
+        if layout is not None and layout.use(head_obj.hex):
+            # Once the commit graph holds the head, it holds everything reachable from it, so anything
+            # missing from it can't be on this graph, and only then is the head's layout read to find
+            # the row. Until it's been updated in the background, the layout is read anyway.
+            commits = get_commit_graph(g.repo) if max_walk is None else None
+            if commits is not None and head_obj.hex in commits:
+                reachable = search_commit in commits and commits.is_ancestor(search_commit, head_obj.hex)
+            else:
+                reachable = True
+            row = layout.position(head_obj.hex, search_commit) if reachable else None
+            if row is not None and row >= offset:
+                stop = row + 11
+        else:
+            for (index, commit) in enumerate(islice(g.repo.walk(head_obj.oid, pygit2.GIT_SORT_TIME), offset, max_walk)):
+                if commit.hex == search_commit:
+                    stop = index + offset + 11
+                    break
         if stop == -1:
             #at this point, it was not found in the current branch..
             try:
@@ -103,11 +343,20 @@ def display_graph(head_obj, ref=None):
             except KeyError:
                 # Commit is not even in the repo, return 404.
                 abort(404)
+        drawn = None
     else:
         stop = offset + 100
+        # The page may have been drawn in the background while the previous one was looked at
+        drawn = prefetcher.take((g.hosted.name, head_obj.hex, offset, tuple(branches)), app.config.get('PREFETCH_WAIT', 10))
+        if drawn is not None and cursor:
+            # The drawing usually resumed the cursor, but if it didn't, its walk isn't needed now
+            g.hosted.cursors.discard(cursor)
     
-    walker = islice(g.repo.walk(head_obj.oid, pygit2.GIT_SORT_TIME), offset, stop)
-    (display_list, existing_branches) = grapher.draw_commits(walker, branches, offset)
+    if drawn is None:
+        drawn = draw_graph_page(g.repo, g.hosted, head_obj, offset, stop, branches, None if switch_branch else cursor, ref is not None)
+    (display_list, existing_branches, next_cursor) = drawn
+    if not search_commit and len(display_list['nodes']) == stop - offset and (max_walk is None or stop < max_walk):
+        prefetch_graph_page(g.hosted, head_obj.hex, stop, existing_branches, next_cursor, ref is not None)
 
     if request.is_xhr:
         if search_commit:
@@ -115,14 +364,32 @@ def display_graph(head_obj, ref=None):
             extra_template_data = dict(display_list.items() + get_commit_templatedata(g.repo, g.repo[search_commit]).items())
         else:
             extra_template_data = display_list
-        return render_template('graphonly.html', existing_branches=existing_branches, current_ref=ref, refresh=switch_branch, found_commit=search_commit, **extra_template_data)
+        def render_script():
+            return render_template('graphonly.html', existing_branches=existing_branches, cursor=next_cursor, current_ref=ref, refresh=switch_branch, found_commit=search_commit, **extra_template_data)
+        # Stream the SVG out as it's written rather than rendering the whole page first
+        return app.response_class(stream_with_context(svg_writer.graph_page(display_list, render_script)))
     else:
         (tags, branches, remotes) = get_all_refs(g.repo)
         extra_template_data = dict(display_list.items() + get_commit_templatedata(g.repo, head_obj).items())
-        return render_template('base.html', tags=tags, branches=branches, remotes=remotes, current_ref=ref, existing_branches=existing_branches, **extra_template_data)
+        return render_template('base.html', tags=tags, branches=branches, remotes=remotes, current_ref=ref, existing_branches=existing_branches, cursor=next_cursor,
+            graph_svg=Markup(''.join(svg_writer.graph_elements(display_list))),
+            authors_svg=Markup(''.join(svg_writer.label_elements(display_list['authors'], 'author'))),
+            dates_svg=Markup(''.join(svg_writer.label_elements(display_list['dates'], 'date'))),
+            **extra_template_data)
+
+def stream_template(template_name, **context):
+    """Renders a template into a response which is sent in chunks as it's rendered, so that large
+    files can be shown without holding the whole page in memory."""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(app.config.get('STREAM_BUFFER_SIZE', 100))
+    return app.response_class(stream_with_context(stream))
 
 def get_blob(obj, filename_hint=None):
     """Displays the contents of a blob, either in an HTML table with numbered lines, or as binary/plaintext"""
+    if request.accept_mimetypes.best == 'text/html' and obj.size > g.hosted.get('BLOB_MAX_BYTES', 16 * 1024 * 1024):
+        # Too large to show, so its content isn't read at all; it can still be downloaded
+        return app.make_response(Markup('<pre>(This file is too large to show)</pre>'))
     is_binary = b'\0' in obj.data
     if is_binary:
         # It may be an image file so we try to detect the file type.
@@ -137,18 +404,22 @@ def get_blob(obj, filename_hint=None):
                 resp = app.make_response(Markup('<pre>(Binary file)</pre>'))
         else:
             try:
-                if filename_hint:
-                    lexer = guess_lexer_for_filename(filename_hint, obj.data, stripnl=False, encoding='chardet')
-                else:
-                    lexer = guess_lexer(obj.data, stripnl=False, encoding='chardet')
+                lexer = lexer_resolver.get_lexer(filename_hint, obj.data, stripnl=False, encoding='chardet')
             except ClassNotFound:
-                highlighted = escape(ggutils.force_unicode(obj.data))
+                highlighted = escape(ggutils.force_unicode(obj.data, obj.hex)).splitlines()
             else:
-                highlighted = highlight(obj.data, lexer, HtmlFormatter(nowrap=True))
+                # The blob is decoded by Pygments here rather than as in a diff, so it's cached apart
+                key = (obj.hex, lexer.name, 'blob')
+                highlighted = g.hosted.highlights.get(key)
+                if highlighted is None and len(obj.data) > g.hosted.get('DIFF_FILE_MAX_BYTES', 1024 * 1024):
+                    # A large file is highlighted a batch of lines at a time as it's sent, and not cached
+                    highlighted = tree_diff.highlight_lines(obj.data, lexer, HtmlFormatter(nowrap=True))
+                elif highlighted is None:
+                    highlighted = highlight(obj.data, lexer, HtmlFormatter(nowrap=True)).splitlines()
+                    g.hosted.highlights.put(key, highlighted)
             if highlighted:
-                resp = app.make_response(render_template(
-                    'simple_file.html', sha=obj.hex, filename=filename_hint,
-                    content=highlighted.splitlines()))
+                resp = stream_template('simple_file.html', sha=obj.hex, filename=filename_hint,
+                    content=highlighted)
             else:
                 resp = app.make_response(Markup('<pre>(Binary file)</pre>'))
     else:
@@ -162,7 +433,9 @@ def get_blob(obj, filename_hint=None):
 
 def get_blob_diff(repo, old_obj, obj, filename_hint=None):
     """Displays the differences between two versions of a blob, as HTML in a table."""
-    if b'\0' in obj.data or b'\0' in old_obj.data:
+    if max(obj.size, old_obj.size) > g.hosted.get('BLOB_MAX_BYTES', 16 * 1024 * 1024):
+        resp = app.make_response(Markup('<pre>(This file is too large to show)</pre>'))
+    elif b'\0' in obj.data or b'\0' in old_obj.data:
         # It may be an image file so we try to detect the file type.
         imgtype = imghdr.what(None, obj.data)
         old_imgtype = imghdr.what(None, obj.data)
@@ -173,16 +446,29 @@ def get_blob_diff(repo, old_obj, obj, filename_hint=None):
         else:
             resp = app.make_response(Markup('<pre>(Binary file)</pre>'))
     else:
-        td = tree_diff.TreeDiffer(repo)
-        resp = app.make_response(render_template('changed_file.html', file={
+        td = get_tree_differ(repo)
+        resp = stream_template('changed_file.html', file={
             'name': filename_hint,
             'sha': obj.hex,
-            'content': td.compare_data(old_obj.data, obj.data, filename_hint)
-        }))
+            'content': td.compare_data(old_obj.data, obj.data, filename_hint, old_obj.hex, obj.hex,
+                g.hosted.get('DIFF_FILE_MAX_BYTES', 1024 * 1024))
+        })
     return resp
 
+def get_tree_differ(repo, hosted=None):
+    """Returns a TreeDiffer for the repository, using the backend set by TREE_DIFF_BACKEND and
+    the diff engine set by DIFF_ENGINE, and the caches of the HostedRepo (by default, the one
+    this request is for)."""
+    hosted = hosted or g.hosted
+    diff_engine = hosted.get('DIFF_ENGINE', 'difflib')
+    if hosted.get('TREE_DIFF_BACKEND') == 'native' and tree_diff.NATIVE_DIFF:
+        return tree_diff.NativeTreeDiffer(repo, rename_threshold=hosted.get('RENAME_THRESHOLD'),
+            copy_threshold=hosted.get('COPY_THRESHOLD'), highlight_cache=hosted.highlights, diff_engine=diff_engine,
+            level_cache=hosted.level_cache)
+    return tree_diff.TreeDiffer(repo, highlight_cache=hosted.highlights, diff_engine=diff_engine, level_cache=hosted.level_cache)
+
 def get_tree_diff(repo, commit):
-    td = tree_diff.TreeDiffer(repo)
+    td = get_tree_differ(repo)
     if len(commit.parents) != 1:
         #This appears to be a merge (or the initial commit)
         #TODO: three+ way diff? For now, just show the state after the merge
@@ -192,11 +478,19 @@ def get_tree_diff(repo, commit):
     return td.tree_diff(to_compare.tree, commit.tree)
 
 def get_tree(repo, tree):
-    """Gets a git (sub)tree in the JSON format required by jsTree"""
+    """Gets a git (sub)tree in the JSON format required by jsTree. If compare_to is given, the
+    tree is shown as a diff against that older tree."""
     parent_name = request.args.get('parent_name',None)
-    td = tree_diff.TreeDiffer(repo)
-    tree = td.tree_diff(tree, tree, parent_name)
-    resp = app.make_response(json.dumps(tree, cls=tree_diff.DiffEntryEncoder))
+    compare_to = request.args.get('compare_to',None)
+    if compare_to:
+        old_tree = repo[compare_to]
+        if old_tree.type != pygit2.GIT_OBJ_TREE:
+            abort(400) #can't compare a tree against something else.
+    else:
+        old_tree = tree
+    td = get_tree_differ(repo)
+    tree = td.tree_diff(old_tree, tree, parent_name)
+    resp = app.make_response(tree_diff.tree_json(tree))
     resp.mimetype = 'application/json'
     return resp
 
@@ -205,17 +499,25 @@ def get_commit_templatedata(repo, obj):
     in the commit, author and committer info, time and commit messages, and list of changed files. Returns a dict
     with appropriate key names for the templates to use."""
     tree = list(get_tree_diff(repo, obj))
-    td = tree_diff.TreeDiffer(repo)
+    td = get_tree_differ(repo)
+    # Files past these limits are shown collapsed, and their diffs loaded separately
+    budget = tree_diff.DiffBudget(
+        max_files=g.hosted.get('DIFF_MAX_FILES', 200),
+        max_lines=g.hosted.get('DIFF_MAX_LINES', 20000),
+        max_bytes=g.hosted.get('DIFF_MAX_BYTES', 8 * 1024 * 1024),
+        file_max_lines=g.hosted.get('DIFF_FILE_MAX_LINES', 5000),
+        file_max_bytes=g.hosted.get('DIFF_FILE_MAX_BYTES', 1024 * 1024))
     
-    changed_files = []
-    for entry in tree:
-        if entry.kind != tree_diff.DiffEntry.UNMODIFIED:
-            changed_files.extend(td.commitdiff(entry))
+    # The changed files are listed first, and each one is only diffed when the template reaches it
+    changed_entries = [blob for entry in tree if entry.kind != tree_diff.DiffEntry.UNMODIFIED for blob in td.changed_blobs(entry)]
+    changed_files = (result for blob in changed_entries for result in td.commitdiff(blob, budget))
     
-    message = ggutils.force_unicode(obj.message)
+    author_key = ('author', obj.author.email)
+    committer_key = ('author', obj.committer.email)
+    message = ggutils.force_unicode(obj.message, author_key)
     short_message = ggutils.short_message(message)
-    author = (ggutils.force_unicode(obj.author.name), ggutils.force_unicode(obj.author.email))
-    committer = (ggutils.force_unicode(obj.committer.name), ggutils.force_unicode(obj.committer.email))
+    author = (ggutils.force_unicode(obj.author.name, author_key), ggutils.force_unicode(obj.author.email, author_key))
+    committer = (ggutils.force_unicode(obj.committer.name, committer_key), ggutils.force_unicode(obj.committer.email, committer_key))
     author_time = ggutils.format_commit_time(obj.author.time)
     commit_time = ggutils.format_commit_time(obj.committer.time)
     return dict(
@@ -227,21 +529,23 @@ def get_commit_templatedata(repo, obj):
         author_time=author_time,
         commit_time=commit_time,
         initial_tree=tree,
-        td_encoder=tree_diff.DiffEntryEncoder,
+        initial_tree_json=Markup(tree_diff.tree_json(tree, html_safe=True)),
+        changed_entries=changed_entries,
         changed_files=changed_files
     )
     
 def get_commit(repo, obj):
     """Displays a single commit as HTML or JSON (used to load a commit's information into the bottom pane)."""
     desired_mimetype = request.accept_mimetypes.best_match(['application/json','text/html'],'text/html')
-    templatedata = get_commit_templatedata(repo, obj)
     if desired_mimetype == 'application/json':
-        resp = app.make_response(json.dumps(templatedata['initial_tree'], cls=tree_diff.DiffEntryEncoder))
+        # Only the tree diff is needed for the JSON
+        resp = app.make_response(tree_diff.tree_json(get_tree_diff(repo, obj)))
         resp.mimetype = 'application/json'
         return resp
     else:
-        #handle HTML view of commits with diffs on each file
-        return render_template('commit.html', **templatedata)
+        #handle HTML view of commits with diffs on each file, sending the start of the page before the
+        #later files have been diffed
+        return stream_template('commit.html', **get_commit_templatedata(repo, obj))
 
 REMOTE_REGEX = re.compile(r'^refs/remotes/(?P<remote>[^/]+)/(?P<branch>.+)')
 def get_all_refs(repo):
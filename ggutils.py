@@ -1,6 +1,8 @@
 # -*- coding: utf-8
 from __future__ import unicode_literals
 from BeautifulSoup import UnicodeDammit
+from collections import OrderedDict
+import threading
 import time
 
 # Convention states that commit messages should begin with a 50 char title
@@ -9,8 +11,29 @@ GIT_SHORT_MESSAGE = 50
 def format_commit_time(timestamp):
     return time.strftime('%d %B %Y %H:%M', time.localtime(timestamp))
 
-def force_unicode(text):
-    return UnicodeDammit(text, smartQuotesTo=None).unicode
+def force_unicode(text, key=None):
+    """Decodes text from the repository. Nearly everything is UTF-8, so that's tried first, and
+    otherwise the encoding is detected by UnicodeDammit. If a key such as the SHA of a blob or the
+    email of an author is given, the encoding detected is remembered and tried before detecting
+    it again for other text with the same key."""
+    if isinstance(text, unicode):
+        return text
+    try:
+        # utf-8-sig also strips a byte order mark, as UnicodeDammit does
+        return text.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        pass
+    if key is not None:
+        encoding = _encodings.get(key)
+        if encoding:
+            try:
+                return text.decode(encoding)
+            except (UnicodeDecodeError, LookupError):
+                pass
+    dammit = UnicodeDammit(text, smartQuotesTo=None)
+    if key is not None and dammit.originalEncoding:
+        _encodings[key] = dammit.originalEncoding
+    return dammit.unicode
     
 def short_message(message):
     first_line = message.strip().splitlines()[0]
@@ -18,3 +41,70 @@ def short_message(message):
         return first_line
     else:
         return first_line[:GIT_SHORT_MESSAGE].rsplit(' ', 1)[0]+'...'
+
+def find_record(data, key, record):
+    """Binary searches data, a string or mmap of fixed-size records packed with the struct
+    record and sorted by their first field, for the record whose first field is key. Returns
+    the fields of the record, or None if there isn't one."""
+    low = 0
+    high = len(data) // record.size
+    while low < high:
+        middle = (low + high) // 2
+        fields = record.unpack_from(data, middle * record.size)
+        if fields[0] == key:
+            return fields
+        elif fields[0] < key:
+            low = middle + 1
+        else:
+            high = middle
+    return None
+
+class LRUCache(object):
+    """A thread-safe mapping which holds at most maxsize items, discarding the
+    least recently used item when it becomes full. If on_evict is given, it's
+    called with each discarded value."""
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def __setitem__(self, key, value):
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None and old is not value:
+                evicted.append(old)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                evicted.append(self._items.popitem(last=False)[1])
+        if self.on_evict is not None:
+            for old in evicted:
+                self.on_evict(old)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+# Encodings detected by force_unicode for text which wasn't UTF-8, by key
+_encodings = LRUCache(4096)
@@ -1,21 +1,126 @@
 # -*- coding: utf-8
 from __future__ import unicode_literals
 import ggutils
-from operator import itemgetter
+import display_list
+import heapq
+import itertools
+
+# Classes for the colours of the edges
+EDGE_CLASSES = ['col_{0} '.format(color) for color in range(8)]
+
+def commit_labels(commit):
+    """Returns the message, author and date labels shown next to a commit on the graph."""
+    # An author's messages and name are likely to be in the same encoding
+    key = ('author', commit.author.email)
+    return (ggutils.force_unicode(ggutils.short_message(commit.message), key),
+            ggutils.force_unicode(commit.author.name, key),
+            ggutils.format_commit_time(commit.commit_time))
+
+class Lanes(object):
+    """ The list of branches being drawn. A SHA hash in some position indicates that commit should be
+    the next one in that position, and an empty string indicates the position is blank. It behaves like
+    a list, but also keeps a dict of where each SHA is and a heap of the blank positions, so finding
+    a branch or a blank position doesn't depend on how many branches there are."""
+    def __init__(self, branches=[]):
+        self.columns = list(branches)
+        self._reindex()
+
+    def _reindex(self):
+        self.positions = {}
+        self.counts = {}
+        self.blanks = []
+        for (column, sha) in enumerate(self.columns):
+            if sha == '':
+                self.blanks.append(column)
+            else:
+                self.positions.setdefault(sha, column)
+                self.counts[sha] = self.counts.get(sha, 0) + 1
+        heapq.heapify(self.blanks)
+        self.width = len(self.columns)
+        self._trim_width()
+
+    def _trim_width(self):
+        # width is the number of columns up to and including the last one that's not blank
+        while self.width and self.columns[self.width-1] == '':
+            self.width -= 1
+
+    def _add(self, sha, column):
+        if sha == '':
+            heapq.heappush(self.blanks, column)
+        else:
+            if self.positions.get(sha, column) >= column:
+                self.positions[sha] = column
+            self.counts[sha] = self.counts.get(sha, 0) + 1
+            self.width = max(self.width, column + 1)
+
+    def _remove(self, sha, column):
+        # Blank positions are removed from the heap lazily, when they're next looked for.
+        if sha != '':
+            self.counts[sha] -= 1
+            if not self.counts[sha]:
+                del self.counts[sha]
+                del self.positions[sha]
+            elif self.positions[sha] == column:
+                # Only happens if a SHA was given in more than one position
+                self.positions[sha] = self.columns.index(sha)
+
+    def index(self, sha):
+        if sha == '':
+            while self.blanks and self.columns[self.blanks[0]] != '':
+                heapq.heappop(self.blanks)
+            if self.blanks:
+                return self.blanks[0]
+        elif sha in self.positions:
+            return self.positions[sha]
+        raise ValueError('{0} is not in lanes'.format(sha))
+
+    def append(self, sha):
+        self.columns.append(sha)
+        self._add(sha, len(self.columns) - 1)
+
+    def __setitem__(self, column, sha):
+        old_sha = self.columns[column]
+        self.columns[column] = ''
+        self._remove(old_sha, column)
+        self.columns[column] = sha
+        self._add(sha, column)
+        if sha == '' and column == self.width - 1:
+            self._trim_width()
+
+    def __delitem__(self, column):
+        # Every position after this one moves, so start again
+        del self.columns[column]
+        self._reindex()
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, sha):
+        if sha == '':
+            return '' in self.columns
+        return sha in self.positions
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __iter__(self):
+        return iter(self.columns)
 
 class Grapher(object):
-    def new_edge(self, column, y, parent, extra_classes=[], override_color=None):
+    def new_edge(self, column, y, parent, extra_classes=[], override_color=None, bend=None):
+        """ Creates an edge starting at the given column and row, leading to parent. If bend is given,
+        the edge first moves that many columns across, half way down to the next row."""
         if override_color != None:
             color = override_color
         else:
             color = column
-        return {'order': y, 'class': 'col_{0} {1}'.format(color % 8, ' '.join(extra_classes)), 'd': [{'type': 'M', 'x': column, 'y': y}], 'parent': parent}
+        css_class = EDGE_CLASSES[color % 8] + ' '.join(extra_classes)
+        return self.display_list.add_edge(column, y, css_class, parent, bend)
 
-    def new_node(self, column, y, sha, parents, extra_classes=[]):
-        result = {'x': column, 'y': y, 'id': sha, 'parents': parents}
-        if extra_classes:
-            result['class'] = ' '.join(extra_classes)
-        return result
+    def wait_for_parent(self, edge, y):
+        """ Marks an edge as unfinished, going straight down from row y until its parent is drawn."""
+        self.display_list.wait_edge(edge, y)
+        self.graph.setdefault(self.display_list.edge_parent[edge], []).append(edge)
 
     def place_commit(self, commit, y):
         try:
@@ -27,19 +132,14 @@ class Grapher(object):
             self.branches.append(commit.hex)
             if self.graph and self.display_list:
                 if commit.parents:
-                    self.graph.append(self.new_edge(pos, y, commit.parents[0].hex))
-                self.display_list['nodes'].append(self.new_node(pos, y, commit.hex, [x.hex for x in commit.parents]))
+                    self.wait_for_parent(self.new_edge(pos, y, commit.parents[0].hex), y)
+                self.display_list.add_node(pos, y, commit.hex, [x.hex for x in commit.parents])
         return pos
 
     def finish_edges(self, sha, x, y):
-        for line in list(self.graph):
-            if line['parent'] == sha:
-                #draw the closing line into this commit
-                line['d'].append({'type': 'L', 'x': x, 'y': y})
-                self.display_list['edges'].append(line)
-                self.graph.remove(line)
-            else:
-                line['d'].append({'type': 'v', 'y': 1})
+        for line in self.graph.pop(sha, []):
+            #draw the closing line into this commit
+            self.display_list.end_edge(line, x, y)
 
     def process_parents(self, parents, x, y):
         """ This function creates edges in the graph for each of a node's parents.
@@ -54,7 +154,7 @@ class Grapher(object):
                     #place first parent on this branch
                     self.branches[x] = parent.hex
                     if self.graph != None:
-                        self.graph.append(self.new_edge(x, y, parent.hex))
+                        self.wait_for_parent(self.new_edge(x, y, parent.hex), y+1)
                     append = True
                 else:
                     #here we would draw a line to new branch
@@ -65,73 +165,80 @@ class Grapher(object):
                         insertat = len(self.branches)
                         self.branches.append(parent.hex)
                     if self.graph != None:
-                        edge = self.new_edge(x, y, parent.hex, override_color=insertat)
-                        edge['d'].append({'type': 'l', 'x': insertat-x, 'y': 0.5})
-                        self.graph.append(edge)
+                        self.wait_for_parent(self.new_edge(x, y, parent.hex, override_color=insertat, bend=insertat-x), y+1)
             elif self.display_list != None:
                 #here we draw lines to other existing branches.
                 otherbranch = self.branches.index(parent.hex)
-                edge = self.new_edge(x, y, parent.hex, override_color=otherbranch)
-                edge['d'].append({'type': 'l', 'x': otherbranch-x, 'y': 0.5})
-                self.display_list['edges'].append(edge)
+                self.display_list.end_edge(self.new_edge(x, y, parent.hex, override_color=otherbranch, bend=otherbranch-x))
         return delete
 
-    def draw_commits(self, walker, existing_branches=[], currentY=0):
+    def add_commit(self, commit, y):
+        """ Moves the branches on past a single commit, drawing edges into and out of it if we're
+        drawing. Returns a tuple of the column the commit is placed in and the column its label starts in."""
+        pos = self.place_commit(commit, y)
+        
+        # Do any edges need finishing off?
+        if self.graph != None:
+            self.finish_edges(commit.hex, pos, y)
+        
+        #The delete flag determines whether to mark this branch as deleted
+        if commit.parents:
+            delete = self.process_parents(commit.parents, pos, y)
+        else:
+            del self.branches[pos] #this branch has no parent, delete it
+            delete = False
+        
+        textX = max(self.branches.width,1)
+        
+        if delete:
+            #clear out this branch for future use
+            self.branches[pos] = ''
+        return (pos, textX)
+
+    def follow_commits(self, walker, existing_branches=[]):
+        """ Works out where the branches would be after the commits taken from walker, without
+        drawing anything. Returns the list of branches at the bottom of the graph."""
+        self.graph = None
+        self.display_list = None
+        self.branches = Lanes(existing_branches)
+        for commit in walker:
+            self.add_commit(commit, 0)
+        return list(self.branches)
+
+    def draw_commits(self, walker, existing_branches=[], currentY=0, labels=commit_labels):
         """ This is the main function that draws the commits taken from a walk of the repository
         (the walker object). It can optionally start with a number of existing branches and at a
-        given y-position. It returns a tuple with the first member being a dictionary of the nodes,
+        given y-position, and take the labels of each commit from somewhere other than the commit
+        itself, such as a metadata store. It returns a tuple with the first member being a dictionary of the nodes,
         edges, and labels to be drawn, and the second member being a list of branches at the bottom
         of the graph (used for continuing the graph later)"""
         column = 0
-        self.graph = [] #stores a list of edges which aren't finished being drawn.
+        self.graph = {} #stores the edges which aren't finished being drawn, by the parent they lead to.
         # display_list is a structure holding what should actually be drawn on the screen.
-        self.display_list = {'edges':[], 'nodes':[], 'labels':[], 'authors':[], 'dates':[]}
+        self.display_list = display_list.DisplayList()
         # branches is an array of strings used to track where branches should go.
         # A SHA hash in some position indicates that commit should be the next one in that position.
         # An empty string indicates the position is blank and can be filled with a new branch if one appears.
-        self.branches = []
+        self.branches = Lanes()
         for existing_branch in existing_branches:
             if existing_branch:
                 # start drawing these existing branches
-                self.graph.append(self.new_edge(column, currentY, existing_branch))
+                self.wait_for_parent(self.new_edge(column, currentY, existing_branch), currentY)
             column = column + 1
             # Keep track of existing branches
             self.branches.append(existing_branch)
         for commit in walker:
-            pos = self.place_commit(commit, currentY)
-            
-            # Do any edges need finishing off?
-            self.finish_edges(commit.hex, pos, currentY)
-            
-            #The delete flag determines whether to mark this branch as deleted
-            if commit.parents:
-                delete = self.process_parents(commit.parents, pos, currentY)
-            else:
-                del self.branches[pos] #this branch has no parent, delete it
-                delete = False
-            
-            #TODO: make this more elegant?
-            textX = len(self.branches)
-            for branch in reversed(self.branches):
-                if branch == '':
-                    textX -= 1
-                else:
-                    break
-            textX = max(textX,1)
-            
-            if delete:
-                #clear out this branch for future use
-                self.branches[pos] = ''
+            (pos, textX) = self.add_commit(commit, currentY)
             
             # Create a node representing this commit and the message, author and time labels
-            self.display_list['nodes'].append(self.new_node(pos, currentY, commit.hex, [x.hex for x in commit.parents]))
-            label_text = ggutils.force_unicode(ggutils.short_message(commit.message))
-            self.display_list['labels'].append({'x': textX, 'y': currentY, 'content': label_text, 'sha': commit.hex})
-            self.display_list['authors'].append({'x': 0, 'y': currentY, 'content': ggutils.force_unicode(commit.author.name), 'sha': commit.hex})
-            self.display_list['dates'].append({'x': 0, 'y': currentY, 'content': ggutils.format_commit_time(commit.commit_time), 'sha': commit.hex})
+            self.display_list.add_node(pos, currentY, commit.hex, [x.hex for x in commit.parents])
+            (message, author, date) = labels(commit)
+            self.display_list.labels.add(textX, currentY, message, commit.hex)
+            self.display_list.authors.add(0, currentY, author, commit.hex)
+            self.display_list.dates.add(0, currentY, date, commit.hex)
             currentY += 1
-        for incomplete in self.graph:
-            incomplete['d'].append({'type': 'V', 'y': currentY})
-            self.display_list['edges'].append(incomplete)
-        self.display_list['edges'].sort(key=itemgetter('order'))
-        return (self.display_list, self.branches)
+        # Edges are numbered in the order they're created, so finish the incomplete ones in that order
+        for incomplete in sorted(itertools.chain(*self.graph.values())):
+            self.display_list.end_edge(incomplete, y=currentY)
+        self.display_list.sort_edges()
+        return (self.display_list, list(self.branches))
@@ -0,0 +1,222 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import pygit2
+import tree_diff
+
+# Rough memory used by each line besides its characters
+LINE_OVERHEAD = 64
+# Blobs larger than this aren't highlighted by warm_up
+WARM_UP_MAX_SIZE = 256 * 1024
+
+def _size(lines):
+    return sum(len(line) for line in lines) + LINE_OVERHEAD * len(lines)
+
+class HighlightCache(object):
+    """A thread-safe cache of Pygments-highlighted lines. A blob's content never changes, so
+    highlighted lines are keyed by the blob's SHA and the name of the lexer used, with anything
+    else that changes the output (e.g. how the blob was decoded) added to the end of the key.
+
+    The cache holds lines of about max_bytes characters in total, discarding the least recently
+    used blobs when it's full. If spill_dir is set, discarded blobs are written there as JSON and
+    read back on a miss, and the oldest files are removed when they take up more than
+    max_spill_bytes."""
+    def __init__(self, max_bytes, spill_dir=None, max_spill_bytes=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._spill_bytes = None
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the highlighted lines stored for a key, or None. The list returned mustn't be changed."""
+        with self._lock:
+            lines = self._items.pop(key, None)
+            if lines is not None:
+                self._items[key] = lines
+                self.hits += 1
+                return lines
+        lines = self._read_spill(key)
+        if lines is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.spill_hits += 1
+        self.put(key, lines)
+        return lines
+
+    def put(self, key, lines):
+        """Stores the highlighted lines for a key."""
+        size = _size(lines)
+        evicted = []
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= _size(old)
+            self._items[key] = lines
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                (old_key, old_lines) = self._items.popitem(last=False)
+                self._bytes -= _size(old_lines)
+                evicted.append((old_key, old_lines))
+        for (old_key, old_lines) in evicted:
+            self._spill(old_key, old_lines)
+
+    def flush(self):
+        """Writes everything held in memory to the spill directory, keeping it in memory too."""
+        with self._lock:
+            items = list(self._items.items())
+        for (key, lines) in items:
+            self._spill(key, lines)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        """Returns the hit and miss counts and the size of the in-memory cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'spill_hits': self.spill_hits,
+                    'items': len(self._items), 'bytes': self._bytes}
+
+    def _spill_path(self, key):
+        name = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, name[:2], name)
+
+    def _read_spill(self, key):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return None
+
+    def _spill(self, key, lines):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        # The lines for a key never change, so a file which is already there is up to date
+        if os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Made by another thread or process in the meantime
+                pass
+        data = json.dumps(lines).encode('utf-8')
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        if self.max_spill_bytes is not None:
+            with self._spill_lock:
+                if self._spill_bytes is None:
+                    self._spill_bytes = sum(size for (_, size, _) in self._spill_files())
+                else:
+                    self._spill_bytes += len(data)
+                if self._spill_bytes > self.max_spill_bytes:
+                    self._prune_spill()
+
+    def _spill_files(self):
+        for (directory, _, names) in os.walk(self.spill_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield (stat.st_mtime, stat.st_size, path)
+
+    def _prune_spill(self):
+        # Remove the oldest files until there's room for a while again
+        files = sorted(self._spill_files())
+        total = sum(size for (_, size, _) in files)
+        for (_, size, path) in files:
+            if total <= self.max_spill_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._spill_bytes = total
+
+def _tip_tree(repo, ref):
+    tip = repo.lookup_reference(ref)
+    if tip.type == pygit2.GIT_REF_SYMBOLIC:
+        tip = tip.resolve()
+    obj = repo[tip.oid]
+    while obj.type == pygit2.GIT_OBJ_TAG:
+        obj = obj.target
+    if obj.type != pygit2.GIT_OBJ_COMMIT:
+        return None
+    return obj.tree
+
+def _blobs(repo, tree, parent_name=None):
+    for entry in tree:
+        name = tree_diff.DIR_SEP.join((parent_name, entry.name)) if parent_name else entry.name
+        kind = tree_diff.entry_type(entry)
+        if kind == pygit2.GIT_OBJ_TREE:
+            for blob in _blobs(repo, repo[entry.hex], name):
+                yield blob
+        elif kind == pygit2.GIT_OBJ_BLOB:
+            yield (name, entry.hex)
+
+def warm_up(differ, refs, max_size=WARM_UP_MAX_SIZE):
+    """Highlights the files in the trees at the tips of the given refs with a TreeDiffer, so that
+    its highlight cache holds them. Returns the number of files highlighted."""
+    seen = set()
+    count = 0
+    for ref in refs:
+        tree = _tip_tree(differ.repo, ref)
+        if tree is None:
+            continue
+        for (name, sha) in _blobs(differ.repo, tree):
+            if sha in seen:
+                continue
+            seen.add(sha)
+            if differ.highlight_blob(sha, name, max_size) is not None:
+                count += 1
+    return count
+
+def main():
+    """Pre-highlights the files at the tips of the refs in HIGHLIGHT_WARM_UP_REFS (or those given
+    on the command line) into the on-disk highlight cache of each repository, e.g. after fetching."""
+    import ggapp
+    if not ggapp.app.config.get('CACHE_DIR'):
+        sys.exit('CACHE_DIR must be set to keep the highlighted files')
+    for hosted in ggapp.all_hosted_repos():
+        cache = hosted.highlights
+        refs = sys.argv[1:] or hosted.get('HIGHLIGHT_WARM_UP_REFS', ['HEAD'])
+        repo = pygit2.Repository(hosted.path)
+        count = warm_up(ggapp.get_tree_differ(repo, hosted), refs)
+        cache.flush()
+        print('{0}: highlighted {1} files: {2}'.format(hosted.name or hosted.path, count, cache.stats()))
+
+if __name__ == '__main__':
+    main()
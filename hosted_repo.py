@@ -0,0 +1,62 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import os
+import highlight_cache
+import pagination
+import response_cache
+import tree_diff
+
+# The first path segments of the app's own URLs, which can't be repository names
+RESERVED_NAMES = frozenset(['static', 'graph', 'sha', 'autocomplete', 'tree'])
+
+class HostedRepo(object):
+    """A repository served by the app, with its own settings and caches. Each repository's caches
+    have their own limits, so a large repository can't push everyone else's entries out.
+
+    name is the prefix the repository is served under, or None for the single repository at
+    REPO_PATH. Settings not in overrides are taken from config, and the caches on disk are kept in a
+    directory of their own under CACHE_DIR."""
+    def __init__(self, name, config, overrides=None):
+        self.name = name
+        self.config = config
+        self.overrides = overrides or {}
+        cache_dir = self.get('CACHE_DIR')
+        if cache_dir and name is not None:
+            cache_dir = os.path.join(cache_dir, name)
+        self.cache_dir = cache_dir
+        # Highlighted blob lines, spilled to disk when a cache directory is configured
+        self.highlights = highlight_cache.HighlightCache(self.get('HIGHLIGHT_CACHE_SIZE', 32 * 1024 * 1024),
+            os.path.join(cache_dir, 'highlight') if cache_dir else None, self.get('HIGHLIGHT_SPILL_SIZE', 512 * 1024 * 1024))
+        # Bodies of tagged responses, shared with other processes through the cache directory
+        tiers = [response_cache.MemoryTier(self.get('RESPONSE_CACHE_SIZE', 64 * 1024 * 1024))]
+        if cache_dir:
+            tiers.append(response_cache.FileTier(os.path.join(cache_dir, 'responses'),
+                self.get('RESPONSE_CACHE_DISK_SIZE', 1024 * 1024 * 1024)))
+        self.responses = response_cache.ResponseCache(tiers, self.get('RESPONSE_CACHE_MAX_ITEM', 8 * 1024 * 1024))
+        self.cursors = pagination.CursorStore(self.get('GRAPH_CURSOR_CACHE_SIZE', 64))
+        self.level_cache = tree_diff.LevelCache(self.get('TREE_CACHE_SIZE', tree_diff.TREE_CACHE_SIZE))
+
+    def get(self, key, default=None):
+        """Returns a setting for this repository."""
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.config.get(key, default)
+
+    @property
+    def path(self):
+        return self.overrides.get('PATH') or self.config['REPO_PATH']
+
+def parse_repos(repos):
+    """Returns a dict of the per-repository settings for each repository in REPOS, whose values
+    are either paths or dicts of settings including the PATH."""
+    result = {}
+    for (name, value) in repos.items():
+        if '/' in name or not name or name in RESERVED_NAMES:
+            raise ValueError('Repository name {0!r} can\'t be used in a URL prefix'.format(name))
+        if isinstance(value, dict):
+            if not value.get('PATH'):
+                raise ValueError('Repository {0!r} has no PATH'.format(name))
+            result[name] = dict(value)
+        else:
+            result[name] = {'PATH': value}
+    return result
@@ -0,0 +1,98 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import hashlib
+import json
+import os
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache-Control for responses which can never change, because everything they show is found by SHA
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Cache-Control for responses which may change, and so are checked with the server each time they're used
+REVALIDATE = 'no-cache'
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = frozenset(['application/json', 'application/javascript', 'image/svg+xml'])
+
+def etag(*parts):
+    """Returns a strong entity tag made from parts, which can be anything that can be written as JSON."""
+    return hashlib.sha1(json.dumps(parts, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def source_version(root):
+    """Returns a hash of the Python modules in root and the files under root/templates, so that
+    responses tagged by one version of the app aren't taken as the same as another's."""
+    sha = hashlib.sha1()
+    paths = [os.path.join(root, name) for name in os.listdir(root) if name.endswith('.py')]
+    for (dirpath, dirnames, filenames) in os.walk(os.path.join(root, 'templates')):
+        paths.extend(os.path.join(dirpath, name) for name in filenames)
+    for path in sorted(paths):
+        sha.update(os.path.relpath(path, root).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+def encodings():
+    """Returns the content codings responses can be compressed with, most preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def matching_tag(if_none_match, tag):
+    """Returns the tag from a request's If-None-Match (a werkzeug ETags) which matches tag or one
+    of its compressed variants, or None if the client has none of them."""
+    if if_none_match.star_tag:
+        return tag
+    for variant in [tag] + ['{0}-{1}'.format(tag, encoding) for encoding in encodings()]:
+        if if_none_match.contains_weak(variant):
+            return variant
+    return None
+
+def _compressor(encoding):
+    """Returns (compress, flush, finish) functions for a streaming compressor."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return (compressor.process, compressor.flush, compressor.finish)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return (compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush)
+
+def _compressed_chunks(chunks, encoding, charset):
+    (compress, flush, finish) = _compressor(encoding)
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode(charset)
+        if chunk:
+            # Each chunk is flushed, so that a streamed page still arrives a part at a time
+            yield compress(chunk) + flush()
+    yield finish()
+
+def compress(response, accept_encodings):
+    """Compresses the body of a successful text, JSON or SVG response with the best content coding
+    the client accepts (a werkzeug Accept). A streamed response is compressed as it's sent. Any
+    entity tag is given the coding as a suffix, so that each coding of the body has its own tag."""
+    if response.direct_passthrough or not (response.mimetype.startswith('text/') or response.mimetype in COMPRESSIBLE_TYPES):
+        return response
+    if response.status_code in (200, 304):
+        # Also for bodies which were compressed already, e.g. those from the response cache
+        response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    encoding = accept_encodings.best_match(encodings())
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compressed_chunks(response.response, encoding, response.charset)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(b''.join(_compressed_chunks([data], encoding, response.charset)))
+    response.headers['Content-Encoding'] = encoding
+    (tag, weak) = response.get_etag()
+    if tag:
+        response.set_etag('{0}-{1}'.format(tag, encoding), weak)
+    return response
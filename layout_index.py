@@ -0,0 +1,258 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import binascii
+from itertools import islice
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import pygit2
+import graph
+import ggutils
+
+# Number of rows between the stored states of the branches
+PAGE_SIZE = 100
+# Size of a raw SHA-1 object id
+OID_SIZE = 20
+# A position record is an object id followed by the row it's on
+POSITION = struct.Struct(str('>20sI'))
+# The number of boundary records in a lanes file
+COUNT = struct.Struct(str('>I'))
+# A boundary record is the row the branches are stored for, then the offset and length of the
+# JSON list of them in the lanes file
+BOUNDARY = struct.Struct(str('>III'))
+# Bytes of indexes kept for each repository, unless another limit is given
+MAX_BYTES = 1024 * 1024 * 1024
+
+# Paths of the indexes being built in background threads
+_building = set()
+_building_lock = threading.Lock()
+
+class LayoutIndex(object):
+    """An on-disk index of the graph drawn from a given tip commit. As history is immutable,
+    the order of the rows and the position of the branches never change for a tip, so the
+    index stores them once and any page of the graph can then be drawn without a revwalk.
+
+    For each tip there are three files: <tip>.rows holding the raw object id of the commit on
+    each row of the graph, <tip>.positions holding the row of each commit sorted by object id,
+    and <tip>.lanes holding the branches at the top of every page. The lanes file starts with a
+    BOUNDARY record for each page, sorted by row, so a page's branches are found without reading
+    the others. Once the files take up more than max_bytes, the indexes of the tips which were used
+    least recently are removed."""
+    def __init__(self, repo, path, max_bytes=MAX_BYTES):
+        self.repo = repo
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _rows_path(self, tip):
+        return os.path.join(self.path, '{0}.rows'.format(tip))
+
+    def _positions_path(self, tip):
+        return os.path.join(self.path, '{0}.positions'.format(tip))
+
+    def _lanes_path(self, tip):
+        return os.path.join(self.path, '{0}.lanes'.format(tip))
+
+    def _indexed_tips(self):
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return set()
+        return set(name[:-6] for name in names if name.endswith('.lanes'))
+
+    def _load_boundaries(self, tip):
+        with open(self._lanes_path(tip), 'rb') as f:
+            data = f.read()
+        boundaries = []
+        for i in range(COUNT.unpack_from(data)[0]):
+            (row, offset, length) = BOUNDARY.unpack_from(data, COUNT.size + i * BOUNDARY.size)
+            boundaries.append((row, json.loads(data[offset:offset + length].decode('utf-8'))))
+        return boundaries
+
+    def _write_lanes(self, tip, boundaries):
+        encoded = [json.dumps(lanes).encode('utf-8') for (_, lanes) in boundaries]
+        records = []
+        offset = COUNT.size + len(boundaries) * BOUNDARY.size
+        for ((row, _), data) in zip(boundaries, encoded):
+            records.append(BOUNDARY.pack(row, offset, len(data)))
+            offset += len(data)
+        self._write_atomic(self._lanes_path(tip), lambda f: f.write(COUNT.pack(len(boundaries)) + b''.join(records) + b''.join(encoded)))
+
+    def _write_atomic(self, final_path, write):
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.rename(tmp_path, final_path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def has(self, tip):
+        return os.path.exists(self._lanes_path(tip))
+
+    def use(self, tip):
+        """Marks the index of tip as just used, so it's among the last to be removed. Returns
+        whether tip is indexed."""
+        try:
+            os.utime(self._lanes_path(tip), None)
+        except OSError:
+            return False
+        return True
+
+    def prune(self, keep=None):
+        """Removes the least recently used indexes, other than that of keep, until the files take
+        up at most max_bytes."""
+        tips = {}
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            (tip, ext) = os.path.splitext(name)
+            if ext not in ('.rows', '.positions', '.lanes'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            (used, size) = tips.get(tip, (0, 0))
+            # An index is as recently used as its lanes file, or its other files if it's incomplete
+            used = stat.st_mtime if ext == '.lanes' else max(used, stat.st_mtime)
+            tips[tip] = (used, size + stat.st_size)
+        total = sum(size for (_, size) in tips.values())
+        for (used, tip) in sorted((used, tip) for (tip, (used, _)) in tips.items()):
+            if total <= self.max_bytes:
+                break
+            if tip == keep:
+                continue
+            # The lanes file goes first, so the index no longer counts as complete
+            for path in (self._lanes_path(tip), self._rows_path(tip), self._positions_path(tip)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= tips[tip][1]
+
+    def build_in_background(self, tip, max_rows=None):
+        """Starts indexing tip in a thread with its own repository, unless the index is already
+        being built by this process."""
+        with _building_lock:
+            if self.path in _building:
+                return
+            _building.add(self.path)
+        def build():
+            try:
+                LayoutIndex(pygit2.Repository(self.repo.path), self.path, self.max_bytes).build(tip, max_rows)
+            finally:
+                with _building_lock:
+                    _building.discard(self.path)
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+
+    def build(self, tip, max_rows=None):
+        """Indexes the graph drawn from tip, unless it's already indexed. If the walk reaches the tip
+        of another index at a point where it's the only branch left (e.g. the branch has been
+        fast-forwarded), only the new commits are laid out and the rest of the old index is
+        spliced on after them. If max_rows is given, only that many rows are indexed."""
+        if self.has(tip):
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        indexed = self._indexed_tips()
+        grapher = graph.Grapher()
+        boundaries = []
+        rows = []
+        splice = []
+        def walk_until_splice():
+            for (row, commit) in enumerate(islice(self.repo.walk(self.repo[tip].oid, pygit2.GIT_SORT_TIME), max_rows)):
+                if row and commit.hex in indexed and grapher.branches.width == 1 and grapher.branches[0] == commit.hex:
+                    # The rest of the graph is the same as the one drawn from this commit
+                    splice.append(commit.hex)
+                    return
+                if row % PAGE_SIZE == 0:
+                    boundaries.append((row, list(grapher.branches)))
+                rows.append(binascii.unhexlify(commit.hex))
+                yield commit
+        branches = grapher.follow_commits(walk_until_splice())
+        if splice:
+            new_rows = len(rows)
+            for (old_row, lanes) in self._load_boundaries(splice[0]):
+                if old_row == 0:
+                    # The spliced graph continues the branch from above
+                    lanes = branches
+                if max_rows is None or old_row + new_rows < max_rows:
+                    boundaries.append((old_row + new_rows, lanes))
+            with open(self._rows_path(splice[0]), 'rb') as f:
+                old_rows = f.read() if max_rows is None else f.read((max_rows - new_rows) * OID_SIZE)
+        else:
+            old_rows = b''
+        self._write_atomic(self._rows_path(tip), lambda f: (f.write(b''.join(rows)), f.write(old_rows)))
+        self._write_positions(tip)
+        # The lanes file is written last, as its presence marks the index as complete.
+        self._write_lanes(tip, boundaries)
+        self.prune(tip)
+
+    def _write_positions(self, tip):
+        with open(self._rows_path(tip), 'rb') as f:
+            rows = f.read()
+        oids = sorted((rows[i:i+OID_SIZE], i // OID_SIZE) for i in range(0, len(rows), OID_SIZE))
+        self._write_atomic(self._positions_path(tip), lambda f: f.write(b''.join(POSITION.pack(*oid) for oid in oids)))
+
+    def position(self, tip, sha):
+        """Returns the row of the graph drawn from tip which the given commit is on, or None if the
+        commit isn't reachable from tip."""
+        if not os.path.exists(self._positions_path(tip)):
+            self._write_positions(tip)
+        try:
+            oid = binascii.unhexlify(sha)
+        except (TypeError, ValueError):
+            return None
+        with open(self._positions_path(tip), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            positions = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                found = ggutils.find_record(positions, oid, POSITION)
+            finally:
+                positions.close()
+        return found[1] if found else None
+
+    def length(self, tip):
+        """Returns the number of rows in the graph drawn from tip."""
+        return os.path.getsize(self._rows_path(tip)) // OID_SIZE
+
+    def rows(self, tip, start, stop):
+        """Returns the SHA hashes of the commits on rows start to stop (exclusive) of the graph."""
+        with open(self._rows_path(tip), 'rb') as f:
+            f.seek(start * OID_SIZE)
+            data = f.read(max(stop - start, 0) * OID_SIZE)
+        return [binascii.hexlify(data[i:i+OID_SIZE]).decode('ascii') for i in range(0, len(data), OID_SIZE)]
+
+    def commits(self, tip, start, stop):
+        """Returns the commit objects on rows start to stop (exclusive) of the graph."""
+        return [self.repo[sha] for sha in self.rows(tip, start, stop)]
+
+    def branches_at(self, tip, row):
+        """Returns the branches at the top of the given row of the graph, i.e. the existing
+        branches needed to draw the graph starting from that row."""
+        with open(self._lanes_path(tip), 'rb') as f:
+            # Find the last boundary at or above the row; the first is always row 0
+            (low, high) = (0, COUNT.unpack(f.read(COUNT.size))[0])
+            while high - low > 1:
+                middle = (low + high) // 2
+                f.seek(COUNT.size + middle * BOUNDARY.size)
+                if BOUNDARY.unpack(f.read(BOUNDARY.size))[0] <= row:
+                    low = middle
+                else:
+                    high = middle
+            f.seek(COUNT.size + low * BOUNDARY.size)
+            (start, offset, length) = BOUNDARY.unpack(f.read(BOUNDARY.size))
+            f.seek(offset)
+            lanes = json.loads(f.read(length).decode('utf-8'))
+        if start == row:
+            return lanes
+        return graph.Grapher().follow_commits(self.commits(tip, start, row), lanes)
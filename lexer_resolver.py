@@ -0,0 +1,117 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import fnmatch
+import posixpath
+import threading
+# Lexers are taken in the order guess_lexer_for_filename tries them, which breaks its ties
+from pygments.lexers import _iter_lexerclasses
+from pygments.util import ClassNotFound
+import ggutils
+
+# Characters of the text looked at when the lexer has to be guessed from the content
+GUESS_PREFIX = 8192
+WILDCARDS = '*?['
+
+class LexerResolver(object):
+    """Finds the Pygments lexer for a file as guess_lexer_for_filename does, but without matching the
+    file name against every lexer's patterns or analysing the whole of the text each time.
+
+    The patterns of all the lexers are put into tables of whole file names and of the suffixes
+    matched by patterns like *.py once, when the first file is resolved. Content is only analysed
+    when several lexers match the name, or there's no name, and then only its first GUESS_PREFIX
+    characters. The lexers matching each file name are kept, so later files with the same name only
+    have their content analysed if it's needed to choose between them."""
+    def __init__(self, cache_size=4096):
+        self._filenames = ggutils.LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._names = None
+
+    def _build(self):
+        if self._names is not None:
+            return
+        with self._lock:
+            if self._names is not None:
+                return
+            lexers = []
+            names = {}
+            suffixes = {}
+            patterns = []
+            for (order, lexer) in enumerate(_iter_lexerclasses()):
+                lexers.append(lexer)
+                for (primary, filenames) in ((True, lexer.filenames), (False, lexer.alias_filenames)):
+                    for pattern in filenames:
+                        match = (order, primary, lexer)
+                        if not any(c in pattern for c in WILDCARDS):
+                            names.setdefault(pattern, []).append(match)
+                        elif pattern.startswith('*') and not any(c in pattern[1:] for c in WILDCARDS):
+                            suffixes.setdefault(pattern[1:], []).append(match)
+                        else:
+                            patterns.append((pattern, match))
+            self._lexers = lexers
+            self._suffixes = suffixes
+            self._patterns = patterns
+            self._names = names
+
+    def _matches(self, filename):
+        self._build()
+        matches = set(self._names.get(filename, ()))
+        for i in range(len(filename) + 1):
+            matches.update(self._suffixes.get(filename[i:], ()))
+        for (pattern, match) in self._patterns:
+            if fnmatch.fnmatch(filename, pattern):
+                matches.add(match)
+        return matches
+
+    def _best(self, matches, text):
+        if len(set(lexer for (_, _, lexer) in matches)) == 1:
+            return next(iter(matches))[2]
+        prefix = text[:GUESS_PREFIX]
+        primaries = sorted((order, lexer) for (order, primary, lexer) in matches if primary)
+        best = (0.0, None)
+        for (order, _, lexer) in sorted(matches):
+            score = lexer.analyse_text(prefix)
+            if score == 1.0:
+                return lexer
+            if score >= best[0]:
+                best = (score, lexer)
+        if not best[0] and primaries:
+            return primaries[-1][1]
+        return best[1]
+
+    def lexer_class(self, path, text):
+        """Returns the lexer class for a file's path and text, raising ClassNotFound if no lexer
+        handles files with that name."""
+        filename = posixpath.basename(path)
+        matches = self._filenames.get(filename)
+        if matches is None:
+            matches = self._matches(filename)
+            self._filenames[filename] = matches
+        if not matches:
+            raise ClassNotFound('no lexer for filename {0!r} found'.format(path))
+        # Where several lexers match, each file's content decides, as it may differ between versions
+        return self._best(matches, text)
+
+    def guess_class(self, text):
+        """Returns the lexer class which best recognises the start of the text, raising
+        ClassNotFound if none does."""
+        self._build()
+        prefix = text[:GUESS_PREFIX]
+        best = (0.0, None)
+        for lexer in self._lexers:
+            score = lexer.analyse_text(prefix)
+            if score == 1.0:
+                return lexer
+            if score > best[0]:
+                best = (score, lexer)
+        if best[1] is None:
+            raise ClassNotFound('no lexer matching the text found')
+        return best[1]
+
+_resolver = LexerResolver()
+
+def get_lexer(name, text, **options):
+    """Returns a lexer for a file's text, from its name if given, as guess_lexer_for_filename or
+    guess_lexer would. Raises ClassNotFound if there's no lexer for it."""
+    if name:
+        return _resolver.lexer_class(name, text)(**options)
+    return _resolver.guess_class(text)(**options)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import pygit2
+import commit_graph
+import graph
+
+# Offset of a row's labels in the strings file, then the lengths of its message, author and date
+INDEX = struct.Struct(str('<QHHH'))
+# Longest label stored, in bytes
+MAX_LENGTH = 0xffff
+# Number of rows decoded between each time the new rows are made visible
+BATCH_SIZE = 10000
+
+# Paths of the stores being updated in background threads
+_updating = set()
+_updating_lock = threading.Lock()
+
+class MetadataStore(object):
+    """Decoded labels for every commit in a CommitGraph, so that drawing the graph doesn't have to
+    decode each commit's message and author or format its date.
+
+    The store is kept alongside the commit graph and uses its rows. The strings file holds the UTF-8
+    message, author and date labels of each row one after another, the index file holds an INDEX
+    record per row saying where they are, and metadata.json holds the number of rows stored and the
+    build of the commit graph they're from. Like the commit graph, rows are only appended and the
+    files are read through mmap; when the commit graph is built again, so is the store, in files
+    named after the new build. Dates are formatted in the server's local time when they're stored."""
+    def __init__(self, repo, commits, path):
+        self.repo = repo
+        self.commits = commits
+        self.path = path
+        self._header = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name, build):
+        return self._file('{0}-{1}'.format(name, build))
+
+    def _map(self, name, build):
+        if build is None:
+            return b''
+        try:
+            f = open(self._data_file(name, build), 'rb')
+        except IOError:
+            return b''
+        with f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load(self):
+        if self._header is not None:
+            return
+        try:
+            with open(self._file('metadata.json')) as f:
+                self._header = json.load(f)
+        except IOError:
+            self._header = {'rows': 0, 'bytes': 0}
+        if self._header.get('build') != self.commits.build:
+            # The rows are of an old build of the commit graph
+            self._header = {'rows': 0, 'bytes': 0, 'build': self.commits.build}
+        self._index = self._map('index', self._header.get('build'))
+        self._strings = self._map('strings', self._header.get('build'))
+        if self._header['rows'] and not (self._index and self._strings):
+            # The store was built again after metadata.json was read, and these files are gone
+            self.close()
+            self._header = {'rows': 0, 'bytes': 0, 'build': self.commits.build}
+            (self._index, self._strings) = (b'', b'')
+
+    def close(self):
+        """Unmaps the files. They're mapped again when the store is next used."""
+        if self._header is None:
+            return
+        for data in (self._index, self._strings):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self._header = None
+
+    def __len__(self):
+        self._load()
+        return self._header['rows']
+
+    def labels(self, commit):
+        """Returns the message, author and date labels of a commit, as graph.commit_labels does.
+        Commits which aren't in the store yet are decoded."""
+        self._load()
+        row = self.commits.row(commit.hex)
+        if row is None or row >= self._header['rows']:
+            return graph.commit_labels(commit)
+        (offset, message, author, date) = INDEX.unpack_from(self._index, row * INDEX.size)
+        labels = []
+        for length in (message, author, date):
+            labels.append(self._strings[offset:offset + length].decode('utf-8', 'ignore'))
+            offset += length
+        return tuple(labels)
+
+    def update(self):
+        """Stores the labels of the commits in the commit graph which aren't stored yet."""
+        if len(self) >= len(self.commits):
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self._file('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have updated the store while we waited
+            self.close()
+            self._load()
+            header = dict(self._header)
+            self.close()
+            while header['rows'] < len(self.commits):
+                stop = min(header['rows'] + BATCH_SIZE, len(self.commits))
+                header = self._append(header, header['rows'], stop)
+            # Other builds' files are only kept by the processes which have mapped them
+            for name in os.listdir(self.path):
+                (base, _, build) = name.partition('-')
+                if base in ('index', 'strings') and build != header['build']:
+                    os.remove(self._file(name))
+
+    def _append(self, header, start, stop):
+        index = []
+        strings = []
+        offset = header['bytes']
+        for row in range(start, stop):
+            labels = [label.encode('utf-8')[:MAX_LENGTH] for label in graph.commit_labels(self.repo[self.commits.sha(row)])]
+            index.append(INDEX.pack(offset, *[len(label) for label in labels]))
+            strings.extend(labels)
+            offset += sum(len(label) for label in labels)
+        # Anything after what the header counts is left over from an interrupted update
+        for (name, length, data) in (('index', start * INDEX.size, index),
+                                     ('strings', header['bytes'], strings)):
+            with os.fdopen(os.open(self._data_file(name, header['build']), os.O_RDWR | os.O_CREAT), 'r+b') as f:
+                f.truncate(length)
+                f.seek(length)
+                f.write(b''.join(data))
+        # The header is written last, as it's what makes the new rows visible
+        header = {'rows': stop, 'bytes': offset, 'build': header.get('build')}
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8'))
+        os.rename(tmp_path, self._file('metadata.json'))
+        return header
+
+    def update_in_background(self, tips=()):
+        """Starts updating the store in a thread with its own repository and commit graph, unless
+        it's already being updated by this process. The commit graph is first updated with the
+        commits reachable from tips."""
+        with _updating_lock:
+            if self.path in _updating:
+                return
+            _updating.add(self.path)
+        def update():
+            try:
+                repo = pygit2.Repository(self.repo.path)
+                commits = commit_graph.CommitGraph(repo, self.commits.path)
+                commits.update(list(tips))
+                MetadataStore(repo, commits, self.path).update()
+            finally:
+                with _updating_lock:
+                    _updating.discard(self.path)
+        thread = threading.Thread(target=update)
+        thread.daemon = True
+        thread.start()
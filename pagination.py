@@ -0,0 +1,54 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import uuid
+import ggutils
+
+class Cursor(object):
+    """The state needed to continue drawing a graph where a previous page left off:
+    the (partially consumed) walker and the branches at the bottom of the page.
+    release, if given, is called when the walker is no longer needed, e.g. to return
+    the repository it walks to a pool."""
+    def __init__(self, head, offset, walker, branches, release=None):
+        self.head = head
+        self.offset = offset
+        self.walker = walker
+        self.branches = list(branches)
+        self.release = release
+
+    def close(self):
+        if self.release is not None:
+            self.release()
+            self.release = None
+
+class CursorStore(object):
+    """Keeps the most recently issued graph cursors, so that loading the next page
+    of a graph can continue the revwalk instead of starting again from the head.
+    Cursors are single-use; once resumed they are removed from the store. Cursors
+    which are dropped without being resumed are closed."""
+    def __init__(self, maxsize=64):
+        self.cursors = ggutils.LRUCache(maxsize, lambda cursor: cursor.close())
+
+    def save(self, head, offset, walker, branches, release=None):
+        """Stores a cursor and returns the opaque token which identifies it."""
+        token = uuid.uuid4().hex
+        self.cursors[token] = Cursor(head, offset, walker, branches, release)
+        return token
+
+    def resume(self, token, head, offset, branches):
+        """Returns the cursor for the given token, with its walker positioned at offset,
+        or None if the cursor has been evicted or doesn't match the requested page. The
+        caller closes the cursor once it's done with the walker."""
+        cursor = self.cursors.pop(token)
+        if cursor is None:
+            return None
+        if cursor.head != head or cursor.offset != offset or cursor.branches != list(branches):
+            cursor.close()
+            return None
+        return cursor
+
+    def discard(self, token):
+        """Drops the cursor for the given token, if it's still held, e.g. when the page it
+        continues to has been drawn without it."""
+        cursor = self.cursors.pop(token)
+        if cursor is not None:
+            cursor.close()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from collections import OrderedDict
+import logging
+import Queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+class _Job(object):
+    def __init__(self, function):
+        self.function = function
+        self.started = False
+        self.cancelled = False
+        self.done = threading.Event()
+        self.value = None
+        # Set when the job is done, as finished values are only held for a while
+        self.expires = None
+
+class Prefetcher(object):
+    """Works out values ahead of time in a few background threads, e.g. the next page of the graph
+    while the current one is being looked at, and holds each until it's taken or ttl seconds pass.
+
+    At most workers jobs run at once and max_queued wait for a thread, so prefetching can't take
+    over the process from requests; jobs submitted past that are dropped. At most max_items
+    finished values are held."""
+    def __init__(self, workers=2, max_queued=8, ttl=60, max_items=64):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._jobs = OrderedDict()
+        self._queue = Queue.Queue(max_queued)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, key, function):
+        """Calls function() in the background and holds its value for take(key). Returns False if
+        the job was dropped, or a job for key is already held."""
+        if self.workers <= 0:
+            return False
+        job = _Job(function)
+        with self._lock:
+            self._expire()
+            if key in self._jobs:
+                return False
+            try:
+                self._queue.put_nowait((key, job))
+            except Queue.Full:
+                return False
+            self._jobs[key] = job
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return True
+
+    def take(self, key, timeout=None):
+        """Returns the value worked out for key and stops holding it, or None if there isn't one.
+        A job which is running is waited for, for at most timeout seconds; one which hasn't started
+        is cancelled, as the caller may as well do it itself."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is None or not job.started:
+                if job is not None:
+                    job.cancelled = True
+                    del self._jobs[key]
+                self.misses += 1
+                return None
+        if not job.done.wait(timeout):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+            if job.value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return job.value
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _expire(self):
+        now = time.time()
+        for (key, job) in list(self._jobs.items()):
+            if job.expires is not None and job.expires < now:
+                del self._jobs[key]
+        finished = [key for (key, job) in self._jobs.items() if job.expires is not None]
+        for key in finished[:max(0, len(finished) - self.max_items)]:
+            del self._jobs[key]
+
+    def _work(self):
+        while True:
+            (key, job) = self._queue.get()
+            with self._lock:
+                if job.cancelled:
+                    continue
+                job.started = True
+            try:
+                job.value = job.function()
+            except Exception:
+                log.exception('Prefetching %r failed', key)
+            with self._lock:
+                job.expires = time.time() + self.ttl
+                self._expire()
+            job.done.set()
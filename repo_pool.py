@@ -0,0 +1,108 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from collections import OrderedDict
+import os
+import threading
+import pygit2
+
+# Files and directories under a repository's git directory which change when its refs are
+# updated or packs are added or removed
+WATCHED_PATHS = ('HEAD', 'packed-refs', 'refs', os.path.join('refs', 'heads'), os.path.join('refs', 'tags'),
+                 os.path.join('refs', 'remotes'), os.path.join('objects', 'pack'))
+
+def set_cache_size(max_bytes):
+    """Sets the size of libgit2's object cache, shared by every repository in the process, if
+    this version of pygit2 can. Returns whether it was set."""
+    settings = getattr(pygit2, 'settings', None)
+    if settings is None or not hasattr(settings, 'cache_max_size'):
+        return False
+    settings.cache_max_size(max_bytes)
+    return True
+
+class _Handles(object):
+    """The idle handles for one repository, and the state of its git directory when they were opened."""
+    def __init__(self):
+        self.git_dir = None
+        self.state = None
+        self.idle = []
+
+class RepositoryPool(object):
+    """A thread-safe pool of open pygit2 Repository handles, so that each request can use a
+    repository without opening it again and losing libgit2's object cache and mapped pack indexes.
+
+    A handle is only used by one thread at a time: acquire() takes an idle one (or opens one) and
+    release() returns it, so anything which goes on using it, such as a revwalk kept for the next
+    page of a graph, must keep it checked out. Up to max_idle idle handles are kept for each path.
+    When the refs or packs in the git directory have changed since the idle handles were opened,
+    they're dropped and a new handle is opened, so new packs are seen. If max_repos is set, only the handles of that
+    many of the most recently used repositories are kept."""
+    def __init__(self, max_idle=8, max_repos=None):
+        self.max_idle = max_idle
+        self.max_repos = max_repos
+        self.opened = 0
+        self.reused = 0
+        self._repos = OrderedDict()
+        self._in_use = {}
+        self._lock = threading.Lock()
+
+    def _state(self, git_dir):
+        state = []
+        for name in WATCHED_PATHS:
+            try:
+                stat = os.stat(os.path.join(git_dir, name))
+            except OSError:
+                state.append(None)
+            else:
+                state.append((stat.st_mtime, stat.st_size, stat.st_ino))
+        return tuple(state)
+
+    def acquire(self, path):
+        """Returns a Repository for path, which only the caller uses until it's released."""
+        with self._lock:
+            handles = self._repos.pop(path, None) or _Handles()
+            self._repos[path] = handles
+            if self.max_repos is not None:
+                while len(self._repos) > self.max_repos:
+                    # Handles of this repository still in use are closed when they're released
+                    self._repos.popitem(last=False)
+            git_dir = handles.git_dir
+        repo = None
+        if git_dir is not None:
+            state = self._state(git_dir)
+            with self._lock:
+                if handles.state != state:
+                    del handles.idle[:]
+                    handles.state = state
+                elif handles.idle:
+                    self.reused += 1
+                    repo = handles.idle.pop()
+        if repo is None:
+            repo = pygit2.Repository(path)
+            with self._lock:
+                self.opened += 1
+                if handles.git_dir is None:
+                    handles.git_dir = repo.path
+                    handles.state = self._state(repo.path)
+        with self._lock:
+            # The handle is only taken back if nothing has changed by the time it's released
+            self._in_use[id(repo)] = handles.state
+        return repo
+
+    def release(self, path, repo):
+        """Returns a Repository taken from acquire(path) to the pool."""
+        with self._lock:
+            state = self._in_use.pop(id(repo), None)
+            handles = self._repos.get(path)
+            if handles is not None and state == handles.state and len(handles.idle) < self.max_idle:
+                handles.idle.append(repo)
+
+    def clear(self):
+        with self._lock:
+            self._repos.clear()
+
+    def stats(self):
+        """Returns the number of handles opened and reused, how many are idle, and the number of
+        repositories they're for."""
+        with self._lock:
+            return {'opened': self.opened, 'reused': self.reused, 'repos': len(self._repos),
+                    'idle': sum(len(handles.idle) for handles in self._repos.values())}
@@ -0,0 +1,175 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+
+class MemoryTier(object):
+    """A thread-safe LRU of cached responses held in this process, up to max_bytes of bodies."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[2])
+            self._items[key] = value
+            self._bytes += len(value[2])
+            while self._bytes > self.max_bytes and self._items:
+                (_, old) = self._items.popitem(last=False)
+                self._bytes -= len(old[2])
+
+    def __len__(self):
+        return len(self._items)
+
+class FileTier(object):
+    """Cached responses stored as files in a directory, named by their keys, which every process
+    using the directory shares. Reading a file marks it as recently used, and the least recently
+    used files are removed when they take up more than max_bytes."""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                (content_type, content_encoding) = f.readline().decode('utf-8').rstrip('\n').split('\t')
+                body = f.read()
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return (content_type, content_encoding or None, body)
+
+    def put(self, key, value):
+        (content_type, content_encoding, body) = value
+        path = self._path(key)
+        # The response for a key never changes, so a file which is already there is up to date
+        if os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Made by another thread or process in the meantime
+                pass
+        (fd, tmp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write('{0}\t{1}\n'.format(content_type, content_encoding or '').encode('utf-8'))
+                f.write(body)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for (_, size, _) in self._files())
+            else:
+                self._bytes += len(body)
+            if self._bytes > self.max_bytes:
+                self._prune()
+
+    def _files(self):
+        for (directory, _, names) in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield (stat.st_mtime, stat.st_size, path)
+
+    def _prune(self):
+        # Remove the least recently used files until there's room for a while again
+        files = sorted(self._files())
+        total = sum(size for (_, size, _) in files)
+        for (_, size, path) in files:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self._bytes = total
+
+class ResponseCache(object):
+    """Caches the bodies of responses which are known by their entity tags. The tags are made from
+    the SHAs of everything a response shows, so a cached body never goes stale, and a response can
+    be taken from the cache by anything which knows its tag.
+
+    tiers are searched in order; each has get(key) and put(key, value), where a value is a tuple
+    (content_type, content_encoding, body). A body found in a later tier is copied into the earlier
+    ones. Responses with bodies larger than max_item_bytes aren't stored."""
+    def __init__(self, tiers, max_item_bytes):
+        self.tiers = tiers
+        self.max_item_bytes = max_item_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns (content_type, content_encoding, body) for a key, or None."""
+        for (index, tier) in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for earlier in self.tiers[:index]:
+                    earlier.put(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if len(value[2]) <= self.max_item_bytes:
+            for tier in self.tiers:
+                tier.put(key, value)
+
+    def store(self, response):
+        """Stores the body of a successful response under its entity tag. A streamed response is
+        stored once all of it has been sent."""
+        (key, weak) = response.get_etag()
+        if response.status_code != 200 or key is None or weak:
+            return response
+        content_type = response.headers.get('Content-Type')
+        content_encoding = response.headers.get('Content-Encoding')
+        if response.is_streamed:
+            response.response = self._tee(key, content_type, content_encoding, response.response, response.charset)
+        else:
+            self.put(key, (content_type, content_encoding, response.get_data()))
+        return response
+
+    def _tee(self, key, content_type, content_encoding, chunks, charset):
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode(charset)
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_item_bytes:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        # Only reached if the whole body was sent
+        if parts is not None:
+            self.put(key, (content_type, content_encoding, b''.join(parts)))
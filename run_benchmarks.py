@@ -0,0 +1,11 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import importlib
+import sys
+
+names = ['lanes', 'display_list', 'decode', 'tree_listing', 'tree_diff', 'highlight', 'lexers', 'diff_engines', 'commit_ttfb', 'tree_json', 'http_cache', 'response_cache', 'repo_pool', 'prefetch']
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or names:
+        importlib.import_module('benchmarks.bench_{0}'.format(name)).main()
+        print('')
@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 import unittest
 import sys
 
-names = ['tree_diff', 'get_objs']
+names = ['ggutils', 'tree_diff', 'diff_engines', 'get_objs', 'pagination', 'layout_index', 'commit_graph', 'metadata_store', 'highlight_cache', 'http_cache', 'response_cache', 'repo_pool', 'hosted_repo', 'prefetch', 'lexer_resolver', 'graph', 'svg_writer']
 def test_suite():
     modules = ['tests.test_{0}'.format(n) for n in names]
     return unittest.defaultTestLoader.loadTestsFromNames(modules)
@@ -24,12 +24,23 @@ function eraseCookie(name) {
   setCookie(name,"",-1);
 }
 
+// URLs within the repository being shown, which may be served below a prefix
+function appURL(path) {
+  return gitgraph.base_url + path;
+}
+
 function getTreeJSON(node, result) {
   if(node == -1) {
     result(gitgraph.initial_tree);
   } else {
     var sha = $(node).children('a').attr('href').substring(1);
-    $.getJSON('/sha/' + sha, $.param({'parent_name': $(node).data('full_name')}), result);
+    var data = {'parent_name': $(node).data('full_name')};
+    var compare_to = $(node).data('old_sha');
+    if(compare_to) {
+      //Modified directories are expanded as a diff against the old tree
+      data.compare_to = compare_to;
+    }
+    $.getJSON(appURL('sha/' + sha), $.param(data), result);
   }
 }
 
@@ -142,11 +153,11 @@ $(document).ajaxStop(function() {
 
 function getHeadGraphURL() {
   if(gitgraph.current_ref) {
-    return '/' + gitgraph.current_ref;
+    return appURL(gitgraph.current_ref);
   } else if(gitgraph.current_head) {
-    return '/graph/' + gitgraph.current_head;
+    return appURL('graph/' + gitgraph.current_head);
   } else {
-    return '/';
+    return appURL('');
   }
 }
 
@@ -167,7 +178,7 @@ $(document).ready(function() {
   });
   
   $('#left_tree').jstree({
-    "themes" : { "theme": "apple", "url" : "/static/themes/apple/style.css", dots: false },
+    "themes" : { "theme": "apple", "url" : appURL("static/themes/apple/style.css"), dots: false },
     "json_data" : {
       "data" : getTreeJSON
     },
@@ -199,20 +210,35 @@ $(document).ready(function() {
             };
           }
           var sha_to_load = a_element.attr('href').substring(1);
-          $('#bottom_pane').load('/sha/' + sha_to_load, $.param(data));
+          $('#bottom_pane').load(appURL('sha/' + sha_to_load), $.param(data));
         }
       }
     }
   });
   
+  //Diffs left collapsed in a commit are loaded when asked for
+  $('#bottom_pane').delegate('a.load_diff', 'click', function(event) {
+    var link = $(this);
+    var data = {filename_hint: link.data('full_name')};
+    if(link.data('old_sha')) {
+      data.compare_to = link.data('old_sha');
+    }
+    link.closest('.collapsed_diff').load(appURL('sha/' + link.attr('href').substring(1)), $.param(data));
+    event.preventDefault();
+  });
+  
   setupDraggables();
   
   $('#reveal').click(function(event) {
-    $('#reveal_ajax').load(getHeadGraphURL(), $.param({offset: gitgraph.loaded_count, branches: gitgraph.existing_branches}, true));
+    $('#reveal_ajax').load(getHeadGraphURL(), $.param({
+      offset: gitgraph.loaded_count,
+      branches: gitgraph.existing_branches,
+      cursor: gitgraph.cursor || ''
+    }, true));
   });
   
   $('#find_commit').simpleAutocomp({
-    url: '/autocomplete'
+    url: appURL('autocomplete')
   });
   
   $('#current_commit_title').submit(function(event) {
@@ -227,7 +253,7 @@ $(document).ready(function() {
   });
 
   $('#ref_select').change(function() {
-    window.location.href ='/'+$('#ref_select').val();
+    window.location.href = appURL($('#ref_select').val());
   })
   
   highlight(gitgraph.current_head);
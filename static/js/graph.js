@@ -43,7 +43,7 @@ function load_commit(sha) {
       console.log("Busy loading another commit...");
     }
   } else {
-    $('#bottom_pane').load('/sha/' + sha, '', function(responseText, textStatus, jqXHR) {
+    $('#bottom_pane').load(appURL('sha/' + sha), '', function(responseText, textStatus, jqXHR) {
       if(textStatus == 'success' || textStatus == 'notmodified') {
         highlight(sha);
         scrollToCommit(sha);
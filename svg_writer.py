@@ -0,0 +1,58 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+from markupsafe import escape
+
+# Size in pixels of a row or column of the graph
+SCALE = 20
+
+SVG_OPEN = '<svg id="{0}" xmlns="http://www.w3.org/2000/svg" version="1.1" preserveAspectRatio="xMidYMid slice" width="100%" height="{1}px">'
+PATH = '\n  <path class="edge {0} parent_{1}" d="{2}" />\n'
+CIRCLE = '\n  <circle class="node {0}" id="{1}" cx="{2}" cy="{3}" r="5" fill="white" stroke="black" stroke-width="1" />\n'
+TEXT = '<text id="{0}_{1}" class="label" x="{2}" y="{3}" font-size="14">{4}</text>'
+
+def _number(value):
+    return '{0}'.format(value * SCALE)
+
+def path_data(segments):
+    """Returns the d attribute of an SVG path from its segments."""
+    parts = []
+    for segment in segments:
+        parts.append(segment['type'])
+        if 'x' in segment:
+            parts.append(_number(segment['x']) + ' ')
+        parts.append(_number(segment['y']) + ' ')
+    return ''.join(parts)
+
+def graph_elements(display_list):
+    """Yields the SVG markup of the edges, nodes and commit message labels of the graph."""
+    yield '\n'
+    for edge in display_list['edges']:
+        yield PATH.format(escape(edge['class']), escape(edge.parent), path_data(edge.d))
+    yield '\n'
+    for node in display_list['nodes']:
+        parents = ''.join(' parent_{0}'.format(escape(p)) for p in node.parents)
+        yield CIRCLE.format(parents, escape(node.id), _number(node.x), _number(node.y))
+    yield '\n'
+    for label in display_list['labels']:
+        yield '\n  ' + TEXT.format('label', escape(label.sha), _number(label.x), label.y * SCALE + 3, escape(label.content)) + '\n'
+    yield '\n'
+
+def label_elements(labels, prefix):
+    """Yields the SVG markup of a column of labels, such as the authors or dates."""
+    for label in labels:
+        yield '\n  ' + TEXT.format(prefix, escape(label.sha), _number(label.x), label.y * SCALE + 3, escape(label.content)) + '\n  '
+
+def graph_page(display_list, tail):
+    """Yields the markup of a page of the graph loaded by AJAX, as the graphonly.html template used
+    to render it, followed by whatever the tail function returns."""
+    yield SVG_OPEN.format('ajax_graph_svg', len(display_list['nodes']) * SCALE) + '\n  '
+    for fragment in graph_elements(display_list):
+        yield fragment
+    yield '\n</svg>\n'
+    for (key, prefix) in (('authors', 'author'), ('dates', 'date')):
+        labels = display_list[key]
+        yield SVG_OPEN.format('ajax_{0}_svg'.format(key), len(labels) * SCALE) + '\n  '
+        for fragment in label_elements(labels, prefix):
+            yield fragment
+        yield '\n</svg>\n'
+    yield tail()
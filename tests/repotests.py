@@ -0,0 +1,40 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import tempfile
+import subprocess
+import os
+import shutil
+
+class RepoTestCase(unittest.TestCase):
+    """A test case run in a new git repository, made in the working directory. Each git command is
+    run a minute after the last, so that commits are always walked in the same order."""
+    def setUp(self):
+        self.repo_path = tempfile.mkdtemp()
+        self.old_path = os.getcwd()
+        self.commit_time = 1300000000
+        os.chdir(self.repo_path)
+        self.git('init', '-q')
+
+    def tearDown(self):
+        os.chdir(self.old_path)
+        shutil.rmtree(self.repo_path)
+
+    def git(self, *args, **kwargs):
+        """Runs git with a fixed author and committer, and returns its output. The author's name can
+        be given as author."""
+        self.commit_time += 60
+        date = '{0} +0000'.format(self.commit_time)
+        env = dict(os.environ, GIT_AUTHOR_NAME=kwargs.get('author', 'Test').encode('utf-8'), GIT_AUTHOR_EMAIL='test@example.com',
+            GIT_AUTHOR_DATE=date, GIT_COMMITTER_NAME='Test', GIT_COMMITTER_EMAIL='test@example.com', GIT_COMMITTER_DATE=date)
+        git = subprocess.Popen(('git',) + tuple(arg.encode('utf-8') for arg in args), stdout=subprocess.PIPE, env=env)
+        (output,_) = git.communicate()
+        return output.strip().decode('utf-8')
+
+    def commit(self, name, message=None, author='Test'):
+        """Commits a file called name, containing its name, and returns the commit's SHA."""
+        with open(name,'w') as f:
+            f.write(name)
+        self.git('add', name)
+        self.git('commit', '-q', '-m', message or name, author=author)
+        return self.git('rev-parse', 'HEAD')
@@ -0,0 +1,123 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import os
+import pygit2
+import commit_graph
+from tests.repotests import RepoTestCase
+
+class CommitGraphTest(RepoTestCase):
+    def _open(self):
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        return commit_graph.CommitGraph(self.repo, os.path.join(self.repo_path, 'commit-graph'))
+
+    def setUp(self):
+        super(CommitGraphTest, self).setUp()
+        # root - a1 - a2 ------- merge - octopus
+        #     \           /           /  /
+        #      b1 ---- b2            c1 d1
+        self.root = self.commit('root')
+        self.git('branch', 'b')
+        self.a1 = self.commit('a1')
+        self.a2 = self.commit('a2')
+        self.git('checkout', '-q', 'b')
+        self.b1 = self.commit('b1')
+        self.b2 = self.commit('b2')
+        self.git('checkout', '-q', 'master')
+        self.git('merge', '-q', '--no-ff', '-m', 'merge', 'b')
+        self.merge = self.git('rev-parse', 'HEAD')
+        self.git('checkout', '-q', '-b', 'c', self.root)
+        self.c1 = self.commit('c1')
+        self.git('checkout', '-q', '-b', 'd', self.root)
+        self.d1 = self.commit('d1')
+        self.git('checkout', '-q', 'master')
+        self.git('merge', '-q', '--no-ff', '-m', 'octopus', 'c', 'd')
+        self.octopus = self.git('rev-parse', 'HEAD')
+
+    def test_graph(self):
+        graph = self._open()
+        graph.update([self.octopus])
+        self.assertEqual(len(graph), 9)
+        self.assertEqual(graph.generation(self.root), 1)
+        self.assertEqual(graph.generation(self.merge), 4)
+        self.assertEqual(graph.generation(self.octopus), 5)
+        self.assertTrue(graph.topo_position(self.a1) < graph.topo_position(self.a2) < graph.topo_position(self.merge))
+        self.assertTrue(graph.topo_position(self.d1) < graph.topo_position(self.octopus))
+        self.assertTrue(graph.is_ancestor(self.b1, self.merge))
+        self.assertTrue(graph.is_ancestor(self.d1, self.octopus))
+        self.assertTrue(graph.is_ancestor(self.merge, self.merge))
+        self.assertFalse(graph.is_ancestor(self.merge, self.b2))
+        self.assertFalse(graph.is_ancestor(self.c1, self.merge))
+        self.assertEqual(graph.merge_base(self.a2, self.b2), self.root)
+        self.assertEqual(graph.merge_base(self.merge, self.b1), self.b1)
+        self.assertEqual(graph.merge_base(self.c1, self.merge), self.root)
+        self.assertRaises(KeyError, graph.generation, '0' * 40)
+
+    def test_update(self):
+        graph = self._open()
+        graph.update([self.b2])
+        self.assertEqual(len(graph), 3)
+        self.assertFalse(self.a1 in graph)
+        graph.update([self.merge, self.c1])
+        self.assertEqual(len(graph), 7)
+        self.assertTrue(graph.is_ancestor(self.a1, self.merge))
+        # A new graph object reads what the previous one wrote
+        graph = self._open()
+        graph.update([self.octopus])
+        self.assertEqual(len(graph), 9)
+        self.assertTrue(graph.is_ancestor(self.c1, self.octopus))
+        self.assertEqual(graph.merge_base(self.c1, self.d1), self.root)
+        graph.update([self.octopus])
+        self.assertEqual(len(graph), 9)
+
+    def test_pruned_tip(self):
+        self.git('checkout', '-q', '-b', 'e', self.a1)
+        e1 = self.commit('e1')
+        graph = self._open()
+        graph.update([e1])
+        self.assertEqual(len(graph), 3)
+        # Drop the branch and prune its commit, as after a force push and gc
+        self.git('checkout', '-q', 'master')
+        self.git('branch', '-D', 'e')
+        self.git('reflog', 'expire', '--expire=now', '--all')
+        self.git('gc', '-q', '--prune=now')
+        graph = self._open()
+        self.assertRaises(KeyError, graph.repo.__getitem__, e1)
+        graph.update([self.octopus])
+        self.assertEqual(len(graph), 9)
+        self.assertFalse(e1 in graph)
+        self.assertTrue(graph.is_ancestor(self.a1, self.octopus))
+        graph.update([self.b2])
+        self.assertEqual(len(graph), 9)
+
+    def test_rebuilt_while_mapped(self):
+        self.git('checkout', '-q', '-b', 'e', self.a1)
+        e1 = self.commit('e1')
+        old = self._open()
+        old.update([e1])
+        self.assertEqual(old.row(e1), 2)
+        self.git('checkout', '-q', 'master')
+        self.git('branch', '-D', 'e')
+        self.git('reflog', 'expire', '--expire=now', '--all')
+        self.git('gc', '-q', '--prune=now')
+        graph = self._open()
+        graph.update([self.octopus])
+        self.assertNotEqual(graph.build, old.build)
+        # The new build has files of its own, and the old build's are only kept while they're mapped
+        self.assertEqual(sorted(name for name in os.listdir(graph.path) if name.startswith('oids')), ['oids-' + graph.build])
+        self.assertEqual((old.row(e1), old.sha(2), len(old)), (2, e1, 3))
+        self.assertEqual(graph.sha(graph.row(self.octopus)), self.octopus)
+
+    def test_missing_files(self):
+        graph = self._open()
+        graph.update([self.octopus])
+        os.remove(os.path.join(graph.path, 'lookup-' + graph.build))
+        # graph.json names a build whose files are gone, so the graph is built again
+        graph = self._open()
+        self.assertEqual(len(graph), 0)
+        graph.update([self.octopus])
+        self.assertEqual(len(graph), 9)
+        self.assertTrue(graph.is_ancestor(self.root, self.octopus))
+
+if __name__ == '__main__':
+    unittest.main()
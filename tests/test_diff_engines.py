@@ -0,0 +1,66 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import random
+import diff_engines
+
+def apply_opcodes(a, b, opcodes):
+    result = []
+    for (tag, i1, i2, j1, j2) in opcodes:
+        if tag == 'equal':
+            result.extend(a[i1:i2])
+        else:
+            result.extend(b[j1:j2])
+    return result
+
+class PatienceTest(unittest.TestCase):
+    def _opcodes(self, a, b, isjunk=None):
+        matcher = diff_engines.matcher('patience', isjunk)
+        matcher.set_seqs(a, b)
+        opcodes = matcher.get_opcodes()
+        self.assertEqual(apply_opcodes(a, b, opcodes), b)
+        for (tag, i1, i2, j1, j2) in opcodes:
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+        return opcodes
+
+    def test_unique_lines(self):
+        a = ['def one():', '    return 1', '', 'def two():', '    return 2']
+        b = ['def two():', '    return 2', '', 'def one():', '    return 1']
+        opcodes = self._opcodes(a, b)
+        self.assertEqual(sum(i2 - i1 for (tag, i1, i2, _, _) in opcodes if tag == 'equal'), 2)
+
+    def test_moved_block(self):
+        # The braces are everywhere, so only the unique lines line the functions up
+        a = ['int f() {', 'return 1;', '}', 'int g() {', 'return 2;', '}']
+        b = ['int g() {', 'return 2;', '}', 'int h() {', 'return 3;', '}']
+        opcodes = self._opcodes(a, b)
+        self.assertEqual(opcodes[0][0], 'delete')
+        self.assertEqual(opcodes[1], ('equal', 3, 5, 0, 2))
+        self.assertEqual(opcodes[2][0], 'insert')
+
+    def test_random(self):
+        rand = random.Random(17)
+        for _ in range(50):
+            a = [rand.choice('abcdefgh') for _ in range(rand.randint(0, 60))]
+            b = list(a)
+            for _ in range(rand.randint(0, 10)):
+                b.insert(rand.randint(0, len(b)), rand.choice('abcdefghxyz'))
+                if b:
+                    del b[rand.randint(0, len(b) - 1)]
+            self._opcodes(a, b, lambda line: line == 'h')
+
+    def test_grouped(self):
+        a = ['line {0}'.format(i) for i in range(100)]
+        b = a[:10] + ['new'] + a[10:90] + a[91:]
+        matcher = diff_engines.matcher('patience')
+        matcher.set_seqs(a, b)
+        groups = list(matcher.get_grouped_opcodes(3))
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0][1], ('insert', 10, 10, 10, 11))
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, diff_engines.matcher, 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+from BeautifulSoup import UnicodeDammit
+import ggutils
+
+class ForceUnicodeTest(unittest.TestCase):
+    def test_utf8(self):
+        self.assertEqual(ggutils.force_unicode('Ünïcödé'.encode('utf-8')), 'Ünïcödé')
+        self.assertEqual(ggutils.force_unicode(b'\xef\xbb\xbfbom'), 'bom')
+        self.assertEqual(ggutils.force_unicode('already unicode'), 'already unicode')
+
+    def test_detected_encoding(self):
+        text = 'Café crème brûlée, à la française'.encode('latin-1')
+        dammit = UnicodeDammit(text, smartQuotesTo=None)
+        self.assertEqual(ggutils.force_unicode(text, 'key'), dammit.unicode)
+        # The encoding detected is tried first for other text with the same key
+        self.assertEqual(ggutils._encodings.get('key'), dammit.originalEncoding)
+        other = 'Zoë'.encode('latin-1')
+        self.assertEqual(ggutils.force_unicode(other, 'key'), other.decode(dammit.originalEncoding))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import graph
+
+class Signature(object):
+    def __init__(self, name):
+        self.name = name
+        self.email = '{0}@example.com'.format(name)
+
+class Commit(object):
+    def __init__(self, sha, parents=[]):
+        self.hex = sha
+        self.parents = parents
+        self.message = 'Commit {0}'.format(sha)
+        self.author = Signature('Author')
+        self.commit_time = 1300000000
+
+class LanesTest(unittest.TestCase):
+    def test_index(self):
+        lanes = graph.Lanes(['a', '', 'b', ''])
+        self.assertEqual(lanes.index('b'), 2)
+        self.assertEqual(lanes.index(''), 1)
+        self.assertIn('a', lanes)
+        self.assertNotIn('c', lanes)
+        self.assertRaises(ValueError, lanes.index, 'c')
+        self.assertEqual(lanes.width, 3)
+
+    def test_blanks(self):
+        lanes = graph.Lanes(['a', 'b', 'c'])
+        self.assertRaises(ValueError, lanes.index, '')
+        lanes[2] = ''
+        lanes[1] = ''
+        self.assertEqual(lanes.width, 1)
+        self.assertEqual(lanes.index(''), 1)
+        lanes[1] = 'd'
+        self.assertEqual(lanes.index(''), 2)
+        self.assertEqual(lanes.index('d'), 1)
+        self.assertNotIn('b', lanes)
+        self.assertEqual(list(lanes), ['a', 'd', ''])
+
+    def test_delete(self):
+        lanes = graph.Lanes(['a', '', 'b', 'c'])
+        del lanes[0]
+        self.assertEqual(lanes.index('c'), 2)
+        self.assertEqual(lanes.index(''), 0)
+        self.assertNotIn('a', lanes)
+        self.assertEqual(len(lanes), 3)
+
+    def test_duplicates(self):
+        lanes = graph.Lanes(['a', 'b', 'a'])
+        self.assertEqual(lanes.index('a'), 0)
+        lanes[0] = ''
+        self.assertEqual(lanes.index('a'), 2)
+
+class GrapherTest(unittest.TestCase):
+    def _history(self):
+        # d merges c into e, and b and c both lead to a
+        a = Commit('a')
+        b = Commit('b', [a])
+        c = Commit('c', [a])
+        e = Commit('e', [b])
+        d = Commit('d', [e, c])
+        return [d, e, c, b, a]
+
+    def _paths(self, display_list):
+        return [[(s['type'], s.get('x'), s['y']) for s in edge.d] for edge in display_list['edges']]
+
+    def test_edges(self):
+        (display_list, branches) = graph.Grapher().draw_commits(self._history())
+        self.assertEqual(self._paths(display_list), [
+            [('M', 0, 0), ('L', 0, 1)],
+            [('M', 0, 0), ('l', 1, 0.5), ('v', None, 1), ('L', 1, 2)],
+            [('M', 0, 1), ('v', None, 1), ('L', 0, 3)],
+            [('M', 1, 2), ('v', None, 1), ('L', 1, 4)],
+            [('M', 0, 3), ('l', 1, 0.5)],
+        ])
+        self.assertEqual(branches, [''])
+
+    def test_unfinished_edges(self):
+        (display_list, branches) = graph.Grapher().draw_commits(self._history()[:2])
+        self.assertEqual(self._paths(display_list), [
+            [('M', 0, 0), ('L', 0, 1)],
+            [('M', 0, 0), ('l', 1, 0.5), ('V', None, 2)],
+            [('M', 0, 1), ('V', None, 2)],
+        ])
+        self.assertEqual(branches, ['b', 'c'])
+
+    def test_long_edge(self):
+        root = Commit('root')
+        side = Commit('side', [root])
+        mainline = [Commit('main50', [root])]
+        for i in range(49, -1, -1):
+            mainline.insert(0, Commit('main{0}'.format(i), [mainline[0]]))
+        merge = Commit('merge', [mainline[0], side])
+        (display_list, branches) = graph.Grapher().draw_commits([merge] + mainline + [side, root])
+        side_edge = [edge for edge in display_list['edges'] if edge.parent == 'side'][0]
+        self.assertEqual([(s['type'], s.get('x'), s['y']) for s in side_edge.d],
+            [('M', 0, 0), ('l', 1, 0.5), ('v', None, 51), ('L', 1, 52)])
+
+    def test_display_list(self):
+        (display_list, branches) = graph.Grapher().draw_commits(self._history())
+        nodes = display_list['nodes']
+        self.assertEqual(len(nodes), 5)
+        self.assertEqual(nodes[0].id, 'd')
+        self.assertEqual(nodes[0].parents, ['e', 'c'])
+        self.assertEqual([(node.x, node.y) for node in nodes], [(0, 0), (0, 1), (1, 2), (0, 3), (1, 4)])
+        self.assertEqual([label.content for label in display_list['labels']], ['Commit d', 'Commit e', 'Commit c', 'Commit b', 'Commit a'])
+        self.assertEqual([edge['class'] for edge in display_list['edges']], ['col_0 ', 'col_1 ', 'col_0 ', 'col_1 ', 'col_1 '])
+        self.assertEqual(dict(display_list.items()).keys(), dict.fromkeys(['edges', 'nodes', 'labels', 'authors', 'dates']).keys())
+
+if __name__ == '__main__':
+    unittest.main()
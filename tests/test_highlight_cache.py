@@ -0,0 +1,83 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import tempfile
+import os
+import shutil
+import pygit2
+import highlight_cache
+import tree_diff
+from tests.repotests import RepoTestCase
+
+class HighlightCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_eviction(self):
+        lines = ['x' * 36]
+        size = highlight_cache._size(lines)
+        cache = highlight_cache.HighlightCache(size * 2)
+        cache.put(('a', 'Python'), lines)
+        cache.put(('b', 'Python'), lines)
+        self.assertEqual(cache.get(('a', 'Python')), lines)
+        # b is the least recently used, so it makes way for c
+        cache.put(('c', 'Python'), lines)
+        self.assertEqual(cache.get(('b', 'Python')), None)
+        self.assertEqual(cache.get(('a', 'Python')), lines)
+        self.assertEqual(cache.get(('a', 'C')), None)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['items'], stats['bytes']), (2, 2, 2, size * 2))
+
+    def test_spill(self):
+        lines = ['<span class="k">def</span> Ünïcödé', '']
+        cache = highlight_cache.HighlightCache(highlight_cache._size(lines), self.path)
+        cache.put(('a', 'Python'), lines)
+        cache.put(('b', 'Python'), lines)
+        self.assertEqual(len(cache), 1)
+        # a was written to disk when it was evicted, and is read back from there
+        self.assertEqual(cache.get(('a', 'Python')), lines)
+        self.assertEqual(cache.stats()['spill_hits'], 1)
+        # Another cache using the same directory sees what was flushed
+        cache.flush()
+        other = highlight_cache.HighlightCache(1000, self.path)
+        self.assertEqual(other.get(('b', 'Python')), lines)
+        self.assertEqual(other.get(('c', 'Python')), None)
+
+    def test_prune_spill(self):
+        lines = ['x' * 100]
+        cache = highlight_cache.HighlightCache(0, self.path, 250)
+        for key in 'abcd':
+            cache.put((key, 'Python'), lines)
+        files = [path for (_, _, path) in cache._spill_files()]
+        self.assertTrue(0 < len(files) < 4)
+        self.assertEqual(cache.get(('d', 'Python')), lines)
+
+class WarmUpTest(RepoTestCase):
+    def setUp(self):
+        super(WarmUpTest, self).setUp()
+        os.mkdir('src')
+        with open('src/hello.py','w') as f:
+            f.write('def hello():\n    print("hello")\n')
+        with open('data.bin','wb') as f:
+            f.write(b'\0\1\2')
+        self.git('add','src','data.bin')
+        self.git('commit','-q','-m','Initial commit')
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+
+    def test_warm_up(self):
+        cache = highlight_cache.HighlightCache(1024 * 1024)
+        differ = tree_diff.TreeDiffer(self.repo, highlight_cache=cache)
+        self.assertEqual(highlight_cache.warm_up(differ, ['HEAD']), 1)
+        self.assertEqual(len(cache), 1)
+        # A diff against the file finds it already highlighted
+        sha = self.repo.revparse_single('HEAD:src/hello.py').hex
+        old = self.repo[self.repo.create_blob(b'def hello():\n    pass\n')]
+        hits = cache.stats()['hits']
+        list(differ.compare_data(old.data, self.repo[sha].data, 'src/hello.py', old.hex, sha))
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+
+if __name__ == '__main__':
+    unittest.main()
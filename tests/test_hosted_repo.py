@@ -0,0 +1,102 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import os
+import ggapp
+import hosted_repo
+from tests.repotests import RepoTestCase
+
+class HostedRepoTest(unittest.TestCase):
+    def test_parse_repos(self):
+        self.assertEqual(hosted_repo.parse_repos({'a': '/a.git', 'b': {'PATH': '/b.git', 'MAX_REVWALK': 10}}),
+            {'a': {'PATH': '/a.git'}, 'b': {'PATH': '/b.git', 'MAX_REVWALK': 10}})
+        self.assertRaises(ValueError, hosted_repo.parse_repos, {'a/b': '/a.git'})
+        self.assertRaises(ValueError, hosted_repo.parse_repos, {'a': {'MAX_REVWALK': 10}})
+
+    def test_reserved_names(self):
+        for name in hosted_repo.RESERVED_NAMES:
+            self.assertRaises(ValueError, hosted_repo.parse_repos, {name: '/a.git'})
+        # Every URL of the app starts with a reserved name, or a ref under a repository's prefix
+        for rule in ggapp.app.url_map.iter_rules():
+            first = rule.rule.split('/')[1]
+            if first and not first.startswith('<'):
+                self.assertIn(first, hosted_repo.RESERVED_NAMES)
+
+    def test_settings(self):
+        config = {'CACHE_DIR': '/cache', 'MAX_REVWALK': 100, 'REPO_PATH': '/default.git', 'RESPONSE_CACHE_SIZE': 1024}
+        big = hosted_repo.HostedRepo('big', config, {'PATH': '/big.git', 'MAX_REVWALK': 10, 'RESPONSE_CACHE_SIZE': 4096})
+        small = hosted_repo.HostedRepo('small', config, {'PATH': '/small.git'})
+        self.assertEqual((big.path, big.get('MAX_REVWALK'), big.cache_dir), ('/big.git', 10, os.path.join('/cache', 'big')))
+        self.assertEqual((small.path, small.get('MAX_REVWALK')), ('/small.git', 100))
+        # Each has caches of its own
+        self.assertEqual((big.responses.tiers[0].max_bytes, small.responses.tiers[0].max_bytes), (4096, 1024))
+        self.assertIsNot(big.highlights, small.highlights)
+        self.assertIsNot(big.level_cache, small.level_cache)
+        default = hosted_repo.HostedRepo(None, config)
+        self.assertEqual((default.path, default.cache_dir), ('/default.git', '/cache'))
+
+class MultipleReposTest(RepoTestCase):
+    def make_repo(self, name, commits):
+        """Makes a repository called name next to the test's own, and returns its head."""
+        path = os.path.join(self.repo_path, name)
+        self.git('init','-q',path)
+        for i in range(commits):
+            with open(os.path.join(path, 'file.txt'),'w') as f:
+                f.write('version {0} of {1}\n'.format(i, name))
+            self.git('-C',path,'add','file.txt')
+            self.git('-C',path,'commit','-q','-m','Commit {0}'.format(i))
+        return self.git('-C',path,'rev-parse','HEAD')
+
+    def setUp(self):
+        super(MultipleReposTest, self).setUp()
+        self.heads = {'one': self.make_repo('one', 1), 'two': self.make_repo('two', 3)}
+        ggapp.app.config['TESTING'] = True
+        ggapp.app.config['REPOS'] = {'one': {'PATH': os.path.join(self.repo_path, 'one', '.git'), 'DIFF_FILE_MAX_BYTES': 10},
+                                     'two': {'PATH': os.path.join(self.repo_path, 'two', '.git'), 'MAX_REVWALK': 2, 'BLOB_MAX_BYTES': 10}}
+        ggapp.hosted_repos.clear()
+        self.app = ggapp.app.test_client()
+
+    def tearDown(self):
+        del ggapp.app.config['REPOS']
+        ggapp.hosted_repos.clear()
+        super(MultipleReposTest, self).tearDown()
+
+    def test_index(self):
+        resp = self.app.get('/')
+        self.assertIn('href="/one/"', resp.data)
+        self.assertIn('href="/two/"', resp.data)
+        self.assertEqual(self.app.get('/three/sha/{0}'.format(self.heads['one'])).status_code, 404)
+        self.assertEqual(self.app.get('/static/css/base.css').status_code, 200)
+
+    def test_prefixed(self):
+        url = '/one/sha/{0}'.format(self.heads['one'])
+        resp = self.app.get(url, headers={'Accept': 'text/html'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('<h1>Commit 0</h1>', resp.data)
+        # Each repository only has its own objects
+        self.assertEqual(self.app.get('/two/sha/{0}'.format(self.heads['one'])).status_code, 404)
+        self.assertEqual(self.app.get('/one/static/css/base.css').status_code, 200)
+        self.assertIsNot(ggapp.get_hosted_repo('one').responses, ggapp.get_hosted_repo('two').responses)
+
+    def test_max_revwalk(self):
+        resp = self.app.get('/two/graph/{0}'.format(self.heads['two']), headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(resp.data.count('id="label_'), 2)
+
+    def test_blob_max_bytes(self):
+        blobs = {}
+        for name in ('one', 'two'):
+            blobs[name] = self.git('-C',os.path.join(self.repo_path, name),'rev-parse','HEAD:file.txt')
+        html = {'Accept': 'text/html'}
+        # Over DIFF_FILE_MAX_BYTES, the file is highlighted as it's sent, and not cached
+        resp = self.app.get('/one/sha/{0}'.format(blobs['one']), query_string={'filename_hint': 'file.py'}, headers=html)
+        self.assertIn('<span class="n">version</span>', resp.data)
+        self.assertEqual(len(ggapp.get_hosted_repo('one').highlights), 0)
+        self.assertIn('too large to show', self.app.get('/two/sha/{0}'.format(blobs['two']), headers=html).data)
+        old = self.git('-C',os.path.join(self.repo_path, 'two'),'rev-parse','HEAD~1:file.txt')
+        resp = self.app.get('/two/sha/{0}'.format(blobs['two']), query_string={'compare_to': old}, headers=html)
+        self.assertIn('too large to show', resp.data)
+        # It can still be downloaded
+        self.assertEqual(self.app.get('/two/sha/{0}'.format(blobs['two'])).data, 'version 2 of two\n')
+
+if __name__ == '__main__':
+    unittest.main()
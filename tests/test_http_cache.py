@@ -0,0 +1,114 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import os
+import zlib
+from werkzeug.http import parse_accept_header, parse_etags
+from flask import Response
+import pygit2
+import ggapp
+import http_cache
+from tests.repotests import RepoTestCase
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+class HTTPCacheTest(unittest.TestCase):
+    def test_etag(self):
+        self.assertEqual(http_cache.etag('a', ['b', 1]), http_cache.etag('a', ['b', 1]))
+        self.assertNotEqual(http_cache.etag('a', ['b', 1]), http_cache.etag('a', ['b', 2]))
+        self.assertNotEqual(http_cache.etag('ab'), http_cache.etag('a', 'b'))
+
+    def test_matching_tag(self):
+        self.assertEqual(http_cache.matching_tag(parse_etags('"abc", W/"abc-gzip"'), 'abc'), 'abc')
+        self.assertEqual(http_cache.matching_tag(parse_etags('W/"abc-gzip"'), 'abc'), 'abc-gzip')
+        self.assertEqual(http_cache.matching_tag(parse_etags('*'), 'abc'), 'abc')
+        self.assertEqual(http_cache.matching_tag(parse_etags('"abd"'), 'abc'), None)
+        self.assertEqual(http_cache.matching_tag(parse_etags(None), 'abc'), None)
+
+    def test_compress(self):
+        body = 'Ünïcödé text\n' * 200
+        resp = Response(body, mimetype='text/html')
+        resp.set_etag('abc')
+        http_cache.compress(resp, parse_accept_header('gzip, deflate'))
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(resp.get_etag(), ('abc-gzip', False))
+        self.assertEqual(gunzip(resp.get_data()), body.encode('utf-8'))
+        self.assertIn('Accept-Encoding', resp.vary)
+
+    def test_compress_streamed(self):
+        chunks = ['<tr>{0}</tr>\n'.format(i) for i in range(100)]
+        resp = Response(iter(chunks), mimetype='text/html')
+        http_cache.compress(resp, parse_accept_header('gzip'))
+        parts = list(resp.response)
+        # Each chunk can be decompressed as soon as it arrives
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(parts[0]), chunks[0].encode('utf-8'))
+        self.assertEqual(gunzip(b''.join(parts)), ''.join(chunks).encode('utf-8'))
+
+    def test_not_compressed(self):
+        for (resp, accept) in ((Response('small', mimetype='text/html'), 'gzip'),
+                               (Response(b'\0' * 2000, mimetype='application/octet-stream'), 'gzip'),
+                               (Response('x' * 2000, mimetype='text/plain'), 'identity')):
+            data = resp.get_data()
+            http_cache.compress(resp, parse_accept_header(accept))
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.get_data(), data)
+
+class ConditionalRequestTest(RepoTestCase):
+    def setUp(self):
+        super(ConditionalRequestTest, self).setUp()
+        with open('hello.py','w') as f:
+            f.write('def hello():\n    print("hello")\n' * 100)
+        self.git('add','hello.py')
+        self.git('commit','-q','-m','Initial commit')
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        self.blob = self.repo.revparse_single('HEAD:hello.py').hex
+        ggapp.app.config['TESTING'] = True
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path,'.git')
+        self.app = ggapp.app.test_client()
+
+    def test_immutable(self):
+        url = '/sha/{0}?filename_hint=hello.py'.format(self.blob)
+        resp = self.app.get(url, headers={'Accept': 'text/html'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        etag = resp.headers['ETag']
+        # The repository isn't needed to answer a request for something the client already has
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path, 'missing')
+        resp = self.app.get(url, headers={'Accept': 'text/html', 'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(resp.headers['ETag'], etag)
+        # Other representations of the object have their own tags
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path, '.git')
+        resp = self.app.get(url, headers={'Accept': 'text/plain', 'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_compressed(self):
+        url = '/sha/{0}?filename_hint=hello.py'.format(self.blob)
+        resp = self.app.get(url, headers={'Accept': 'text/html', 'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('def</span>', gunzip(resp.data).decode('utf-8'))
+        # Shared caches must tell the compressed body apart, also when it's from the response cache
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        cached = self.app.get(url, headers={'Accept': 'text/html', 'Accept-Encoding': 'gzip'})
+        self.assertEqual(cached.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', cached.headers['Vary'])
+        resp = self.app.get(url, headers={'Accept': 'text/html', 'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_ref_revalidated(self):
+        resp = self.app.get('/')
+        self.assertEqual(resp.headers['Cache-Control'], 'no-cache')
+        etag = resp.headers['ETag']
+        self.assertEqual(self.app.get('/', headers={'If-None-Match': etag}).status_code, 304)
+        # Once the branch moves on, the page is sent again
+        with open('hello.py','a') as f:
+            f.write('hello()\n')
+        self.git('commit','-q','-a','-m','Call hello')
+        self.assertEqual(self.app.get('/', headers={'If-None-Match': etag}).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
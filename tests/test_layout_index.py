@@ -0,0 +1,127 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import os
+import time
+import pygit2
+import ggapp
+import hosted_repo
+import layout_index
+import metadata_store
+import repo_pool
+from tests.repotests import RepoTestCase
+
+class LayoutIndexTest(RepoTestCase):
+    def _walk(self, tip):
+        return [c.hex for c in self.repo.walk(self.repo[tip].oid, pygit2.GIT_SORT_TIME)]
+
+    def setUp(self):
+        super(LayoutIndexTest, self).setUp()
+        for i in range(150):
+            self.old_tip = self.commit('file{0}'.format(i))
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        self.index = layout_index.LayoutIndex(self.repo, os.path.join(self.repo_path, 'layout'))
+
+    def test_rows(self):
+        self.index.build(self.old_tip)
+        self.assertEqual(self.index.length(self.old_tip), 150)
+        self.assertEqual(self.index.rows(self.old_tip, 0, 150), self._walk(self.old_tip))
+        self.assertEqual(self.index.rows(self.old_tip, 140, 200), self._walk(self.old_tip)[140:])
+        self.assertEqual(self.index.branches_at(self.old_tip, 0), [])
+        self.assertEqual(self.index.branches_at(self.old_tip, 120), [self._walk(self.old_tip)[120]])
+
+    def test_position(self):
+        self.index.build(self.old_tip)
+        walk = self._walk(self.old_tip)
+        for row in (0, 1, 99, 100, 149):
+            self.assertEqual(self.index.position(self.old_tip, walk[row]), row)
+        self.assertEqual(self.index.position(self.old_tip, '0' * 40), None)
+        self.assertEqual(self.index.position(self.old_tip, 'not a sha'), None)
+
+    def test_fast_forward(self):
+        self.index.build(self.old_tip)
+        for i in range(20):
+            new_tip = self.commit('newfile{0}'.format(i))
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        self.index.repo = self.repo
+        self.index.build(new_tip)
+        self.assertEqual(self.index.rows(new_tip, 0, 200), self._walk(new_tip))
+        # The spliced index's boundaries are 20 rows further down
+        self.assertEqual([row for (row, _) in self.index._load_boundaries(new_tip)], [0, 20, 120])
+        for row in (19, 20, 21, 119, 120, 121, 169):
+            self.assertEqual(self.index.branches_at(new_tip, row), [self._walk(new_tip)[row]])
+        self.assertEqual(self.index.position(new_tip, self.old_tip), 20)
+        self.assertEqual(self.index.position(self.old_tip, new_tip), None)
+
+    def test_prune(self):
+        tips = [self.old_tip]
+        for i in range(2):
+            self.git('checkout','-q','-b','branch{0}'.format(i),self.old_tip)
+            tips.append(self.commit('branchfile{0}'.format(i)))
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        self.index = layout_index.LayoutIndex(self.repo, self.index.path, 5 * 151 * (layout_index.OID_SIZE + layout_index.POSITION.size) // 2)
+        self.assertFalse(self.index.use(tips[0]))
+        self.index.build(tips[0])
+        self.index.build(tips[1])
+        os.utime(self.index._lanes_path(tips[0]), (1, 1))
+        os.utime(self.index._lanes_path(tips[1]), (2, 2))
+        self.assertTrue(self.index.use(tips[0]))
+        # Only two fit, so the one used least recently makes way
+        self.index.build(tips[2])
+        self.assertEqual([self.index.has(tip) for tip in tips], [True, False, True])
+        self.assertFalse(os.path.exists(self.index._rows_path(tips[1])))
+
+    def test_build_in_background(self):
+        self.index.build_in_background(self.old_tip)
+        for _ in range(100):
+            if self.index.has(self.old_tip):
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.index.rows(self.old_tip, 0, 150), self._walk(self.old_tip))
+
+    def test_graph_page(self):
+        self.git('checkout','-q','-b','side','HEAD~10')
+        side = self.commit('sidefile')
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        hosted = hosted_repo.HostedRepo(None, {'REPO_PATH': self.repo.path, 'CACHE_DIR': os.path.join(self.repo_path, 'cache')})
+        index = ggapp.get_layout_index(self.repo, hosted)
+        # A commit which isn't the tip of a ref isn't laid out
+        (display_list, _, cursor) = ggapp.draw_graph_page(self.repo, hosted, self.repo[self.old_tip], 0, 100, [])
+        self.assertEqual((len(display_list['nodes']), index.has(self.old_tip)), (100, False))
+        # A ref's is laid out in the background, and drawn from a walk meanwhile
+        (display_list, branches, cursor) = ggapp.draw_graph_page(self.repo, hosted, self.repo[side], 0, 100, [], index=True)
+        self.assertEqual(len(display_list['nodes']), 100)
+        for _ in range(100):
+            if index.has(side):
+                break
+            time.sleep(0.05)
+        self.assertEqual(index._indexed_tips(), set([side]))
+        (display_list, _, cursor) = ggapp.draw_graph_page(self.repo, hosted, self.repo[side], 100, 200, branches, index=True)
+        self.assertEqual((len(display_list['nodes']), cursor), (41, None))
+        # The labels are stored in the background too, which finishes before the repository is removed
+        for _ in range(100):
+            if not metadata_store._updating:
+                break
+            time.sleep(0.05)
+
+    def test_max_revwalk(self):
+        hosted = hosted_repo.HostedRepo(None, {'REPO_PATH': self.repo.path, 'MAX_REVWALK': 120})
+        (old_repos, ggapp.repos) = (ggapp.repos, repo_pool.RepositoryPool())
+        try:
+            (display_list, branches, cursor) = ggapp.draw_graph_page(self.repo, hosted, self.repo[self.old_tip], 0, 100, [])
+            self.assertEqual(len(display_list['nodes']), 100)
+            # The saved walk keeps its repository handle out of the pool
+            self.assertEqual(ggapp.repos.stats()['idle'], 0)
+            # The walk resumed from the cursor stops at the limit too, and gives no cursor past it
+            (display_list, _, cursor) = ggapp.draw_graph_page(self.repo, hosted, self.repo[self.old_tip], 100, 200, branches, cursor)
+            self.assertEqual((len(display_list['nodes']), cursor), (20, None))
+            self.assertEqual(ggapp.repos.stats()['idle'], 1)
+        finally:
+            ggapp.repos = old_repos
+        # Layouts stop at the limit
+        self.index.build(self.old_tip, 120)
+        self.assertEqual(self.index.length(self.old_tip), 120)
+        self.assertEqual(self.index.rows(self.old_tip, 0, 200), self._walk(self.old_tip)[:120])
+
+if __name__ == '__main__':
+    unittest.main()
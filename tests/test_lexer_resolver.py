@@ -0,0 +1,45 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+from pygments.lexers import guess_lexer, guess_lexer_for_filename
+from pygments.util import ClassNotFound
+import lexer_resolver
+
+FILES = [
+    ('src/hello.py', 'def hello():\n    print("hello")\n'),
+    ('include/list.h', '#include <stdio.h>\nstruct list;\n'),
+    ('Makefile', 'all:\n\tcc -o hello hello.c\n'),
+    ('Makefile.am', 'bin_PROGRAMS = hello\n'),
+    ('templates/base.html', '<h1>{{ title|e }}</h1>\n{% block body %}{% endblock %}\n'),
+    ('index.php3', '<?php echo "hello"; ?>\n'),
+    ('docs/ls.1', '.TH LS 1\n'),
+]
+
+class LexerResolverTest(unittest.TestCase):
+    def test_same_as_pygments(self):
+        resolver = lexer_resolver.LexerResolver()
+        for (name, text) in FILES:
+            self.assertEqual(resolver.lexer_class(name, text), type(guess_lexer_for_filename(name, text)), name)
+
+    def test_no_lexer(self):
+        resolver = lexer_resolver.LexerResolver()
+        self.assertRaises(ClassNotFound, resolver.lexer_class, 'data.unknown-extension', 'text')
+        self.assertRaises(ClassNotFound, resolver.lexer_class, 'data.unknown-extension', 'text')
+
+    def test_guess(self):
+        text = '#!/usr/bin/env python\nprint("hello")\n'
+        self.assertEqual(lexer_resolver.get_lexer(None, text).name, guess_lexer(text).name)
+        # Only the start of the text is analysed
+        self.assertEqual(lexer_resolver.get_lexer(None, text + ' ' * lexer_resolver.GUESS_PREFIX).name, guess_lexer(text).name)
+
+    def test_filename_cache(self):
+        resolver = lexer_resolver.LexerResolver()
+        # The content of each version of a file with an ambiguous name is analysed again
+        for text in ('#include <stdio.h>\nint main(void);\n', '#import <Foundation/Foundation.h>\n@interface Foo : NSObject\n@end\n',
+                     '#include <stdio.h>\nint main(void);\n'):
+            self.assertEqual(resolver.lexer_class('src/main.h', text), type(guess_lexer_for_filename('main.h', text)))
+            self.assertEqual(resolver.lexer_class('other/main.h', text), type(guess_lexer_for_filename('main.h', text)))
+        self.assertEqual(lexer_resolver.get_lexer('page.html', '', stripnl=False).stripnl, False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import os
+import time
+import pygit2
+import commit_graph
+import graph
+import metadata_store
+from tests.repotests import RepoTestCase
+
+class MetadataStoreTest(RepoTestCase):
+    def _open(self):
+        self.repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        self.commits = commit_graph.CommitGraph(self.repo, os.path.join(self.repo_path, 'commit-graph'))
+        return metadata_store.MetadataStore(self.repo, self.commits, os.path.join(self.repo_path, 'metadata'))
+
+    def setUp(self):
+        super(MetadataStoreTest, self).setUp()
+        self.shas = [
+            self.commit('one', 'First commit'),
+            self.commit('two', 'A commit message which is much longer than the fifty characters of a title\n\nAnd a body', 'Jöhn Dœ'),
+            self.commit('three', 'Ünïcödé'),
+        ]
+
+    def test_labels(self):
+        store = self._open()
+        self.commits.update([self.shas[1]])
+        store.update()
+        self.assertEqual(len(store), 2)
+        for sha in self.shas:
+            self.assertEqual(store.labels(self.repo[sha]), graph.commit_labels(self.repo[sha]))
+        self.assertEqual(store.labels(self.repo[self.shas[1]])[1], 'Jöhn Dœ')
+
+    def test_update(self):
+        store = self._open()
+        self.commits.update([self.shas[0]])
+        store.update()
+        self.commits.update([self.shas[2]])
+        store.update()
+        store = self._open()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.labels(self.repo[self.shas[2]])[0], 'Ünïcödé')
+
+    def test_update_in_background(self):
+        store = self._open()
+        # The commit graph is updated along with the store
+        store.update_in_background([self.shas[2]])
+        for _ in range(100):
+            store = self._open()
+            if len(store) == 3:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(self.commits), 3)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.labels(self.repo[self.shas[2]])[0], 'Ünïcödé')
+
+    def test_rebuilt_graph(self):
+        self.git('checkout','-q','-b','side',self.shas[0])
+        side = self.commit('side', 'Side commit')
+        self.git('checkout','-q','master')
+        old = self._open()
+        self.commits.update([side])
+        old.update()
+        side_labels = old.labels(self.repo[side])
+        # Prune the side commit, so the commit graph is built again with other rows
+        for args in (('branch','-q','-D','side'), ('reflog','expire','--expire=now','--all'), ('gc','-q','--prune=now')):
+            self.git(*args)
+        store = self._open()
+        self.commits.update([self.shas[2]])
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.labels(self.repo[self.shas[1]]), graph.commit_labels(self.repo[self.shas[1]]))
+        store.update()
+        self.assertEqual(len(store), 3)
+        for sha in self.shas:
+            self.assertEqual(store.labels(self.repo[sha]), graph.commit_labels(self.repo[sha]))
+        # The new build's rows are in files of their own, and the old ones are still read where they're mapped
+        self.assertEqual(sorted(os.listdir(store.path)), ['index-' + self.commits.build, 'lock', 'metadata.json', 'strings-' + self.commits.build])
+        self.assertEqual(old.labels(old.repo[side]), side_labels)
+
+if __name__ == '__main__':
+    unittest.main()
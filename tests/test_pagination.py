@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import pagination
+
+class CursorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = pagination.CursorStore(maxsize=2)
+
+    def test_resume(self):
+        walker = iter(range(10))
+        token = self.store.save('abc', 100, walker, ['abc', ''])
+        self.assertIs(self.store.resume(token, 'abc', 100, ['abc', '']).walker, walker)
+        # Cursors can only be used once
+        self.assertIsNone(self.store.resume(token, 'abc', 100, ['abc', '']))
+
+    def test_mismatch(self):
+        token = self.store.save('abc', 100, iter([]), ['abc'])
+        self.assertIsNone(self.store.resume(token, 'abc', 200, ['abc']))
+        token = self.store.save('abc', 100, iter([]), ['abc'])
+        self.assertIsNone(self.store.resume(token, 'def', 100, ['abc']))
+        token = self.store.save('abc', 100, iter([]), ['abc'])
+        self.assertIsNone(self.store.resume(token, 'abc', 100, ['def']))
+
+    def test_eviction(self):
+        first = self.store.save('abc', 100, iter([]), [])
+        self.store.save('abc', 200, iter([]), [])
+        self.store.save('abc', 300, iter([]), [])
+        self.assertIsNone(self.store.resume(first, 'abc', 100, []))
+
+    def test_release(self):
+        released = []
+        first = self.store.save('abc', 100, iter([]), [], lambda: released.append('first'))
+        second = self.store.save('abc', 100, iter([]), [], lambda: released.append('second'))
+        # A cursor which doesn't match is dropped, and one which is evicted too
+        self.assertIsNone(self.store.resume(first, 'abc', 200, []))
+        self.store.save('abc', 200, iter([]), [])
+        self.store.save('abc', 300, iter([]), [])
+        self.assertEqual(released, ['first', 'second'])
+        # A resumed one is closed by whoever resumed it
+        cursor = self.store.resume(self.store.save('abc', 400, iter([]), [], lambda: released.append('third')), 'abc', 400, [])
+        self.assertEqual(len(released), 2)
+        cursor.close()
+        cursor.close()
+        self.assertEqual(released, ['first', 'second', 'third'])
+
+if __name__ == '__main__':
+    unittest.main()
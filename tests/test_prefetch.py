@@ -0,0 +1,128 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import json
+import re
+import threading
+import time
+import os
+import ggapp
+import hosted_repo
+import prefetch
+import repo_pool
+from tests.repotests import RepoTestCase
+
+def wait_for(prefetcher):
+    for job in list(prefetcher._jobs.values()):
+        job.done.wait(5)
+
+class PrefetcherTest(unittest.TestCase):
+    def test_take(self):
+        prefetcher = prefetch.Prefetcher(workers=1)
+        self.assertTrue(prefetcher.submit('a', lambda: 42))
+        wait_for(prefetcher)
+        self.assertEqual(prefetcher.take('a', 5), 42)
+        # Each value is only taken once
+        self.assertEqual(prefetcher.take('a', 5), None)
+        self.assertEqual((prefetcher.hits, prefetcher.misses), (1, 1))
+
+    def test_cancel_queued(self):
+        prefetcher = prefetch.Prefetcher(workers=1)
+        release = threading.Event()
+        calls = []
+        prefetcher.submit('slow', release.wait)
+        prefetcher.submit('queued', lambda: calls.append('queued'))
+        # The queued job hasn't started, so taking it cancels it rather than waiting
+        self.assertEqual(prefetcher.take('queued', 5), None)
+        release.set()
+        wait_for(prefetcher)
+        prefetcher.submit('after', lambda: 1)
+        wait_for(prefetcher)
+        self.assertEqual(prefetcher.take('after', 5), 1)
+        self.assertEqual(calls, [])
+
+    def test_queue_full(self):
+        prefetcher = prefetch.Prefetcher(workers=1, max_queued=1)
+        release = threading.Event()
+        started = threading.Event()
+        prefetcher.submit('running', lambda: started.set() or release.wait())
+        started.wait(5)
+        self.assertTrue(prefetcher.submit('queued', lambda: 1))
+        self.assertFalse(prefetcher.submit('dropped', lambda: 2))
+        self.assertFalse(prefetcher.submit('queued', lambda: 3))
+        release.set()
+        self.assertEqual(prefetcher.take('queued', 5), None)
+
+    def test_expiry(self):
+        prefetcher = prefetch.Prefetcher(workers=1, ttl=0.05, max_items=1)
+        prefetcher.submit('a', lambda: 1)
+        prefetcher.submit('b', lambda: 2)
+        while len(prefetcher) > 1:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.assertEqual(prefetcher.take('b'), None)
+        self.assertEqual(len(prefetcher), 0)
+
+    def test_disabled(self):
+        prefetcher = prefetch.Prefetcher(workers=0)
+        self.assertFalse(prefetcher.submit('a', lambda: 1))
+        self.assertEqual(prefetcher.take('a'), None)
+
+class PrefetchGraphTest(RepoTestCase):
+    def setUp(self):
+        super(PrefetchGraphTest, self).setUp()
+        for i in range(150):
+            self.git('commit','-q','--allow-empty','-m','Commit {0}'.format(i))
+        self.head = self.git('rev-parse','HEAD')
+        ggapp.app.config['TESTING'] = True
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path, '.git')
+        # Each test starts without cached pages or cursors, and with a pool of its own
+        self.old = (ggapp.prefetcher, ggapp.repos, ggapp.default_repo)
+        ggapp.prefetcher = prefetch.Prefetcher(workers=1)
+        ggapp.repos = repo_pool.RepositoryPool()
+        ggapp.default_repo = hosted_repo.HostedRepo(None, ggapp.app.config)
+        self.app = ggapp.app.test_client()
+
+    def tearDown(self):
+        (ggapp.prefetcher, ggapp.repos, ggapp.default_repo) = self.old
+        super(PrefetchGraphTest, self).tearDown()
+
+    def test_next_page(self):
+        url = '/graph/{0}'.format(self.head)
+        xhr = {'X-Requested-With': 'XMLHttpRequest'}
+        first = self.app.get(url, headers=xhr).data
+        self.assertEqual(first.count('id="label_'), 100)
+        self.assertEqual(len(ggapp.prefetcher), 1)
+        wait_for(ggapp.prefetcher)
+        # The next page is asked for with the branches at the bottom of this one
+        branches = json.loads(re.search(r'gitgraph.existing_branches = (.*);', first).group(1))
+        resp = self.app.get(url, query_string={'offset': 100, 'branches': branches}, headers=xhr)
+        self.assertEqual(resp.data.count('id="label_'), 50)
+        self.assertIn('Commit 0<', resp.data)
+        self.assertEqual(ggapp.prefetcher.hits, 1)
+        # The last page isn't full, so there's nothing after it to prefetch
+        self.assertEqual(len(ggapp.prefetcher), 0)
+
+    def test_cursor(self):
+        url = '/graph/{0}'.format(self.head)
+        xhr = {'X-Requested-With': 'XMLHttpRequest'}
+        first = self.app.get(url, headers=xhr).data
+        wait_for(ggapp.prefetcher)
+        # The next page was drawn by continuing the first page's walk
+        cursor = json.loads(re.search(r'gitgraph.cursor = (.*);', first).group(1))
+        self.assertTrue(cursor)
+        self.assertNotIn(cursor, ggapp.default_repo.cursors.cursors)
+        # A cursor the request carries which the drawing didn't use is dropped
+        released = []
+        unused = ggapp.default_repo.cursors.save(self.head, 100, iter([]), [], lambda: released.append(True))
+        branches = json.loads(re.search(r'gitgraph.existing_branches = (.*);', first).group(1))
+        resp = self.app.get(url, query_string={'offset': 100, 'branches': branches, 'cursor': unused}, headers=xhr)
+        self.assertEqual(resp.data.count('id="label_'), 50)
+        self.assertEqual(ggapp.prefetcher.hits, 1)
+        self.assertEqual(released, [True])
+        # Every repository handle is back in the pool
+        stats = ggapp.repos.stats()
+        self.assertEqual(stats['idle'], stats['opened'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import tempfile
+import os
+import shutil
+import repo_pool
+from tests.repotests import RepoTestCase
+
+class RepositoryPoolTest(RepoTestCase):
+    def setUp(self):
+        super(RepositoryPoolTest, self).setUp()
+        with open('hello.py','w') as f:
+            f.write('def hello():\n    print("hello")\n')
+        self.git('add','hello.py')
+        self.git('commit','-q','-m','Initial commit')
+        self.git_dir = os.path.join(self.repo_path, '.git')
+
+    def test_reuse(self):
+        pool = repo_pool.RepositoryPool(max_idle=1)
+        first = pool.acquire(self.git_dir)
+        # A handle in use isn't given out again
+        second = pool.acquire(self.git_dir)
+        self.assertIsNot(first, second)
+        pool.release(self.git_dir, first)
+        pool.release(self.git_dir, second)
+        self.assertIs(pool.acquire(self.git_dir), first)
+        self.assertEqual(pool.stats(), {'opened': 2, 'reused': 1, 'repos': 1, 'idle': 0})
+
+    def test_max_repos(self):
+        other = tempfile.mkdtemp()
+        try:
+            self.git('init','-q','--bare',other)
+            pool = repo_pool.RepositoryPool(max_repos=1)
+            pool.release(self.git_dir, pool.acquire(self.git_dir))
+            pool.release(other, pool.acquire(other))
+            # Only the most recently used repository's handles are kept
+            self.assertEqual(pool.stats()['repos'], 1)
+            pool.acquire(self.git_dir)
+            self.assertEqual(pool.stats()['opened'], 3)
+        finally:
+            shutil.rmtree(other)
+
+    def test_refs_changed(self):
+        pool = repo_pool.RepositoryPool()
+        repo = pool.acquire(self.git_dir)
+        head = repo.revparse_single('HEAD').hex
+        pool.release(self.git_dir, repo)
+        self.git('commit','-q','--allow-empty','-m','Second commit')
+        self.git('gc','-q')
+        # The refs and packs have changed, so a new handle sees the new pack
+        repo = pool.acquire(self.git_dir)
+        self.assertEqual(pool.stats()['opened'], 2)
+        self.assertNotEqual(repo.revparse_single('HEAD').hex, head)
+        self.assertEqual(repo.revparse_single('HEAD^').hex, head)
+
+    def test_changed_while_in_use(self):
+        pool = repo_pool.RepositoryPool()
+        repo = pool.acquire(self.git_dir)
+        self.git('gc','-q')
+        pool.acquire(self.git_dir)
+        # Opened before the packs changed, so it isn't kept
+        pool.release(self.git_dir, repo)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
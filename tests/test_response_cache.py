@@ -0,0 +1,104 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import tempfile
+import os
+import shutil
+from flask import Response
+import ggapp
+import response_cache
+from tests.repotests import RepoTestCase
+
+VALUE = ('text/html; charset=utf-8', None, b'<p>' + b'x' * 96)
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_memory_eviction(self):
+        tier = response_cache.MemoryTier(200)
+        tier.put('a', VALUE)
+        tier.put('b', VALUE)
+        self.assertEqual(tier.get('a'), VALUE)
+        # b is the least recently used, so it makes way for c
+        tier.put('c', VALUE)
+        self.assertEqual(tier.get('b'), None)
+        self.assertEqual(tier.get('a'), VALUE)
+        self.assertEqual(len(tier), 2)
+
+    def test_files(self):
+        tier = response_cache.FileTier(self.path, 1024)
+        value = ('application/json', 'gzip', b'\x1f\x8b\0\n\t')
+        tier.put('abc-gzip', value)
+        # Another process using the same directory sees it
+        self.assertEqual(response_cache.FileTier(self.path, 1024).get('abc-gzip'), value)
+        self.assertEqual(tier.get('abd'), None)
+
+    def test_prune_files(self):
+        tier = response_cache.FileTier(self.path, 250)
+        for key in 'abcd':
+            tier.put(key, VALUE)
+        files = [path for (_, _, path) in tier._files()]
+        self.assertTrue(0 < len(files) < 4)
+        self.assertEqual(tier.get('d'), VALUE)
+
+    def test_tiers(self):
+        memory = response_cache.MemoryTier(1024)
+        cache = response_cache.ResponseCache([memory, response_cache.FileTier(self.path, 1024)], 1024)
+        cache.put('a', VALUE)
+        memory._items.clear()
+        # Found on disk, and copied back into memory
+        self.assertEqual(cache.get('a'), VALUE)
+        self.assertEqual(memory.get('a'), VALUE)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_store_streamed(self):
+        cache = response_cache.ResponseCache([response_cache.MemoryTier(1024)], 1024)
+        resp = Response(iter(['<p>', 'Ünïcödé', '</p>']), mimetype='text/html')
+        resp.set_etag('abc')
+        cache.store(resp)
+        chunks = iter(resp.response)
+        next(chunks)
+        # Nothing is stored until the whole body has been sent
+        self.assertEqual(cache.get('abc'), None)
+        list(chunks)
+        self.assertEqual(cache.get('abc')[2], '<p>Ünïcödé</p>'.encode('utf-8'))
+
+    def test_store_too_large(self):
+        cache = response_cache.ResponseCache([response_cache.MemoryTier(1024)], 50)
+        for resp in (Response(VALUE[2]), Response(iter([VALUE[2]]))):
+            resp.set_etag('abc')
+            cache.store(resp)
+            list(resp.response)
+            self.assertEqual(cache.get('abc'), None)
+
+class CachedResponseTest(RepoTestCase):
+    def setUp(self):
+        super(CachedResponseTest, self).setUp()
+        os.mkdir('src')
+        with open('src/hello.py','w') as f:
+            f.write('def hello():\n    print("hello, response cache")\n')
+        self.git('add','src')
+        self.git('commit','-q','-m','Initial commit')
+        self.tree = self.git('rev-parse','HEAD^{tree}')
+        ggapp.app.config['TESTING'] = True
+        self.app = ggapp.app.test_client()
+
+    def test_cached(self):
+        url = '/sha/{0}'.format(self.tree)
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path, '.git')
+        resp = self.app.get(url)
+        self.assertEqual(resp.status_code, 200)
+        # The second request is answered from the cache without the repository
+        ggapp.app.config['REPO_PATH'] = os.path.join(self.repo_path, 'missing')
+        cached = self.app.get(url)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, resp.data)
+        self.assertEqual(cached.headers['Content-Type'], resp.headers['Content-Type'])
+        self.assertEqual(cached.headers['ETag'], resp.headers['ETag'])
+
+if __name__ == '__main__':
+    unittest.main()
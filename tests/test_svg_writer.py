@@ -0,0 +1,28 @@
+# -*- coding: utf-8
+from __future__ import unicode_literals
+import unittest
+import graph
+import svg_writer
+from tests.test_graph import Commit
+
+class SVGWriterTest(unittest.TestCase):
+    def test_path_data(self):
+        segments = [{'type': 'M', 'x': 1, 'y': 2}, {'type': 'l', 'x': 1, 'y': 0.5}, {'type': 'v', 'y': 3}, {'type': 'L', 'x': 2, 'y': 6}]
+        self.assertEqual(svg_writer.path_data(segments), 'M20 40 l20 10.0 v60 L40 120 ')
+
+    def test_graph_page(self):
+        root = Commit('a')
+        top = Commit('b', [root])
+        top.message = 'Escape <this> & "that"'
+        (display_list, branches) = graph.Grapher().draw_commits([top, root])
+        page = ''.join(svg_writer.graph_page(display_list, lambda: '<script />'))
+        self.assertTrue(page.startswith('<svg id="ajax_graph_svg" '))
+        self.assertIn('height="40px"', page)
+        self.assertIn('<path class="edge col_0  parent_a" d="M0 0 L0 20 " />', page)
+        self.assertIn('<circle class="node  parent_a" id="b" cx="0" cy="0" r="5"', page)
+        self.assertIn('<text id="label_b" class="label" x="20" y="3" font-size="14">Escape &lt;this&gt; &amp; &#34;that&#34;</text>', page)
+        self.assertIn('<text id="author_a" class="label" x="0" y="23" font-size="14">Author</text>', page)
+        self.assertTrue(page.endswith('</svg>\n<script />'))
+
+if __name__ == '__main__':
+    unittest.main()
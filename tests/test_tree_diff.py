@@ -8,6 +8,10 @@ import shutil
 import pygit2
 import pprint
 import re
+from pygments import highlight
+from pygments.lexers import PythonLexer
+from pygments.formatters import HtmlFormatter
+import highlight_cache
 import tree_diff
 from tests.webtests import SPAN_REGEX
 
@@ -231,5 +235,152 @@ class TreeDiffTest(unittest.TestCase):
         # Assert that none of the unmodified lines show up as inserted
         self.assertFalse(self._content_contains_lines(content_list,lorem2.splitlines(),tree_diff.DiffEntry.CREATED,True))
 
+    def test_modified_subtree(self):
+        """Modify a file in a subdirectory and test that the subdirectory is only diffed when expanded"""
+        os.mkdir('subdir')
+        with open(os.path.join('subdir','lorem1.txt'),'w') as f:
+            f.write(lorem1)
+        subprocess.call(['git','add','subdir'])
+        subprocess.call(['git','commit','-m', 'lorem1 in subdir'])
+        prev_sha = self._get_last_commit()
+        with open(os.path.join('subdir','lorem1.txt'),'w') as f:
+            f.write(lorem2)
+        subprocess.call(['git','commit','-a','-m', 'lorem2 in subdir'])
+        commit_sha = self._get_last_commit()
+        repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        td = tree_diff.TreeDiffer(repo)
+        old = repo[unicode(prev_sha)]
+        new = repo[unicode(commit_sha)]
+        diff = td.tree_diff(old.tree, new.tree)
+        diff_entry = self._diff_entry_named(diff, 'subdir')
+        self.assertEqual(diff_entry.kind, tree_diff.DiffEntry.MODIFIED)
+        self.assertTrue(diff_entry.expandable)
+        self.assertEqual(diff_entry.children, [])
+        children = td.children(diff_entry)
+        self.assertTrue(self._diff_contains(children,tree_diff.DiffEntry.MODIFIED,'lorem1.txt'))
+        self.assertEqual(self._diff_entry_named(children, 'lorem1.txt').name, os.path.join('subdir','lorem1.txt'))
+        # The same level is served from the cache
+        self.assertIs(td.children(diff_entry), children)
+        commit_diff = list(td.commitdiff(diff_entry))
+        self.assertEqual(len(commit_diff),1)
+        self.assertEqual(commit_diff[0]['name'], os.path.join('subdir','lorem1.txt'))
+
+    def test_budget(self):
+        """Add two files and test that those over the diff budget are collapsed"""
+        prev_sha = self._get_last_commit()
+        with open('lorem1.txt','w') as f:
+            f.write(lorem1)
+        with open('lorem2.txt','w') as f:
+            f.write(lorem2)
+        subprocess.call(['git','add','lorem1.txt','lorem2.txt'])
+        subprocess.call(['git','commit','-m', 'lorem1 and lorem2'])
+        commit_sha = self._get_last_commit()
+        repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        td = tree_diff.TreeDiffer(repo)
+        diff = td.tree_diff(repo[unicode(prev_sha)].tree, repo[unicode(commit_sha)].tree)
+        entries = [self._diff_entry_named(diff, 'lorem1.txt'), self._diff_entry_named(diff, 'lorem2.txt')]
+        def commit_diff(budget):
+            return [result for entry in entries for result in td.commitdiff(entry, budget)]
+        # lorem2.txt has more lines than any one file may show
+        (shown, collapsed) = commit_diff(tree_diff.DiffBudget(file_max_lines=10))
+        self.assertFalse(shown.get('collapsed'))
+        self._content_equal(shown['content'],lorem1,tree_diff.DiffEntry.CREATED)
+        self.assertEqual(collapsed['collapsed'], 'file')
+        self.assertEqual(collapsed['sha'], entries[1].sha)
+        self.assertEqual(collapsed['content'], [])
+        # Only one file may be shown for the whole commit
+        budget = tree_diff.DiffBudget(max_files=1)
+        (shown, collapsed) = commit_diff(budget)
+        self.assertFalse(shown.get('collapsed'))
+        self.assertEqual(collapsed['collapsed'], 'commit')
+        self.assertEqual((budget.files, budget.lines, budget.bytes), (1, len(lorem1.splitlines()), len(lorem1)))
+        # Unchanged files aren't shown at all, whatever's left of the budget
+        self.assertEqual(list(td.commitdiff(self._diff_entry_named(diff, 'emptyfile'), budget)), [])
+        # Files over the byte limit are collapsed from their size, without reading them
+        read = []
+        class Blob(object):
+            def __init__(self, blob):
+                (self.blob, self.size) = (blob, blob.size)
+            def read_raw(self):
+                read.append(self.blob.hex)
+                return self.blob.read_raw()
+        class Repo(object):
+            def __getitem__(self, sha):
+                return Blob(repo[sha])
+        td.repo = Repo()
+        (shown, collapsed) = commit_diff(tree_diff.DiffBudget(file_max_bytes=len(lorem1)))
+        self.assertFalse(shown.get('collapsed'))
+        self.assertEqual(collapsed['collapsed'], 'file')
+        self.assertEqual(read, [entries[0].sha])
+
+    @unittest.skipUnless(tree_diff.NATIVE_DIFF, 'pygit2 is too old to diff trees in libgit2')
+    def test_native_renames(self):
+        """Rename a file and move a directory, and test that the native diff shows them as modified"""
+        os.mkdir('olddir')
+        with open(os.path.join('olddir','lorem1.txt'),'w') as f:
+            f.write(lorem1)
+        with open('lorem2.txt','w') as f:
+            f.write(lorem2)
+        subprocess.call(['git','add','olddir','lorem2.txt'])
+        subprocess.call(['git','commit','-m', 'lorem1 and lorem2'])
+        prev_sha = self._get_last_commit()
+        subprocess.call(['git','mv','olddir','newdir'])
+        subprocess.call(['git','mv','lorem2.txt','renamed.txt'])
+        subprocess.call(['git','commit','-m', 'renames'])
+        commit_sha = self._get_last_commit()
+        repo = pygit2.Repository(os.path.join(self.repo_path,'.git'))
+        old = repo[unicode(prev_sha)]
+        new = repo[unicode(commit_sha)]
+        # Without rename detection, it's the same as the Python diff
+        td = tree_diff.NativeTreeDiffer(repo)
+        diff = td.tree_diff(old.tree, new.tree)
+        self.assertTrue(self._diff_contains(diff,tree_diff.DiffEntry.DELETED,'olddir'))
+        self.assertTrue(self._diff_contains(diff,tree_diff.DiffEntry.CREATED,'renamed.txt'))
+        td = tree_diff.NativeTreeDiffer(repo, rename_threshold=50)
+        diff = td.tree_diff(old.tree, new.tree)
+        self.assertFalse(self._diff_contains(diff,tree_diff.DiffEntry.DELETED,'olddir'))
+        self.assertFalse(self._diff_contains(diff,tree_diff.DiffEntry.DELETED,'lorem2.txt'))
+        renamed = self._diff_entry_named(diff, 'renamed.txt')
+        self.assertEqual(renamed.kind, tree_diff.DiffEntry.MODIFIED)
+        self.assertEqual(renamed.old_name, 'lorem2.txt')
+        moved = self._diff_entry_named(diff, 'newdir')
+        self.assertEqual(moved.kind, tree_diff.DiffEntry.MODIFIED)
+        self.assertEqual(moved.old_name, 'olddir')
+        children = td.children(moved)
+        self.assertTrue(self._diff_contains(children,tree_diff.DiffEntry.UNMODIFIED,'lorem1.txt'))
+        self.assertEqual(len(children), 1)
+
+class HighlightBatchTest(unittest.TestCase):
+    OLD = 'def old():\n    """A docstring\n    over several\n    lines"""\n    return 1\n\n\n'
+    NEW = 'def new():\n    """A docstring\n    over several\n    lines"""\n    return 2\n\nx = 1\n'
+
+    def setUp(self):
+        self.batch_lines = tree_diff.HIGHLIGHT_BATCH_LINES
+        # Batches end in the middle of the docstring's token
+        tree_diff.HIGHLIGHT_BATCH_LINES = 2
+
+    def tearDown(self):
+        tree_diff.HIGHLIGHT_BATCH_LINES = self.batch_lines
+
+    def test_highlight_lines(self):
+        formatter = HtmlFormatter(nowrap=True)
+        for text in (self.OLD, self.NEW * 3):
+            whole = highlight(text, PythonLexer(stripnl=False), formatter).splitlines()
+            self.assertEqual(list(tree_diff.highlight_lines(text, PythonLexer(stripnl=False), formatter)), whole)
+        # Trimmed blank lines are made up
+        lines = list(tree_diff.highlight_lines(self.OLD, PythonLexer(stripnl=False), formatter, 9))
+        self.assertEqual(lines[-2:], ['', ''])
+
+    def test_batched_diff(self):
+        cache = highlight_cache.HighlightCache(1024 * 1024)
+        td = tree_diff.TreeDiffer(None, highlight_cache=cache)
+        whole = list(td.compare_data(self.OLD.encode('utf-8'), self.NEW.encode('utf-8'), 'a.py', 'a' * 40, 'b' * 40))
+        cache = highlight_cache.HighlightCache(1024 * 1024)
+        td = tree_diff.TreeDiffer(None, highlight_cache=cache)
+        batched = list(td.compare_data(self.OLD.encode('utf-8'), self.NEW.encode('utf-8'), 'a.py', 'a' * 40, 'b' * 40, 10))
+        self.assertEqual(batched, whole)
+        # Files over the limit aren't cached
+        self.assertEqual(cache.get(('b' * 40, 'Python')), None)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,18 +1,83 @@
 # -*- coding: utf-8
 from __future__ import unicode_literals
-from pygments import highlight
-from pygments.lexers import guess_lexer, guess_lexer_for_filename
+from pygments import highlight, format as format_tokens
 from pygments.util import ClassNotFound
 from pygments.formatters import HtmlFormatter
+from collections import namedtuple
+from json.encoder import encode_basestring_ascii
 import pygit2
-import difflib
 import itertools
 import os
 from cgi import escape
 from flask import json, render_template
+import diff_engines
 import ggutils
+import lexer_resolver
 
 DIR_SEP = os.sep
+# Number of levels of tree diffs kept in memory. Neighbouring commits share most of their
+# directories, so their diffs are usually found here.
+TREE_CACHE_SIZE = 1024
+# Whether this version of pygit2 can diff trees in libgit2, for NativeTreeDiffer
+NATIVE_DIFF = hasattr(pygit2.Tree, 'diff_to_tree') and hasattr(pygit2, 'DiffDelta')
+# The bits of a tree entry's file mode giving its type, and the types which aren't blobs
+MODE_TYPE_MASK = 0o170000
+TREE_MODE = 0o040000
+SUBMODULE_MODE = 0o160000
+# Lines highlighted at a time when a large file is highlighted as it's sent
+HIGHLIGHT_BATCH_LINES = 1000
+
+def highlight_lines(text, lexer, formatter, line_count=None):
+    """Yields the lines of text highlighted as HTML, highlighting HIGHLIGHT_BATCH_LINES lines at a
+    time, so that a large file can be sent as it's highlighted. The text is lexed in one pass, so
+    tokens spanning several lines come out as highlight() would give them. If line_count is given,
+    blank lines trimmed from the end are yielded as ''."""
+    tokens = []
+    newlines = 0
+    yielded = 0
+    for token in lexer.get_tokens(text):
+        tokens.append(token)
+        newlines += token[1].count('\n')
+        if newlines >= HIGHLIGHT_BATCH_LINES and token[1].endswith('\n'):
+            for line in format_tokens(tokens, formatter).splitlines():
+                yield line
+                yielded += 1
+            tokens = []
+            newlines = 0
+    for line in format_tokens(tokens, formatter).splitlines():
+        yield line
+        yielded += 1
+    for _ in range(max((line_count or 0) - yielded, 0)):
+        yield ''
+
+class _ForwardLines(object):
+    """Lines from an iterator, read only as far as the line asked for. Lines must be asked for in
+    order, as each is only kept until a later one is asked for."""
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._index = -1
+        self._line = ''
+
+    def __getitem__(self, index):
+        if index < self._index:
+            raise IndexError('Line {0} has already been passed'.format(index))
+        while self._index < index:
+            self._line = next(self._lines, '')
+            self._index += 1
+        return self._line
+
+def entry_type(git_entry):
+    """Returns the type of the object a tree entry refers to, or 'submodule' for a reference to a
+    commit in another repository. It's worked out from the entry's file mode, so the object itself
+    doesn't have to be loaded."""
+    mode = getattr(git_entry, 'filemode', None)
+    if mode is None:
+        mode = git_entry.attributes
+    if mode & MODE_TYPE_MASK == TREE_MODE:
+        return pygit2.GIT_OBJ_TREE
+    elif mode & MODE_TYPE_MASK == SUBMODULE_MODE:
+        return 'submodule'
+    return pygit2.GIT_OBJ_BLOB
 
 class DiffEntry(object):
     UNMODIFIED = 'unmodified'
@@ -41,14 +106,7 @@ class DiffEntry(object):
         self.basename = git_entry.name
         self.sha = git_entry.hex
         self.kind = kind
-        try:
-            git_obj = git_entry.to_object()
-            self.type = git_obj.type
-        #        for i in range(0, len(git_obj)):
-        #            self.children.append(DiffEntry(kind, git_obj[i], parent_name=self.name))
-        except KeyError:
-            #Probably a reference to other project
-            self.type = 'submodule'
+        self.type = entry_type(git_entry)
 
     def __getitem__(self, key):
         if isinstance(key, int):
@@ -60,8 +118,10 @@ class DiffEntry(object):
         return "<tree_diff.DiffEntry: {0} {1} sha:{2}>".format(self.basename, self.kind, self.sha)
 
 class Modified(DiffEntry):
-    def __init__(self, old_entry, new_entry, children=[], parent_name=None):
+    def __init__(self, old_entry, new_entry, children=[], parent_name=None, expandable=False):
         self.children = children
+        # A modified subtree whose changes are only found when it's expanded
+        self.expandable = expandable
         if parent_name:
             self.name = DIR_SEP.join([parent_name,new_entry.name])
             self.old_name = DIR_SEP.join([parent_name,old_entry.name])
@@ -73,12 +133,7 @@ class Modified(DiffEntry):
         self.sha = new_entry.hex
         self.old_sha = old_entry.hex
         self.kind = DiffEntry.MODIFIED
-        try:
-            git_obj = new_entry.to_object()
-            self.type = git_obj.type
-        except KeyError:
-            #Probably a reference to other project
-            self.type = 'submodule'
+        self.type = entry_type(new_entry)
 
     def __str__(self):
         return "<tree_diff.DiffEntry: {0} {1} sha:{2} old_sha:{3}>".format(self.basename, self.kind, self.sha, self.old_sha)
@@ -95,6 +150,46 @@ def _all_deleted(lines):
         yield (DiffEntry.DELETED, line_number, None, escape(line.rstrip()))
         line_number = line_number + 1
 
+def _group_lines(groups):
+    """Returns the number of lines shown for groups of opcodes."""
+    lines = 0
+    for group in groups:
+        for (tag, i1, i2, j1, j2) in group:
+            lines += i2 - i1 if tag == 'equal' else (i2 - i1) + (j2 - j1)
+    return lines
+
+class DiffBudget(object):
+    """Limits on how much of a commit's diff is shown at once: the number of files, and the lines
+    and bytes of content in all of them, and the lines and bytes of content in any one file. None
+    means no limit. Files which are over a limit are left to be loaded separately."""
+    def __init__(self, max_files=None, max_lines=None, max_bytes=None, file_max_lines=None, file_max_bytes=None):
+        self.max_files = max_files
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.file_max_lines = file_max_lines
+        self.file_max_bytes = file_max_bytes
+        self.files = 0
+        self.lines = 0
+        self.bytes = 0
+
+    def check(self, size, lines=0):
+        """Returns None if the diff of a file with the given bytes of content and lines shown fits
+        in what's left, otherwise 'file' if the file is too large by itself or 'commit' if there
+        isn't enough left."""
+        if (self.file_max_bytes is not None and size > self.file_max_bytes) or \
+                (self.file_max_lines is not None and lines > self.file_max_lines):
+            return 'file'
+        if (self.max_files is not None and self.files >= self.max_files) or \
+                (self.max_lines is not None and self.lines + lines > self.max_lines) or \
+                (self.max_bytes is not None and self.bytes + size > self.max_bytes):
+            return 'commit'
+        return None
+
+    def spend(self, size, lines):
+        self.files += 1
+        self.lines += lines
+        self.bytes += size
+
 class DiffEntryEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, DiffEntry):
@@ -123,7 +218,7 @@ class DiffEntryEncoder(json.JSONEncoder):
                 if o.children:
                     json_dict['children'] = o.children
                 typeclass = 'directory'
-                if cls == 'modified':
+                if cls == 'modified' and not getattr(o, 'expandable', False):
                     json_dict['state'] = 'open'
                 else:
                     json_dict['state'] = 'closed'
@@ -143,36 +238,134 @@ class DiffEntryEncoder(json.JSONEncoder):
         else:
             return json.JSONEncoder.default(self, o)
 
+def _typeclass(entry):
+    if entry.type == pygit2.GIT_OBJ_TREE:
+        return 'directory'
+    elif entry.type == pygit2.GIT_OBJ_BLOB:
+        return 'file'
+    return 'reference'
+
+# The JSON between an entry's class and its full name, for each kind and type of entry
+_CLASS_JSON = dict(((kind, typeclass), '{0} {1}"}}{2}}},"metadata":{{"full_name":'.format(kind, typeclass,
+    ',"icon":"/static/img/blankpage.png"' if typeclass == 'file' else ''))
+    for kind in (DiffEntry.UNMODIFIED, DiffEntry.CREATED, DiffEntry.DELETED, DiffEntry.MODIFIED)
+    for typeclass in ('directory', 'file', 'reference'))
+# Characters escaped so that the JSON can go inside a <script> element
+_HTML_ESCAPES = (('<', '\\u003c'), ('>', '\\u003e'), ('&', '\\u0026'), ("'", '\\u0027'))
+
+def _write_entry_json(entry, parts):
+    typeclass = _typeclass(entry)
+    parts.extend(('{"data":{"title":', encode_basestring_ascii(entry.basename), ',"attr":{"id":"tree_', entry.sha,
+        '","href":"#', entry.sha, '","class":"', _CLASS_JSON[(entry.kind, typeclass)], encode_basestring_ascii(entry.name)))
+    if entry.kind == DiffEntry.MODIFIED:
+        parts.extend((',"old_name":', encode_basestring_ascii(entry.old_name), ',"old_sha":"', entry.old_sha, '"'))
+    parts.append('}')
+    if typeclass == 'directory':
+        if entry.children:
+            parts.append(',"children":')
+            _write_list_json(entry.children, parts)
+        if entry.kind == DiffEntry.MODIFIED and not getattr(entry, 'expandable', False):
+            parts.append(',"state":"open"}')
+        else:
+            parts.append(',"state":"closed"}')
+    else:
+        parts.append('}')
+
+def _write_list_json(entries, parts):
+    parts.append('[')
+    for (index, entry) in enumerate(entries):
+        if index:
+            parts.append(',')
+        _write_entry_json(entry, parts)
+    parts.append(']')
+
+def tree_json(entries, html_safe=False):
+    """Returns the JSON for a list of diff entries in the format jsTree takes, as DiffEntryEncoder
+    writes it but without the content of any diffed blobs. The JSON is written straight from
+    fragments which are the same for every entry, without building a dict for each. If html_safe
+    is set, it's escaped to go inside a <script> element."""
+    parts = []
+    _write_list_json(entries, parts)
+    result = ''.join(parts)
+    if html_safe:
+        for (char, escaped) in _HTML_ESCAPES:
+            result = result.replace(char, escaped)
+    return result
+
+class LevelCache(object):
+    """The levels of tree diffs kept in memory, and the changes libgit2 found in modified subtrees
+    for NativeTreeDiffer, each holding at most size items."""
+    def __init__(self, size=TREE_CACHE_SIZE):
+        self.levels = ggutils.LRUCache(size)
+        self.deltas = ggutils.LRUCache(size)
+
 class TreeDiffer(object):
-    def __init__(self, repo, compare_content=False):
+    def __init__(self, repo, compare_content=False, highlight_cache=None, diff_engine='difflib', level_cache=None):
         self.repo = repo
+        self.highlight_cache = highlight_cache
+        self.level_cache = level_cache if level_cache is not None else _level_cache
         self.content = compare_content
         self.context = 3
         self.ignore_whitespace = True
-        self.sm = difflib.SequenceMatcher(lambda line: len(line.strip()) == 0)
+        self.diff_engine = diff_engine
+        self.sm = diff_engines.matcher(diff_engine, lambda line: len(line.strip()) == 0)
         self.formatter = HtmlFormatter(nowrap=True)
 
-    def _markup_diff(self, old, new, opcodes, name=None):
+    def _guess_lexer(self, text, name=None):
+        return lexer_resolver.get_lexer(name, text, stripnl=False, encoding='chardet')
+
+    def _highlight_lines(self, lines, joined, lexer, sha=None, batched=False):
+        """Returns the lines of a blob highlighted with a lexer, from the highlight cache if the
+        blob's SHA is known. If batched is set, lines which aren't cached are highlighted a batch at
+        a time as they're read, and must be read in order; they aren't cached."""
+        cache = self.highlight_cache if sha else None
+        if cache is not None:
+            key = (sha, lexer.name)
+            split = cache.get(key)
+            if split is not None:
+                return split
+        if batched:
+            return _ForwardLines(highlight_lines(joined, lexer, self.formatter, len(lines)))
+        split = highlight(joined, lexer, self.formatter).splitlines()
+        # highlight() may trim blank lines, so replace them
+        if len(split) < len(lines):
+            split = list(itertools.chain(split, itertools.repeat('', len(lines) - len(split))))
+        if cache is not None:
+            cache.put(key, split)
+        return split
+
+    def _highlight(self, old, new, name=None, old_sha=None, new_sha=None, batched=False):
+        """Returns the old and new lines, highlighted as HTML if a lexer can be found for them."""
         # Join the lines to make a full document
         old_joined = '\n'.join(old)
         new_joined = '\n'.join(new)
         # Pick the new content to guess the lexer, if necessary
         try:
-            if name:
-                lexer = guess_lexer_for_filename(name, new_joined, stripnl=False, encoding='chardet')
-            else:
-                lexer = guess_lexer(new_joined, stripnl=False, encoding='chardet')
+            lexer = self._guess_lexer(new_joined, name)
         except ClassNotFound:
-            old_split = map(escape, old)
-            new_split = map(escape, new)
-        else:
-            old_split = highlight(old_joined, lexer, self.formatter).splitlines()
-            new_split = highlight(new_joined, lexer, self.formatter).splitlines()
-            # highlight() may trim blank lines, so replace them
-            if len(old_split) < len(old):
-                old_split = list(itertools.chain(old_split, itertools.repeat('', len(old) - len(old_split))))
-            if len(new_split) < len(new):
-                new_split = list(itertools.chain(new_split, itertools.repeat('', len(new) - len(new_split))))
+            return (map(escape, old), map(escape, new))
+        return (self._highlight_lines(old, old_joined, lexer, old_sha, batched),
+                self._highlight_lines(new, new_joined, lexer, new_sha, batched))
+
+    def highlight_blob(self, sha, name=None, max_size=None):
+        """Highlights a blob as the new side of a diff would be, so that it's in the highlight cache.
+        Returns the highlighted lines, or None if the blob is binary, too large or has no lexer."""
+        blob = self.repo[sha]
+        if max_size is not None and blob.size > max_size:
+            return None
+        data = blob.read_raw()
+        if b'\0' in data:
+            return None
+        lines = ggutils.force_unicode(data, sha).splitlines()
+        joined = '\n'.join(lines)
+        try:
+            lexer = self._guess_lexer(joined, name)
+        except ClassNotFound:
+            return None
+        return self._highlight_lines(lines, joined, lexer, sha)
+
+    def _markup_opcodes(self, old_split, new_split, opcodes):
+        """Yields the diff lines described by the opcodes, from the highlighted old and new lines."""
         for tag, i1, i2, j1, j2 in opcodes:
             if tag == 'equal':
                 for i in range(i2-i1):
@@ -196,99 +389,201 @@ class TreeDiffer(object):
         else:
             self.sm.set_seqs(old,new)
 
-    def _full_diff(self, old, new, name=None):
+    def _full_diff(self, old, new, name=None, old_sha=None, new_sha=None, batched=False):
         self._set_sm_seqs(old,new)
         changes = self.sm.get_opcodes()
-        for change in self._markup_diff(old, new, changes, name):
+        (old_split, new_split) = self._highlight(old, new, name, old_sha, new_sha, batched)
+        for change in self._markup_opcodes(old_split, new_split, changes):
             yield change
 
-    def _context_diff(self, old, new, name=None):
+    def _context_groups(self, old, new):
         self._set_sm_seqs(old,new)
-        groups = self.sm.get_grouped_opcodes(self.context)
-        separator = False
+        return list(self.sm.get_grouped_opcodes(self.context))
+
+    def _markup_groups(self, old, new, groups, name=None, old_sha=None, new_sha=None):
+        # Both files are highlighted once, and the lines shared by all the groups
+        highlighted = None
         for group in groups:
-            if separator:
+            if highlighted:
                 yield (DiffEntry.UNMODIFIED, None, None, '<hr />')
-            for change in self._markup_diff(old, new, group, name):
+            else:
+                highlighted = self._highlight(old, new, name, old_sha, new_sha)
+            for change in self._markup_opcodes(highlighted[0], highlighted[1], group):
                 yield change
-            separator = True
 
-    def commitdiff(self, entry):
-        if entry.children:
-            for child in entry.children:
-                for result in self.commitdiff(child):
-                    yield result
-        elif entry.type == pygit2.GIT_OBJ_BLOB:
-            if entry.kind == DiffEntry.CREATED:
-                entry_content = self.repo[entry.sha].read_raw()
-                unicode_content = ggutils.force_unicode(entry_content)
-                if b'\0' in entry_content or unicode_content is None:
-                    #Binary file
-                    if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.CREATED}
-                    else:
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.CREATED,0,0,'(Binary file, created)')]}
+    def _context_diff(self, old, new, name=None, old_sha=None, new_sha=None):
+        return self._markup_groups(old, new, self._context_groups(old, new), name, old_sha, new_sha)
+
+    def children(self, entry):
+        """Returns the entries inside a diff entry, diffing the next level down of a modified subtree."""
+        if getattr(entry, 'expandable', False):
+            return self.tree_diff(self.repo[entry.old_sha], self.repo[entry.sha], entry.name)
+        return entry.children
+
+    def _collapsed(self, entry, budget, size, lines=0):
+        """Returns a placeholder for a file whose diff doesn't fit in what's left of the budget, or
+        None if it fits."""
+        if budget is None:
+            return None
+        reason = budget.check(size, lines)
+        if reason is None:
+            return None
+        collapsed = {'name': entry.name, 'kind': entry.kind, 'sha': entry.sha, 'binary': False, 'collapsed': reason, 'content': []}
+        if entry.kind == DiffEntry.MODIFIED:
+            collapsed['old_sha'] = entry.old_sha
+        return collapsed
+
+    def changed_blobs(self, entry):
+        """Yields the entries of the files changed in a diff entry, without reading the files."""
+        children = self.children(entry)
+        if children:
+            for child in children:
+                for blob in self.changed_blobs(child):
+                    yield blob
+        elif entry.type == pygit2.GIT_OBJ_BLOB and entry.kind != DiffEntry.UNMODIFIED:
+            yield entry
+
+    def commitdiff(self, entry, budget=None):
+        """Yields the diffs of the files changed in a diff entry. If a DiffBudget is given, files
+        which don't fit in it are yielded as collapsed placeholders without their content."""
+        for blob in self.changed_blobs(entry):
+            for result in self._file_diff(blob, budget):
+                yield result
+
+    def _file_diff(self, entry, budget):
+        # Once the budget's used up, the blobs aren't even read
+        collapsed = self._collapsed(entry, budget, 0)
+        if collapsed:
+            yield collapsed
+            return
+        if entry.kind == DiffEntry.CREATED:
+            blob = self.repo[entry.sha]
+            # Files too large to show aren't read at all, and binary files aren't decoded
+            collapsed = self._collapsed(entry, budget, blob.size)
+            if collapsed:
+                yield collapsed
+                return
+            entry_content = blob.read_raw()
+            if b'\0' in entry_content:
+                unicode_content = None
+            else:
+                unicode_content = ggutils.force_unicode(entry_content, entry.sha)
+            if unicode_content is None:
+                #Binary file
+                if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.CREATED}
+                else:
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.CREATED,0,0,'(Binary file, created)')]}
+            else:
+                lines = unicode_content.splitlines()
+                collapsed = self._collapsed(entry, budget, len(entry_content), len(lines))
+                if collapsed:
+                    yield collapsed
+                else:
+                    if budget is not None:
+                        budget.spend(len(entry_content), len(lines))
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': _all_inserted(lines)}
+        elif entry.kind == DiffEntry.DELETED:
+            blob = self.repo[entry.sha]
+            # Files too large to show aren't read at all, and binary files aren't decoded
+            collapsed = self._collapsed(entry, budget, blob.size)
+            if collapsed:
+                yield collapsed
+                return
+            entry_content = blob.read_raw()
+            if b'\0' in entry_content:
+                unicode_content = None
+            else:
+                unicode_content = ggutils.force_unicode(entry_content, entry.sha)
+            if unicode_content is None:
+                #Binary file
+                if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.CREATED}
+                else:
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.DELETED,0,0,'(Binary file, deleted)')]}
+            else:
+                lines = unicode_content.splitlines()
+                collapsed = self._collapsed(entry, budget, len(entry_content), len(lines))
+                if collapsed:
+                    yield collapsed
                 else:
-                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': _all_inserted(unicode_content.splitlines())}
-            elif entry.kind == DiffEntry.DELETED:
-                entry_content = self.repo[entry.sha].read_raw()
-                unicode_content = ggutils.force_unicode(entry_content)
-                if b'\0' in entry_content or unicode_content is None:
-                    #Binary file
-                    if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.CREATED}
-                    else:
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.DELETED,0,0,'(Binary file, deleted)')]}
+                    if budget is not None:
+                        budget.spend(len(entry_content), len(lines))
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': _all_deleted(lines)}
+        elif entry.kind == DiffEntry.MODIFIED:
+            (new_blob, old_blob) = (self.repo[entry.sha], self.repo[entry.old_sha])
+            size = new_blob.size + old_blob.size
+            # Files too large to show aren't read at all, and binary files aren't decoded
+            collapsed = self._collapsed(entry, budget, size)
+            if collapsed:
+                yield collapsed
+                return
+            new_content = new_blob.read_raw()
+            old_content = old_blob.read_raw()
+            if b'\0' in new_content or b'\0' in old_content:
+                new_unicode = old_unicode = None
+            else:
+                new_unicode = ggutils.force_unicode(new_content, entry.sha)
+                old_unicode = ggutils.force_unicode(old_content, entry.old_sha)
+            if old_unicode is None or new_unicode is None:
+                #Binary file
+                if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.MODIFIED, 'old_sha': entry.old_sha }
                 else:
-                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': _all_deleted(unicode_content.splitlines())}
-            elif entry.kind == DiffEntry.MODIFIED:
-                new_content = self.repo[entry.sha].read_raw()
-                old_content = self.repo[entry.old_sha].read_raw()
-                new_unicode = ggutils.force_unicode(new_content).splitlines()
-                old_unicode = ggutils.force_unicode(old_content).splitlines()
-                if b'\0' in new_content or b'\0' in old_content or old_unicode is None or new_unicode is None:
-                    #Binary file
-                    if entry.name.endswith(('.png','.jpg','.jpeg','.gif')):
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': 'image', 'content': DiffEntry.MODIFIED, 'old_sha': entry.old_sha }
-                    else:
-                        yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.MODIFIED,0,0,'(Binary file, modified)')]}
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': True, 'content': [(DiffEntry.MODIFIED,0,0,'(Binary file, modified)')]}
+            else:
+                old_lines = old_unicode.splitlines()
+                new_lines = new_unicode.splitlines()
+                groups = self._context_groups(old_lines, new_lines)
+                lines = _group_lines(groups)
+                collapsed = self._collapsed(entry, budget, size, lines)
+                if collapsed:
+                    yield collapsed
                 else:
-                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': self._context_diff(old_unicode,new_unicode,entry.name)}
+                    if budget is not None:
+                        budget.spend(size, lines)
+                    yield {'name': entry.name, 'kind':entry.kind, 'sha': entry.sha, 'binary': False, 'content': self._markup_groups(old_lines,new_lines,groups,entry.name,entry.old_sha,entry.sha)}
 
     def diff(self, old, new, parent_name=None):
-        try:
-            old_obj = old.to_object()
-            old_is_bad = False
-        except KeyError:
-            old_is_bad = True
-        try:
-            new_obj = new.to_object()
-            new_is_bad = False
-        except KeyError:
-            new_is_bad = True
+        # Submodules refer to objects which aren't in this repository
+        old_type = entry_type(old)
+        new_type = entry_type(new)
+        old_is_bad = old_type == 'submodule'
+        new_is_bad = new_type == 'submodule'
 
         if old_is_bad and new_is_bad:
             return Modified(old, new, [DiffEntry.unmodified(new, parent_name)])
         elif old_is_bad or new_is_bad:
             return Modified(old, new, [DiffEntry.deleted(old, parent_name), DiffEntry.created(new, parent_name)])
 
-        if old_obj.type != new_obj.type:
+        if old_type != new_type:
             return Modified(old, new, [DiffEntry.deleted(old, parent_name), DiffEntry.created(new, parent_name)])
 
-        if parent_name:
-            joined_name = DIR_SEP.join([parent_name, new.name])
-        else:
-            joined_name = new.name
-
-        if old_obj.type == pygit2.GIT_OBJ_TREE:
-            return Modified(old, new, self.tree_diff(old_obj,new_obj, joined_name), parent_name)
+        if old_type == pygit2.GIT_OBJ_TREE:
+            # The subtree is diffed when it's expanded, see children()
+            return Modified(old, new, [], parent_name, expandable=True)
         else:
             if self.content:
                 return self.blob_diff(old,new)
             else:
                 return Modified(old, new, [], parent_name)
 
+    def _level_key(self, old, new, parent_name):
+        # Blob contents are only diffed, with the diff engine, if compare_content is set
+        return (old.hex, new.hex, parent_name, self.content and self.diff_engine)
+
     def tree_diff(self, old, new, parent_name=None):
+        """Returns the entries of one level of the diff between two trees. Modified subtrees are
+        expandable entries without children. Levels are cached, so the list returned mustn't be
+        changed."""
+        key = self._level_key(old, new, parent_name)
+        entries = self.level_cache.levels.get(key)
+        if entries is None:
+            entries = self._tree_level(old, new, parent_name)
+            self.level_cache.levels[key] = entries
+        return entries
+
+    def _tree_level(self, old, new, parent_name=None):
         entries = []
         for i in range(0, len(new)):
             #does entry exist in old tree?
@@ -316,10 +611,184 @@ class TreeDiffer(object):
         if b'\0' in old_data:
             result.content = None
             return result
-        result.content = list(self.compare_data(old_data, new_obj.read_raw()))
+        result.content = list(self.compare_data(old_data, new_obj.read_raw(), None, old_obj.hex, new_obj.hex))
         return result
 
-    def compare_data(self, old_data, new_data, name=None):
-        old_data = ggutils.force_unicode(old_data).splitlines()
-        new_data = ggutils.force_unicode(new_data).splitlines()
-        return self._full_diff(old_data, new_data, name)
+    def compare_data(self, old_data, new_data, name=None, old_sha=None, new_sha=None, batch_over=None):
+        """Yields the full diff of two versions of a file. If either is over batch_over bytes, the
+        files are highlighted a batch at a time as the diff is read, and not cached."""
+        batched = batch_over is not None and max(len(old_data), len(new_data)) > batch_over
+        old_data = ggutils.force_unicode(old_data, old_sha).splitlines()
+        new_data = ggutils.force_unicode(new_data, new_sha).splitlines()
+        return self._full_diff(old_data, new_data, name, old_sha, new_sha, batched)
+
+# A file changed between two trees, as found by libgit2. Names are full names like DiffEntry's.
+Delta = namedtuple('Delta', 'status old_name new_name old_sha new_sha old_mode')
+
+class _OldSide(namedtuple('_OldSide', 'name hex filemode')):
+    """The old side of a file renamed from elsewhere, standing in for its old tree entry."""
+
+class NativeTreeDiffer(TreeDiffer):
+    """A TreeDiffer which finds the changes between trees with libgit2's tree diff, and can detect
+    renamed and copied files. A similarity threshold (a percentage) turns each detection on.
+
+    libgit2 diffs the whole of a pair of trees at once, so the changes found for the trees passed to
+    tree_diff are kept for each modified subtree, and used when it's expanded. That way files renamed
+    from another directory are still found. Renamed files are Modified entries whose old_name is
+    their full old name, and a directory whose files were all moved from another one is shown as a
+    modified directory rather than a created one."""
+    def __init__(self, repo, compare_content=False, rename_threshold=None, copy_threshold=None, highlight_cache=None, diff_engine='difflib',
+            level_cache=None):
+        super(NativeTreeDiffer, self).__init__(repo, compare_content, highlight_cache, diff_engine, level_cache)
+        self.rename_threshold = rename_threshold
+        self.copy_threshold = copy_threshold
+
+    def _level_key(self, old, new, parent_name):
+        return ('native', self.rename_threshold, self.copy_threshold) + super(NativeTreeDiffer, self)._level_key(old, new, parent_name)
+
+    def _full_name(self, parent_name, path):
+        names = path.split('/')
+        if parent_name:
+            names.insert(0, parent_name)
+        return DIR_SEP.join(names)
+
+    def _native_deltas(self, old, new, parent_name):
+        diff = old.diff_to_tree(new)
+        if self.rename_threshold is not None or self.copy_threshold is not None:
+            flags = 0
+            if self.rename_threshold is not None:
+                flags |= pygit2.GIT_DIFF_FIND_RENAMES
+            if self.copy_threshold is not None:
+                flags |= pygit2.GIT_DIFF_FIND_COPIES
+            diff.find_similar(flags, rename_threshold=self.rename_threshold or 50, copy_threshold=self.copy_threshold or 50)
+        return [Delta(delta.status, self._full_name(parent_name, delta.old_file.path), self._full_name(parent_name, delta.new_file.path),
+                      delta.old_file.id.hex, delta.new_file.id.hex, delta.old_file.mode) for delta in diff.deltas]
+
+    def _find_entry(self, root, root_name, name):
+        """Returns the entry with the given full name in a tree with the given SHA and full name."""
+        if root_name:
+            name = name[len(root_name) + len(DIR_SEP):]
+        names = name.split(DIR_SEP)
+        tree = self.repo[root]
+        for name in names[:-1]:
+            tree = self.repo[tree[name].hex]
+        return tree[names[-1]]
+
+    def _has_directory(self, root, root_name, name):
+        """Returns whether the directory of the file with the given full name is in a tree with the
+        given SHA and full name."""
+        directory = name.rsplit(DIR_SEP, 1)[0] if DIR_SEP in name else ''
+        if directory == (root_name or ''):
+            return True
+        try:
+            return entry_type(self._find_entry(root, root_name, directory)) == pygit2.GIT_OBJ_TREE
+        except KeyError:
+            return False
+
+    def _moved_from(self, deltas, name):
+        """Returns the full name of the directory which the directory with the given full name was
+        moved from, if every change inside it is a file renamed from the same place there."""
+        moved_from = None
+        for delta in deltas:
+            if delta.status != pygit2.GIT_DELTA_RENAMED:
+                return None
+            inside = delta.new_name[len(name):]
+            if not delta.old_name.endswith(DIR_SEP + inside) or delta.old_name == delta.new_name:
+                return None
+            old_name = delta.old_name[:-len(DIR_SEP + inside)]
+            if moved_from not in (None, old_name):
+                return None
+            moved_from = old_name
+        return moved_from
+
+    def _tree_level(self, old, new, parent_name=None):
+        changes = self.level_cache.deltas.get(self._level_key(old, new, parent_name))
+        if changes is None:
+            changes = (old.hex, new.hex, parent_name, self._native_deltas(old, new, parent_name))
+        (old_root, new_root, root_name, deltas) = changes
+        prefix = DIR_SEP.join([parent_name, '']) if parent_name else ''
+        # The deltas inside or of each entry on this level, the files on this level renamed or copied
+        # from elsewhere, and the entries on this level which have been moved elsewhere
+        inside = {}
+        renamed_to = {}
+        moved_away = set()
+        def add(delta, full_name, renamed):
+            if not full_name.startswith(prefix):
+                return
+            name = full_name[len(prefix):]
+            if DIR_SEP in name:
+                deltas = inside.setdefault(name.split(DIR_SEP, 1)[0], [])
+                if not deltas or deltas[-1] is not delta:
+                    deltas.append(delta)
+            elif renamed == 'to':
+                renamed_to[name] = delta
+            elif renamed == 'from':
+                moved_away.add(name)
+            else:
+                inside.setdefault(name, []).append(delta)
+        for delta in deltas:
+            if delta.status in (pygit2.GIT_DELTA_RENAMED, pygit2.GIT_DELTA_COPIED):
+                add(delta, delta.new_name, 'to')
+                # A file moved into a new directory isn't shown as renamed, so it's still shown as deleted
+                if delta.status == pygit2.GIT_DELTA_RENAMED and self._has_directory(old_root, root_name, delta.new_name):
+                    add(delta, delta.old_name, 'from')
+                else:
+                    add(delta, delta.old_name, 'copied')
+            elif delta.status == pygit2.GIT_DELTA_DELETED:
+                add(delta, delta.old_name, None)
+            else:
+                add(delta, delta.new_name, None)
+
+        entries = []
+        for entry in new:
+            name = entry.name
+            if name not in inside and name not in renamed_to:
+                # Nothing changed here, so there's no need to look in the old tree
+                entries.append(DiffEntry.unmodified(entry, parent_name))
+            elif name in old:
+                old_entry = old[name]
+                if old_entry.oid == entry.oid:
+                    entries.append(DiffEntry.unmodified(entry, parent_name))
+                    continue
+                diff_entry = self.diff(old_entry, entry, parent_name)
+                if getattr(diff_entry, 'expandable', False):
+                    self.level_cache.deltas[self._level_key(old_entry, entry, diff_entry.name)] = changes[:3] + (inside.get(name, []),)
+                entries.append(diff_entry)
+            elif name in renamed_to:
+                delta = renamed_to[name]
+                diff_entry = Modified(_OldSide(delta.old_name.split(DIR_SEP)[-1], delta.old_sha, delta.old_mode), entry, [], parent_name)
+                diff_entry.old_name = delta.old_name
+                entries.append(diff_entry)
+            else:
+                full_name = prefix + name
+                moved_from = None
+                if entry_type(entry) == pygit2.GIT_OBJ_TREE:
+                    moved_from = self._moved_from(inside[name], DIR_SEP.join([full_name, '']))
+                if moved_from is not None:
+                    try:
+                        self._find_entry(new_root, root_name, moved_from)
+                        # The old directory is still there, so this one was only partly copied from it
+                        moved_from = None
+                    except KeyError:
+                        pass
+                if moved_from is None:
+                    entries.append(DiffEntry.created(entry, parent_name))
+                    continue
+                # A directory moved from elsewhere is diffed against where it came from
+                old_entry = self._find_entry(old_root, root_name, moved_from)
+                diff_entry = Modified(old_entry, entry, [], parent_name, expandable=True)
+                diff_entry.old_name = moved_from
+                self.level_cache.deltas[self._level_key(old_entry, entry, diff_entry.name)] = changes[:3] + (inside[name],)
+                if moved_from.startswith(prefix) and DIR_SEP not in moved_from[len(prefix):]:
+                    moved_away.add(moved_from[len(prefix):])
+                entries.append(diff_entry)
+        for entry in old:
+            if entry.name not in new and entry.name not in moved_away:
+                entries.append(DiffEntry.deleted(entry, parent_name))
+        return entries
+
+# Used by TreeDiffers not given their own. The changes libgit2 found in modified subtrees are kept
+# by the key of the level they'll be shown on.
+_level_cache = LevelCache()
+_tree_cache = _level_cache.levels
+_delta_cache = _level_cache.deltas